@@ -0,0 +1,177 @@
+"""
+Shared asynchronous AI request engine for HerdWatch
+Runs every Azure OpenAI call on one background event loop under a global
+concurrency limit and token-bucket request budget
+"""
+
+import asyncio
+import os
+import threading
+from collections import OrderedDict, deque
+from rate_limit import TokenBucket
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ────────────────────────────────────────────────────────────
+# Configuration
+# ────────────────────────────────────────────────────────────
+
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", 4))  # Requests in flight
+AI_REQUESTS_PER_SECOND = float(os.getenv("AI_REQUESTS_PER_SECOND", 1))  # Sustained rate
+AI_BURST = int(os.getenv("AI_BURST", 4))  # Requests allowed back-to-back
+
+# Lanes served before any other lane when a slot frees up, so an SMS or
+# dashboard question never queues behind a long video
+PRIORITY_LANES = ("chat",)
+
+
+class AIEngine:
+    """Asyncio request engine shared by video analysis and farmer chat
+
+    Requests are grouped into lanes (e.g. "chat" or one lane per video
+    stream). When all concurrency slots are busy, waiting requests are
+    released priority lanes first and then round-robin across lanes, so no
+    single stream can starve the others.
+    """
+
+    def __init__(self, max_concurrency=AI_MAX_CONCURRENCY,
+                 requests_per_second=AI_REQUESTS_PER_SECOND, burst=AI_BURST):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.bucket = TokenBucket(requests_per_second, burst)
+
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        # Scheduler state (only touched on the event loop thread)
+        self._active = 0
+        self._waiting = OrderedDict()  # lane -> deque of asyncio futures
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rate_wait_seconds": 0.0}
+
+    # ── Event loop ───────────────────────────────────────────
+
+    def _ensure_loop(self):
+        """Start the background event loop thread on first use"""
+        with self._start_lock:
+            if self._loop is None or not self._thread.is_alive():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="ai-engine",
+                    daemon=True
+                )
+                self._thread.start()
+        return self._loop
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the engine loop from any thread
+
+        Args:
+            coro: Coroutine (typically one that awaits ainvoke())
+
+        Returns:
+            concurrent.futures.Future with the coroutine result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def invoke(self, model, messages, lane="default", timeout=None):
+        """Blocking ainvoke() for synchronous callers"""
+        return self.submit(self.ainvoke(model, messages, lane=lane)).result(timeout)
+
+    # ── Scheduling ───────────────────────────────────────────
+
+    async def _acquire_slot(self, lane):
+        if self._active < self.max_concurrency and not self._waiting:
+            self._active += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(lane, deque()).append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()  # Slot was handed over just as we were cancelled
+            else:
+                self._discard_waiter(lane, waiter)
+            raise
+
+    def _discard_waiter(self, lane, waiter):
+        waiters = self._waiting.get(lane)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiting[lane]
+
+    def _next_lane(self):
+        for lane in PRIORITY_LANES:
+            if lane in self._waiting:
+                return lane
+        return next(iter(self._waiting), None)
+
+    def _release_slot(self):
+        """Hand the freed slot to the next waiter (priority, then round-robin)"""
+        while True:
+            lane = self._next_lane()
+            if lane is None:
+                self._active -= 1
+                return
+            waiters = self._waiting.pop(lane)
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiting[lane] = waiters  # Re-insert at the back: round-robin
+            if not waiter.done():
+                waiter.set_result(None)  # Slot transfers to the waiter
+                return
+
+    async def ainvoke(self, model, messages, lane="default"):
+        """
+        Call model.ainvoke() within the shared concurrency and rate budget
+
+        Args:
+            model: LangChain chat model
+            messages: List of messages
+            lane: Scheduling lane ("chat", or a video stream/job id)
+
+        Returns:
+            Model response message
+        """
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+
+        await self._acquire_slot(lane)
+        try:
+            waited = await self.bucket.acquire_async()
+            response = await model.ainvoke(messages)
+            with self._stats_lock:
+                self._stats["completed"] += 1
+                self._stats["rate_wait_seconds"] += waited
+            return response
+        except Exception:
+            with self._stats_lock:
+                self._stats["failed"] += 1
+            raise
+        finally:
+            self._release_slot()
+
+    # ── Introspection ────────────────────────────────────────
+
+    def stats(self):
+        """Get engine counters"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["rate_wait_seconds"] = round(stats["rate_wait_seconds"], 2)
+        stats.update({
+            "max_concurrency": self.max_concurrency,
+            "requests_per_second": self.bucket.rate,
+            "in_flight": self._active,
+            "waiting": {lane: len(w) for lane, w in list(self._waiting.items())},
+        })
+        return stats
+
+
+# Global engine shared by video analysis and farmer chat
+ai_engine = AIEngine()
@@ -1,18 +1,30 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 from at import SMS
 from chat_interface import FarmerChatInterface
-from video_processor import video_processor
+from job_manager import job_manager as inline_job_manager, QueuedJobManager, JobLimitError
+from events import event_bus, format_sse, SSE_KEEPALIVE_SECONDS
+from frame_buffer import latest_frame, preview_stream, PREVIEW_BOUNDARY
+from log_reader import AnalysisLogReader
+from sms_worker import ReplyWorker
+from shared_state import EventRelay  # Also registers the sqlite:// rate-limit storage
+from uploads import (upload_store, allowed_file, UploadError, UPLOAD_FOLDER, ALLOWED_EXTENSIONS,
+                     MAX_FILE_SIZE, SPOOL_PREFIX, UPLOAD_CHUNK_SIZE)
 from config import features, is_sms_enabled
-from db import (init_db, save_message, get_all_conversations, 
-                clear_conversations, delete_conversation)
+from db import (init_db, save_messages, update_message_status, record_inbound,
+                get_all_conversations, get_conversation, count_conversations,
+                clear_conversations, delete_conversation,
+                get_analysis_history, get_cow_history, get_latest_cow_status,
+                CONVERSATIONS_PAGE_SIZE, CONVERSATION_MESSAGE_LIMIT)
 from datetime import datetime
 import logging
 import os
 import json
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -30,18 +42,41 @@ ERROR_ANALYSIS = "ANALYSIS_ERROR"
 # Configuration
 # ────────────────────────────────────────────────────────────
 
-UPLOAD_FOLDER = "uploads"
-ALLOWED_EXTENSIONS = {"mp4", "avi", "mov", "mkv"}
-MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
-
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# "inline": video jobs run in this process (development server)
+# "external": jobs are queued for worker.py (required with several web workers)
+VIDEO_WORKER_MODE = os.getenv("VIDEO_WORKER_MODE", "inline").lower()
+# memory:// is per process; use sqlite:// (or redis://...) with several web workers
+RATELIMIT_STORAGE_URI = os.getenv("RATELIMIT_STORAGE_URI", "memory://")
 
 # ────────────────────────────────────────────────────────────
 # Flask and Middleware
 # ────────────────────────────────────────────────────────────
 
+class UploadRequest(Request):
+    """Stream /video/upload file parts straight into the uploads folder
+
+    Werkzeug would otherwise spool each part to a temporary file (or
+    memory) that the view then copies into place.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spooled = []  # Spool files opened for this request, kept or not
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        if self.path == "/video/upload" and filename:
+            stream = upload_store.spool_file()
+            self.spooled.append(stream)
+            return stream
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
 app = Flask(__name__, static_folder="frontend", template_folder="frontend")
+app.request_class = UploadRequest
+# Bodies past this are refused with 413, also chunked ones without a
+# Content-Length (with room for the multipart headers around the file)
+app.config["MAX_CONTENT_LENGTH"] = MAX_FILE_SIZE + 1024 * 1024
 
 # CORS with restricted origins
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:5000").split(",")
@@ -52,7 +87,7 @@ limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    storage_uri=RATELIMIT_STORAGE_URI
 )
 
 # Logging
@@ -77,13 +112,36 @@ sms_sender = SMS()
 # AI chat interface
 ai_farmer = FarmerChatInterface()
 
+# Answers incoming SMS off the webhook request path
+reply_worker = ReplyWorker(ai_farmer.chat_with_farmer, sms_sender)
+
+# Video jobs: in this process, or queued for the video worker process
+job_manager = QueuedJobManager() if VIDEO_WORKER_MODE == "external" else inline_job_manager
+
+# Brings the video worker's events and frames into this process
+event_relay = EventRelay(event_bus)
+
+def start_background_services():
+    """Start per-process background threads (dev server or each WSGI worker)"""
+    reply_worker.start()
+    if VIDEO_WORKER_MODE == "external":
+        event_relay.start()
+
 # File paths
 SHARED_DATA_FILE = "cow_analysis_data.json"
 ANALYSIS_LOG_FILE = "analysis_log.txt"
 
-# Log cache with TTL
-_log_cache = {"entries": [], "mtime": 0, "total": 0, "timestamp": 0}
-LOG_CACHE_TTL = 30  # 30 seconds
+# Seed the event bus with the last persisted analysis so readers never
+# need to open the shared data file themselves
+if os.path.exists(SHARED_DATA_FILE):
+    try:
+        with open(SHARED_DATA_FILE, "r") as f:
+            event_bus.publish("analysis", json.load(f))
+    except Exception as e:
+        logger.warning(f"Could not load {SHARED_DATA_FILE}: {e}")
+
+# Incremental analysis log reader (parses only appended bytes per request)
+analysis_log_reader = AnalysisLogReader(ANALYSIS_LOG_FILE)
 
 # ─── Serve the React/HTML frontend ───────────────────────────────────────────
 
@@ -105,6 +163,9 @@ def health():
         "status": "ok",
         "version": "1.0",
         "timestamp": datetime.now().isoformat(),
+        "response_cache": ai_farmer.cache_stats(),
+        "worker_mode": VIDEO_WORKER_MODE,
+        "pid": os.getpid(),
     }), 200
 
 
@@ -149,7 +210,9 @@ def send_sms():
     """
     Send an SMS (with optional AI response generation).
     Body: { "message": "...", "recipients": "+254..." | ["+254...", ...], "use_ai": false }
-    Returns: { "status": "success", "recipients": [...] }
+    Returns: { "status": "success" | "partial", "recipients": [...], "sent": n, "failed": n,
+               "results": [{ "number", "status", "status_code", "message_id", ... }] }
+    Large recipient lists are sent in concurrent, rate-limited chunks with retries.
     """
     if not is_sms_enabled():
         return jsonify({
@@ -178,21 +241,28 @@ def send_sms():
         else:
             outgoing = message
 
-        result = sms_sender.send(recipients_list, outgoing)
+        result = sms_sender.send_bulk(recipients_list, outgoing)
+        
+        # Store per-recipient outcome, failures included (one transaction
+        # for all recipients)
+        save_messages([
+            (r["number"], "sent", outgoing, r["status"], r["message_id"])
+            for r in result.get("recipients", [])
+        ])
         
         if not result.get("success"):
             return jsonify({
                 "error": result.get("error", "Failed to send SMS"),
-                "code": ERROR_SMS
+                "code": ERROR_SMS,
+                "results": result.get("recipients", []),
             }), 500
         
-        # Store in database
-        for phone in recipients_list:
-            save_message(phone, "sent", outgoing)
-        
         return jsonify({
-            "status": "success",
-            "recipients": recipients_list,
+            "status": "success" if result["status"] == "sent" else "partial",
+            "recipients": [r["number"] for r in result["recipients"]],
+            "sent": result["sent"],
+            "failed": result["failed"],
+            "results": result["recipients"],
         }), 200
 
     except Exception as e:
@@ -208,7 +278,9 @@ def receive_sms():
     """
     Africa's Talking webhook for incoming SMS.
     AT posts: from, text, id, to, date
-    Auto-replies with AI-generated response.
+    Stores the message and acknowledges immediately; the AI reply is
+    generated and sent by the background reply worker. Redeliveries of
+    an already received message id are acknowledged and ignored.
     """
     if not is_sms_enabled():
         return jsonify({"error": "SMS not configured"}), 503
@@ -234,17 +306,17 @@ def receive_sms():
         if phone_number and not phone_number.startswith("+"):
             phone_number = "+254" + phone_number.lstrip("0")
 
-        # Store in database
-        save_message(phone_number, "received", message_text)
+        if not message_id:
+            # Without a provider id redeliveries can't be detected
+            message_id = f"local-{uuid.uuid4().hex}"
 
-        # Generate AI response
-        ai_response = ai_farmer.chat_with_farmer(message_text)
-        _send_reply(phone_number, ai_response)
-        
-        # Store AI response in database
-        save_message(phone_number, "sent", ai_response)
+        # Persist before acknowledging, then reply in the background
+        if not record_inbound(message_id, phone_number, message_text):
+            logger.info(f"Duplicate SMS delivery ignored: {message_id}")
+            return jsonify({"status": "success", "message": "Duplicate ignored"}), 200
 
-        return jsonify({"status": "success", "message": "SMS processed"}), 200
+        reply_worker.enqueue(message_id)
+        return jsonify({"status": "success", "message": "SMS queued"}), 200
 
     except Exception as e:
         logger.error(f"/sms/receive error: {e}")
@@ -262,6 +334,8 @@ def delivery_report():
     try:
         data = request.get_json() if request.is_json else request.form.to_dict()
         logger.info(f"Delivery report: {data}")
+        if data.get("id") and data.get("status"):
+            update_message_status(data["id"], data["status"])
         return jsonify({"status": "success"}), 200
     except Exception as e:
         logger.error(f"/sms/delivery error: {e}")
@@ -273,25 +347,36 @@ def delivery_report():
 @app.route("/conversations", methods=["GET"])
 def get_conversations():
     """
-    GET /conversations              → all conversations
-    GET /conversations?phone=+254…  → single thread
+    GET /conversations                         → first page of conversations
+    GET /conversations?limit=50&offset=50      → next page (phones, by number)
+    GET /conversations?messages=20             → latest 20 messages per phone
+    GET /conversations?phone=+254…             → single thread
     """
     phone_number = request.args.get("phone_number") or request.args.get("phone")
     
     try:
+        # Clamp to 1..max: SQLite treats a negative LIMIT as unlimited
+        messages_limit = min(max(int(request.args.get("messages", CONVERSATION_MESSAGE_LIMIT)), 1), 1000)
         if phone_number:
-            from db import get_conversation
-            messages = get_conversation(phone_number)
+            messages = get_conversation(phone_number, limit=messages_limit)
             return jsonify({
                 "phone_number": phone_number,
                 "messages": messages,
             })
         else:
-            all_convs = get_all_conversations()
+            limit = min(max(int(request.args.get("limit", CONVERSATIONS_PAGE_SIZE)), 1), 500)
+            offset = max(int(request.args.get("offset", 0)), 0)
+            all_convs = get_all_conversations(limit, offset, messages_limit)
+            total = count_conversations()
             return jsonify({
-                "total_conversations": len(all_convs),
+                "total_conversations": total,
                 "conversations": all_convs,
+                "limit": limit,
+                "offset": offset,
+                "has_more": offset + len(all_convs) < total,
             })
+    except ValueError:
+        return jsonify({"error": "'limit', 'offset' and 'messages' must be integers"}), 400
     except Exception as e:
         logger.error(f"/conversations error: {e}")
         return jsonify({
@@ -323,32 +408,25 @@ def clear_conversations_route():
 def analysis_status():
     """
     Returns the latest analysis status.
-    Merges live video_processor in-memory state (real-time) with the
-    persisted cow_analysis_data.json so the dashboard stays live during processing.
+    Merges the latest job's in-memory state (real-time) with the last
+    published analysis so the dashboard stays live during processing.
     """
     try:
-        # Start with persisted data (last completed analysis)
-        disk_data = {}
-        if os.path.exists(SHARED_DATA_FILE):
-            try:
-                with open(SHARED_DATA_FILE, "r") as f:
-                    disk_data = json.load(f)
-            except Exception:
-                pass
-
         # Override with live in-memory state if processor is active
-        proc_status = video_processor.get_status()
-        if proc_status["is_processing"] or proc_status["status"] in ("processing", "completed"):
+        proc_status = job_manager.status()
+        if proc_status and (proc_status["is_processing"] or proc_status["status"] in ("processing", "completed")):
             return jsonify({
+                "job_id": proc_status["job_id"],
                 "timestamp": proc_status["timestamp"],
                 "analysis": proc_status["latest_analysis"],
                 "frame_count": proc_status["frame_count"],
                 "status": "running" if proc_status["is_processing"] else proc_status["status"],
             }), 200
 
-        # Fall back to disk data
-        if disk_data:
-            return jsonify(disk_data), 200
+        # Fall back to the last published analysis
+        last_analysis = event_bus.latest("analysis")
+        if last_analysis:
+            return jsonify(last_analysis), 200
 
         return jsonify({
             "timestamp": datetime.now().isoformat(),
@@ -361,69 +439,59 @@ def analysis_status():
         return jsonify({"status": "error", "error": str(e)}), 500
 
 
+@app.route("/events", methods=["GET"])
+@limiter.exempt
+def events_stream():
+    """
+    Server-Sent Events stream of live updates.
+    Events: status (job state changes), analysis (each analyzed frame),
+    frame (a new current frame is available).
+    The latest event of each type is replayed on connect.
+    """
+    def stream():
+        subscription = event_bus.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            for event in event_bus.snapshot():
+                yield format_sse(event)
+            while True:
+                event = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield format_sse(event)
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
 @app.route("/analysis/log", methods=["GET"])
 def analysis_log():
     """
-    Returns last N lines from analysis_log.txt with caching.
-    Query param: ?lines=50 (default 30)
-    Cache TTL: 30 seconds
+    Returns parsed entries from analysis_log.txt (and its rotated backups).
+    GET /analysis/log?lines=50            → latest 50 entries (default 30)
+    GET /analysis/log?since=<cursor>      → entries after a cursor, oldest first
+    GET /analysis/log?job=<job_id>        → only one job's (camera's) entries
+    Each response carries "cursor"; pass it back as ?since= to fetch only
+    new entries (any web worker accepts any cursor). Only bytes appended
+    since the previous request are parsed.
     """
-    global _log_cache
-    
     try:
         n = int(request.args.get("lines", 30))
-        
-        # Check cache validity
-        now = datetime.now().timestamp()
-        if _log_cache["timestamp"] > 0 and (now - _log_cache["timestamp"]) < LOG_CACHE_TTL:
-            # Return cached entries
-            entries = _log_cache["entries"][-n:] if _log_cache["entries"] else []
-            return jsonify({"entries": entries, "total": _log_cache["total"]}), 200
-        
-        if not os.path.exists(ANALYSIS_LOG_FILE):
-            return jsonify({"entries": [], "total": 0}), 200
-
-        # Check if file has been modified
-        mtime = os.path.getmtime(ANALYSIS_LOG_FILE)
-        if mtime <= _log_cache["mtime"] and _log_cache["timestamp"] > 0:
-            # Use cached data
-            entries = _log_cache["entries"][-n:] if _log_cache["entries"] else []
-            return jsonify({"entries": entries, "total": _log_cache["total"]}), 200
-
-        # Read and parse file
-        with open(ANALYSIS_LOG_FILE, "r", encoding="utf-8") as f:
-            raw = [l.strip() for l in f.readlines() if l.strip()]
-
-        entries = []
-        for line in raw:
-            # Format: "2025-07-31 16:27:20 - FRAME 90: Four cows are eating hay."
-            try:
-                ts_part, rest = line.split(" - FRAME ", 1)
-                frame_num, analysis = rest.split(": ", 1)
-                entries.append({
-                    "timestamp": ts_part.strip(),
-                    "frame": int(frame_num.strip()),
-                    "analysis": analysis.strip(),
-                    "is_error": analysis.strip().startswith("Analysis error"),
-                })
-            except Exception:
-                entries.append({
-                    "timestamp": "",
-                    "frame": 0,
-                    "analysis": line,
-                    "is_error": False,
-                })
-
-        # Update cache
-        _log_cache = {
-            "entries": entries,
-            "mtime": mtime,
-            "total": len(raw),
-            "timestamp": now
-        }
+        since = request.args.get("since")
+        result = analysis_log_reader.read(
+            limit=n,
+            since=since or None,
+            job_id=request.args.get("job") or None
+        )
+        return jsonify(result), 200
 
-        # Return requested slice
-        return jsonify({"entries": entries[-n:], "total": len(raw)}), 200
+    except ValueError:
+        return jsonify({"error": "'lines' must be an integer and 'since' a cursor"}), 400
 
     except Exception as e:
         logger.error(f"/analysis/log error: {e}")
@@ -433,32 +501,60 @@ def analysis_log():
         }), 500
 
 
-# ─── Helpers ──────────────────────────────────────────────────────────────────
-
-def _send_reply(phone_number, message):
+@app.route("/analysis/history", methods=["GET"])
+def analysis_history():
+    """
+    Returns stored frame analyses or one cow's observations, newest first.
+    GET /analysis/history?start=2025-07-31T00:00&end=2025-08-01T00:00
+    GET /analysis/history?cow=3&limit=50       → per-cow status/feed type
+    GET /analysis/history?job=<job_id>
+    """
     try:
-        result = sms_sender.send([phone_number], message)
-        logger.info(f"Reply sent to {phone_number}")
-        return result
+        start = request.args.get("start") or None
+        end = request.args.get("end") or None
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+        cow = request.args.get("cow")
+
+        if cow not in (None, ""):
+            return jsonify({
+                "cow": int(cow),
+                "observations": get_cow_history(int(cow), start, end, limit)
+            }), 200
+
+        return jsonify({
+            "analyses": get_analysis_history(
+                start, end, job_id=request.args.get("job") or None, limit=limit
+            )
+        }), 200
+
+    except ValueError:
+        return jsonify({"error": "'cow' and 'limit' must be integers"}), 400
+
     except Exception as e:
-        logger.error(f"Reply failed to {phone_number}: {e}")
-        return None
+        logger.error(f"/analysis/history error: {e}")
+        return jsonify({
+            "error": "An internal error occurred",
+            "code": ERROR_ANALYSIS
+        }), 500
 
 
 # ─── Error Handlers ───────────────────────────────────────────────────────────
 
 @app.errorhandler(404)
 def not_found(_): return jsonify({"error": "Endpoint not found"}), 404
-# ─── API: Video Upload and Processing ───────────────────────────────────────
 
-def allowed_file(filename):
-    """Check if file extension is allowed"""
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+@app.errorhandler(413)
+def too_large(_): return jsonify({"error": f"File too large. Max size: {MAX_FILE_SIZE // 1024 // 1024}MB"}), 413
 
+# ─── API: Video Upload and Processing ───────────────────────────────────────
 
 @app.route("/video/upload", methods=["POST"])
 def upload_video():
-    """Upload a video file for analysis"""
+    """
+    Upload a video file for analysis in a single multipart request.
+    The file part is written once, straight into the uploads folder.
+    Use /video/uploads for large files or unreliable connections.
+    """
     try:
         # Check if file is in request
         if "file" not in request.files:
@@ -474,20 +570,8 @@ def upload_video():
                 "error": f"File type not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
             }), 400
         
-        # Check file size
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
-        
-        if file_size > MAX_FILE_SIZE:
-            return jsonify({
-                "error": f"File too large. Max size: {MAX_FILE_SIZE // 1024 // 1024}MB"
-            }), 400
-        
-        # Save file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        # Move the streamed file into place (no second copy)
+        filename, filepath, file_size = upload_store.keep_spooled(file, file.filename)
         
         logger.info(f"Video uploaded: {filename}")
         
@@ -499,30 +583,127 @@ def upload_video():
             "message": "Video uploaded successfully. Ready to process."
         }), 200
         
+    except RequestEntityTooLarge:
+        # Over MAX_CONTENT_LENGTH, refused before or while reading the body
+        return too_large(None)
+    except UploadError as e:
+        return upload_error(e)
     except Exception as e:
         logger.error(f"/video/upload error: {e}")
         return jsonify({"error": str(e)[:100]}), 500
+    
+    finally:
+        upload_store.discard_spooled(request.spooled)
+
+
+def upload_error(e):
+    """JSON response for an UploadError"""
+    body = {"error": str(e)}
+    if e.offset is not None:
+        body["offset"] = e.offset
+    return jsonify(body), e.status
+
+
+@app.route("/video/uploads", methods=["POST"])
+def create_upload():
+    """
+    Start (or resume) a chunked upload.
+    Body: { "filename": "barn.mp4", "size": 524288000, "sha256": "<hex, optional>" }
+    Returns: { "upload_id", "offset", "chunk_size", ... } — send chunks from "offset".
+    Creating an upload for a file that is already half uploaded (same name
+    and size) returns the existing upload.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        upload = upload_store.create(data.get("filename"), data.get("size"), data.get("sha256"))
+        upload["chunk_size"] = UPLOAD_CHUNK_SIZE
+        logger.info(f"Upload {upload['upload_id']} started: {upload['filename']} ({upload['size']} bytes)")
+        return jsonify(upload), 201
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        logger.error(f"/video/uploads error: {e}")
+        return jsonify({"error": "An internal error occurred", "code": ERROR_VIDEO}), 500
+
+
+@app.route("/video/uploads/<upload_id>", methods=["GET"])
+def get_upload(upload_id):
+    """Upload status; "offset" is where to resume after a dropped connection"""
+    upload = upload_store.get(upload_id)
+    if upload is None:
+        return jsonify({"error": "Unknown or expired upload"}), 404
+    return jsonify(upload), 200
+
+
+@app.route("/video/uploads/<upload_id>", methods=["PUT", "PATCH"])
+@limiter.exempt
+def put_upload_chunk(upload_id):
+    """
+    Write one chunk (raw bytes, not multipart) at ?offset=<bytes>.
+    The offset must equal the bytes received so far; otherwise 409 with the
+    expected "offset". Chunks are streamed to disk in small blocks.
+    """
+    try:
+        offset = int(request.args.get("offset", request.headers.get("Upload-Offset", "")))
+    except ValueError:
+        return jsonify({"error": "'offset' must be an integer"}), 400
+    try:
+        upload = upload_store.write_chunk(upload_id, offset, request.stream, request.content_length)
+        return jsonify({"upload_id": upload_id, "offset": upload["offset"], "size": upload["size"]}), 200
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        logger.error(f"/video/uploads chunk error: {e}")
+        return jsonify({"error": "An internal error occurred", "code": ERROR_VIDEO}), 500
+
+
+@app.route("/video/uploads/<upload_id>/complete", methods=["POST"])
+def complete_upload(upload_id):
+    """
+    Finish a chunked upload.
+    Body (optional): { "sha256": "<hex>" } — verified against the stored file;
+    on mismatch the file is deleted (422). The response carries the file's sha256.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        upload = upload_store.complete(upload_id, data.get("sha256"))
+        logger.info(f"Video uploaded: {upload['filename']}")
+        upload["message"] = "Video uploaded successfully. Ready to process."
+        return jsonify(upload), 200
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        logger.error(f"/video/uploads complete error: {e}")
+        return jsonify({"error": "An internal error occurred", "code": ERROR_VIDEO}), 500
+
+
+@app.route("/video/uploads/<upload_id>", methods=["DELETE"])
+def abort_upload(upload_id):
+    """Cancel a chunked upload and delete its partial file"""
+    if not upload_store.abort(upload_id):
+        return jsonify({"error": "Unknown or expired upload"}), 404
+    return jsonify({"status": "success", "upload_id": upload_id}), 200
 
 
 @app.route("/video/process", methods=["POST"])
 @limiter.limit("5 per minute")
 def process_video():
-    """Start video processing with AI analysis"""
+    """
+    Start a video processing job with AI analysis.
+    Body: { "source": "file" | "webcam", "filename": "...", "duration": 60, "camera": 0 | "rtsp://..." }
+    Returns: { "status": "processing_started", "job_id": "..." }
+    Several jobs (e.g. one per barn camera) can run at once.
+    """
     try:
         data = request.get_json() if request.is_json else {}
         source = data.get("source", "").lower()  # "file" or "webcam"
         filename = data.get("filename", "")
         duration = data.get("duration", 60)  # seconds for webcam
+        camera = data.get("camera", 0)  # device index or stream URL
         
         if source not in ["file", "webcam"]:
             return jsonify({"error": "source must be 'file' or 'webcam'"}), 400
         
-        if video_processor.is_processing:
-            return jsonify({
-                "status": "already_processing",
-                "message": "Video is already being processed"
-            }), 400
-        
         if source == "file":
             if not filename:
                 return jsonify({"error": "filename required for file source"}), 400
@@ -531,30 +712,41 @@ def process_video():
             if not os.path.exists(filepath):
                 return jsonify({"error": f"File not found: {filename}"}), 404
             
-            # Start processing in background
-            success = video_processor.start_video_processing(filepath)
-            if not success:
-                return jsonify({"error": "Could not start processing"}), 400
+            # Start processing in background (a file still being uploaded
+            # is analyzed as its chunks arrive)
+            job_id = job_manager.start_file(filepath)
+            uploading = upload_store.in_progress(filepath)
             
             return jsonify({
                 "status": "processing_started",
+                "job_id": job_id,
                 "source": "file",
                 "filename": filename,
-                "message": "Video processing started"
+                "uploading": uploading,
+                "message": "Video processing started" + (" (following the upload)" if uploading else "")
             }), 200
         
         elif source == "webcam":
+            if isinstance(camera, str) and camera.isdigit():
+                camera = int(camera)
+            
             # Start webcam processing in background
-            success = video_processor.start_webcam_processing(duration)
-            if not success:
-                return jsonify({"error": "Could not start processing"}), 400
+            job_id = job_manager.start_webcam(duration, camera)
             
             return jsonify({
                 "status": "processing_started",
+                "job_id": job_id,
                 "source": "webcam",
+                "camera": camera,
                 "duration": duration,
                 "message": f"Webcam processing started for {duration} seconds"
             }), 200
+    
+    except JobLimitError as e:
+        return jsonify({
+            "status": "too_many_jobs",
+            "message": str(e)
+        }), 429
         
     except Exception as e:
         logger.error(f"/video/process error: {e}")
@@ -566,22 +758,59 @@ def process_video():
 
 @app.route("/video/status", methods=["GET"])
 def video_status():
-    """Get current video processing status"""
+    """
+    GET /video/status           → latest job status
+    GET /video/status?job=<id>  → status of a specific job
+    """
     try:
-        status = video_processor.get_status()
+        job_id = request.args.get("job")
+        status = job_manager.status(job_id)
+        if status is None:
+            if job_id:
+                return jsonify({"error": f"Unknown job: {job_id}"}), 404
+            return jsonify({
+                "job_id": None,
+                "is_processing": False,
+                "status": "idle",
+                "frame_count": 0,
+                "latest_analysis": "Ready for analysis",
+                "timestamp": datetime.now().isoformat()
+            }), 200
+        status["active_jobs"] = job_manager.active_count()
         return jsonify(status), 200
     except Exception as e:
         logger.error(f"/video/status error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/video/jobs", methods=["GET"])
+def video_jobs():
+    """List all tracked processing jobs"""
+    try:
+        jobs = job_manager.list_jobs()
+        return jsonify({
+            "jobs": jobs,
+            "active": sum(1 for j in jobs if j["is_processing"]),
+            "max_concurrent": job_manager.max_jobs
+        }), 200
+    except Exception as e:
+        logger.error(f"/video/jobs error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/video/stop", methods=["POST"])
 def stop_video():
-    """Stop ongoing video processing"""
+    """
+    Stop video processing.
+    Body (optional): { "job": "<id>" } — omit to stop every running job
+    """
     try:
-        success = video_processor.stop_processing()
+        data = request.get_json(silent=True) or {}
+        job_id = data.get("job") or request.args.get("job")
+        success = job_manager.stop(job_id)
         return jsonify({
             "status": "success" if success else "error",
+            "job_id": job_id,
             "message": "Video processing stopped" if success else "No processing to stop"
         }), 200
     except Exception as e:
@@ -591,16 +820,47 @@ def stop_video():
 
 @app.route("/video/current-frame", methods=["GET"])
 def get_current_frame():
-    """Get the current frame from video processing"""
+    """
+    Get the latest analyzed frame from memory (JPEG).
+    Query: ?job=<id> for a specific job (default: most recent of any job)
+    Send If-None-Match with the last ETag to get 304 while the frame is unchanged.
+    """
     try:
-        if os.path.exists("current_frame.jpg"):
-            return send_from_directory(".", "current_frame.jpg")
-        return jsonify({"error": "No frame available"}), 404
+        frame = latest_frame.get(request.args.get("job"))
+        if frame is None:
+            return jsonify({"error": "No frame available"}), 404
+        
+        if frame["etag"] in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(frame["jpeg"], mimetype="image/jpeg")
+        response.set_etag(frame["etag"])
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Frame-Number"] = str(frame["frame"])
+        return response
     except Exception as e:
         logger.error(f"/video/current-frame error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/video/stream", methods=["GET"])
+@limiter.exempt
+def video_stream():
+    """
+    Live MJPEG preview (multipart/x-mixed-replace), usable directly as an <img> src.
+    Query: ?job=<id> for a specific job (default: the job that started most recently)
+    Frames come from the decode loop at PREVIEW_FPS, independent of the analysis rate.
+    Only available when jobs run in this process (VIDEO_WORKER_MODE=inline).
+    """
+    if VIDEO_WORKER_MODE == "external":
+        return jsonify({"error": "Live preview is not available with an external video worker"}), 404
+    return Response(
+        preview_stream.stream(request.args.get("job")),
+        mimetype=f"multipart/x-mixed-replace; boundary={PREVIEW_BOUNDARY}",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.route("/video/list-uploads", methods=["GET"])
 def list_uploads():
     """List all uploaded video files"""
@@ -611,11 +871,14 @@ def list_uploads():
         files = []
         for filename in os.listdir(UPLOAD_FOLDER):
             filepath = os.path.join(UPLOAD_FOLDER, filename)
-            if os.path.isfile(filepath):
+            if os.path.isfile(filepath) and not filename.startswith(SPOOL_PREFIX):
+                upload = upload_store.find(filename)
                 files.append({
                     "filename": filename,
                     "size": os.path.getsize(filepath),
-                    "uploaded": datetime.fromtimestamp(os.path.getctime(filepath)).isoformat()
+                    "uploaded": datetime.fromtimestamp(os.path.getctime(filepath)).isoformat(),
+                    "upload_id": upload["upload_id"] if upload else None,  # Still uploading
+                    "total_size": upload["size"] if upload else None
                 })
         
         return jsonify({"files": files}), 200
@@ -642,8 +905,12 @@ def delete_video(filename):
         if not os.path.isfile(filepath):
             return jsonify({"error": "Not a file"}), 400
         
-        # Delete the file
-        os.remove(filepath)
+        # Delete the file (and cancel its upload if unfinished)
+        upload = upload_store.find(safe_filename)
+        if upload is not None:
+            upload_store.abort(upload["upload_id"])
+        if os.path.exists(filepath):
+            os.remove(filepath)
         logger.info(f"Video deleted: {filename}")
         
         return jsonify({
@@ -663,12 +930,8 @@ def delete_video(filename):
 def get_herd_data():
     """Get herd data with current status from analysis"""
     try:
-        # Try to load analysis data which contains real herd status
-        if os.path.exists(SHARED_DATA_FILE):
-            with open(SHARED_DATA_FILE, "r") as f:
-                analysis_data = json.load(f)
-        else:
-            analysis_data = {}
+        # Latest analysis from the event bus (no disk access)
+        analysis_data = event_bus.latest("analysis", {})
         
         # Extract herd information - can be expanded based on analysis structure
         # For now, return a structured herd list that frontend can use
@@ -740,9 +1003,20 @@ def get_herd_data():
                 }
             ],
             "timestamp": analysis_data.get("timestamp", datetime.now().isoformat()),
-            "analysis_available": os.path.exists(SHARED_DATA_FILE)
+            "analysis_available": bool(analysis_data)
         }
         
+        # Overlay the latest parsed "Cow N: status" observation per cow
+        observations = get_latest_cow_status()
+        for cow in herd_data["herd"]:
+            obs = observations.get(int(cow["id"].split("-")[1]))
+            if obs:
+                cow["status"] = obs["status"]
+                cow["detail"] = " ".join(
+                    part for part in (obs["status"].capitalize(), obs["feed_type"]) if part
+                )
+                cow["last_update"] = obs["timestamp"]
+        
         return jsonify(herd_data), 200
     
     except Exception as e:
@@ -770,4 +1044,14 @@ if __name__ == "__main__":
     logger.info("  POST /conversations/clear→ Clear history")
     logger.info("  GET  /analysis/status    → Latest video analysis")
     logger.info("  GET  /analysis/log       → Frame-by-frame log")
-    app.run(debug=True, port=5000, host="0.0.0.0")
+    logger.info("  GET  /analysis/history   → Stored analyses / per-cow history")
+    logger.info("  GET  /events             → Live updates (Server-Sent Events)")
+    logger.info("  POST /video/process      → Start an analysis job")
+    logger.info("  GET  /video/status?job=  → Job status")
+    logger.info("  GET  /video/jobs         → All analysis jobs")
+    logger.info("For production: gunicorn -c gunicorn.conf.py wsgi:app (see wsgi.py)")
+    # Answer SMS left unanswered by the last run (only in the serving
+    # process, not the debug reloader's watcher)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services()
+    app.run(debug=True, port=5000, host="0.0.0.0", threaded=True)
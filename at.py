@@ -1,19 +1,45 @@
 from __future__ import print_function
 import africastalking
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from rate_limit import TokenBucket
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# ────────────────────────────────────────────────────────────
+# Bulk Send Configuration
+# ────────────────────────────────────────────────────────────
+
+SMS_CHUNK_SIZE = int(os.getenv("SMS_CHUNK_SIZE", 100))  # Recipients per provider request
+SMS_MAX_WORKERS = int(os.getenv("SMS_MAX_WORKERS", 4))  # Chunks sent concurrently
+SMS_REQUESTS_PER_SECOND = float(os.getenv("SMS_REQUESTS_PER_SECOND", 5))
+SMS_BURST = int(os.getenv("SMS_BURST", 5))
+SMS_MAX_RETRIES = int(os.getenv("SMS_MAX_RETRIES", 3))
+SMS_RETRY_BACKOFF = float(os.getenv("SMS_RETRY_BACKOFF", 1.0))  # Seconds, doubled per attempt
+
+# Africa's Talking per-recipient status codes
+SENT_STATUS_CODES = {100, 101, 102}  # Processed, Sent, Queued
+RETRYABLE_STATUS_CODES = {500, 501, 502}  # InternalServerError, GatewayError, RejectedByGateway
+
+
 class SMS:
     """SMS sender with lazy initialization for API credentials"""
     
-    def __init__(self):
+    def __init__(self, client=None):
+        """
+        Args:
+            client: Provider with send(message, recipients, sender); defaults
+                to africastalking.SMS (tests pass a local stub)
+        """
         self.username = os.getenv("AFRICAS_TALKING_USERNAME", "sandbox")
         self.api_key = os.getenv("AFRICAS_TALKING_API_KEY")
-        self.sms = None
+        self.sms = client
         self.sender = "1403"  # Optional sender ID
-        self._initialized = False
+        self._initialized = client is not None
+        self.bucket = TokenBucket(SMS_REQUESTS_PER_SECOND, SMS_BURST)
 
     def _initialize(self):
         """Lazy initialization of Africa's Talking API"""
@@ -56,6 +82,118 @@ class SMS:
                 "status": "error"
             }
 
+    # ── Bulk sending ─────────────────────────────────────────
+
+    def send_bulk(self, recipients, message, chunk_size=SMS_CHUNK_SIZE,
+                  max_workers=SMS_MAX_WORKERS, max_retries=SMS_MAX_RETRIES,
+                  backoff=SMS_RETRY_BACKOFF):
+        """
+        Send one message to many recipients
+        
+        Recipients are split into provider-sized chunks that are sent
+        concurrently under the SMS rate limit. Recipients that fail with a
+        transient error (gateway/server status or a failed request) are
+        retried with exponential backoff.
+        
+        Args:
+            recipients: List of phone numbers (duplicates are sent once)
+            message: Message text
+            chunk_size: Recipients per provider request
+            max_workers: Chunks in flight at once
+            max_retries: Retries per recipient after the first attempt
+            backoff: Initial retry delay in seconds
+            
+        Returns:
+            dict: {"success", "status", "total", "sent", "failed",
+                   "recipients": [{"number", "status", "status_code",
+                                   "message_id", "cost", "attempts"}, ...]}
+        """
+        if not self._initialize():
+            return {
+                "success": False,
+                "error": "SMS not configured - missing AFRICAS_TALKING_API_KEY",
+                "status": "unconfigured"
+            }
+        
+        numbers = list(dict.fromkeys(r for r in recipients if r))
+        chunk_size = max(1, int(chunk_size))
+        chunks = [numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)]
+        
+        results = {}
+        if chunks:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))),
+                                    thread_name_prefix="sms-bulk") as pool:
+                for chunk_results in pool.map(
+                    lambda chunk: self._send_chunk(chunk, message, max_retries, backoff),
+                    chunks
+                ):
+                    results.update(chunk_results)
+        
+        ordered = [results[n] for n in numbers]
+        sent = sum(1 for r in ordered if r["status_code"] in SENT_STATUS_CODES)
+        return {
+            "success": sent > 0 or not numbers,
+            "status": "sent" if sent == len(numbers) else ("partial" if sent else "error"),
+            "total": len(numbers),
+            "sent": sent,
+            "failed": len(numbers) - sent,
+            "recipients": ordered
+        }
+
+    def _send_chunk(self, numbers, message, max_retries, backoff):
+        """Send to one chunk, retrying transient per-recipient failures"""
+        results = {}
+        pending = list(numbers)
+        
+        for attempt in range(1, max_retries + 2):
+            self.bucket.acquire()
+            try:
+                response = self.sms.send(message, pending, self.sender)
+                reported = {
+                    r.get("number"): r
+                    for r in (response or {}).get("SMSMessageData", {}).get("Recipients", [])
+                }
+                error = "No status returned"
+            except Exception as e:
+                reported = {}
+                error = str(e)[:100]
+            
+            retry = []
+            for number in pending:
+                r = reported.get(number)
+                if r is None:
+                    results[number] = self._result(number, None, error, attempt)
+                    retry.append(number)
+                    continue
+                code = int(r.get("statusCode", 0) or 0)
+                results[number] = self._result(
+                    number, code, r.get("status", ""), attempt,
+                    message_id=r.get("messageId"), cost=r.get("cost")
+                )
+                if code in RETRYABLE_STATUS_CODES:
+                    retry.append(number)
+            
+            pending = retry
+            if not pending or attempt > max_retries:
+                break
+            # Exponential backoff with jitter so chunks don't retry in lockstep
+            time.sleep(backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+        
+        if pending:
+            print(f"SMS delivery failed for {len(pending)} recipients after {max_retries} retries")
+        return results
+
+    @staticmethod
+    def _result(number, status_code, status, attempts, message_id=None, cost=None):
+        return {
+            "number": number,
+            "status": status,
+            "status_code": status_code,
+            "message_id": message_id if message_id not in ("None", "") else None,
+            "cost": cost,
+            "attempts": attempts
+        }
+
 
 def main():
     sms = SMS()
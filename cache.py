@@ -0,0 +1,281 @@
+"""
+Caches for HerdWatch farmer chat
+Thread-safe LRU cache with TTL (optionally snapshotted to a JSON file so
+entries survive restarts) and a local similarity index over past questions
+"""
+
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import numpy as np
+
+
+class LRUCache:
+    """Least-recently-used cache with per-entry expiry
+
+    get() and set() are O(1): entries live in an OrderedDict in recency
+    order, so eviction pops the oldest entry and expiry is checked only for
+    the entry being read. With ``snapshot_path`` set, changes are written
+    to disk at most every ``snapshot_interval`` seconds (and at exit) by
+    atomically replacing the file, never on the request path.
+    """
+
+    def __init__(self, max_entries=500, ttl=600, snapshot_path=None, snapshot_interval=30):
+        """
+        Args:
+            max_entries: Entries kept before the least recently used is evicted
+            ttl: Seconds an entry stays valid (None for no expiry)
+            snapshot_path: JSON file to load from and snapshot to (optional)
+            snapshot_interval: Seconds between snapshots of a changed cache
+        """
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+
+        self._entries = OrderedDict()  # key -> (value, expires_at), oldest first
+        self._lock = threading.RLock()
+        self._snapshot_lock = threading.Lock()
+        self._dirty = False
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+        if snapshot_path:
+            self.load()
+            self._start_snapshots()
+
+    # ── Cache operations ─────────────────────────────────────
+
+    def get(self, key, default=None):
+        """Get a value and mark it most recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self._dirty = True
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entry if full"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            self._dirty = True
+
+    def delete(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def items(self):
+        """Unexpired (key, value) pairs, least recently used first"""
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value) for key, (value, expires_at) in self._entries.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        return stats
+
+    # ── Persistence ──────────────────────────────────────────
+
+    def load(self):
+        """Load unexpired entries from the snapshot file"""
+        try:
+            with open(self.snapshot_path, "r") as f:
+                data = json.load(f)
+            now = time.time()
+            with self._lock:
+                for key, value, expires_at in data.get("entries", []):
+                    if expires_at is None or expires_at > now:
+                        self._entries[key] = (value, expires_at)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # Unreadable or old-format snapshot: start empty
+            print(f"Error loading cache snapshot {self.snapshot_path}: {e}")
+
+    def snapshot(self, force=False):
+        """Atomically write the cache to disk if it changed"""
+        if not self.snapshot_path:
+            return
+        with self._snapshot_lock:
+            now = time.time()
+            with self._lock:
+                if not (self._dirty or force):
+                    return
+                entries = [
+                    [key, value, expires_at]
+                    for key, (value, expires_at) in self._entries.items()
+                    if expires_at is None or expires_at > now
+                ]
+                self._dirty = False
+
+            tmp_path = f"{self.snapshot_path}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump({"version": 1, "entries": entries}, f)
+                os.replace(tmp_path, self.snapshot_path)
+            except Exception as e:
+                with self._lock:
+                    self._dirty = True  # Try again next interval
+                print(f"Error saving cache snapshot {self.snapshot_path}: {e}")
+
+    def _start_snapshots(self):
+        def run():
+            while True:
+                time.sleep(self.snapshot_interval)
+                self.snapshot()
+
+        threading.Thread(target=run, name="cache-snapshot", daemon=True).start()
+        atexit.register(self.snapshot)
+
+
+# ────────────────────────────────────────────────────────────
+# Semantic Question Cache
+# ────────────────────────────────────────────────────────────
+
+# Words that don't change what a farmer is asking about. Question words
+# (what/which/how...), modals (should/can...), tense (was/did...),
+# quantifiers (any/some) and negations are kept: they change the question.
+STOPWORDS = frozenset("""
+    a an the is are do does of to in on at for with and or my i me we you it its
+    this that there here right now currently current today please just about
+    tell show
+""".split())
+
+# Contractions (apostrophe already dropped) spelled out, so "what's" and
+# "what is", or "isn't" and "is not", embed the same way
+CONTRACTIONS = {
+    "whats": "what is", "whos": "who is", "hows": "how is", "wheres": "where is",
+    "isnt": "is not", "arent": "are not", "wasnt": "was not", "werent": "were not",
+    "dont": "do not", "doesnt": "does not", "didnt": "did not", "cant": "can not",
+    "wont": "will not", "shouldnt": "should not", "couldnt": "could not",
+}
+
+
+def normalize_question(text):
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(re.findall(r"[a-z0-9]+", (text or "").lower().replace("'", "")))
+
+
+def embed_text(text, dim=512):
+    """
+    Local bag-of-words embedding (no model call)
+    
+    Content words and their character trigrams are hashed into a signed
+    vector, so rephrasings with the same content words ("how many cows are
+    eating now" / "how many cows eating?") land close together while a
+    different subject ("... lying down") does not.
+    
+    Returns:
+        np.ndarray: L2-normalized float32 vector
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    words = [
+        w for w in " ".join(CONTRACTIONS.get(w, w) for w in normalize_question(text).split()).split()
+        if w not in STOPWORDS
+    ]
+    for word in words:
+        padded = f"#{word}#"
+        features = [(f"w:{word}", 2.0)] + [(f"c:{padded[i:i + 3]}", 1.0) for i in range(len(padded) - 2)]
+        for feature, weight in features:
+            h = zlib.crc32(feature.encode())
+            vector[h % dim] += weight if h & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Nearest-neighbour index from past questions to response cache keys
+
+    Each question is stored with a scope (the herd-state fingerprint it was
+    answered under); lookups only match questions from the same scope whose
+    cosine similarity reaches ``threshold``. Storage is a fixed-size ring of
+    vectors, so a lookup is one matrix-vector product.
+    """
+
+    def __init__(self, max_entries=500, threshold=0.9, dim=512):
+        self.max_entries = max(1, int(max_entries))
+        self.threshold = threshold
+        self.dim = dim
+        self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._scopes = [None] * self.max_entries
+        self._keys = [None] * self.max_entries
+        self._next = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def add(self, text, scope, key):
+        """Remember that ``text`` asked under ``scope`` is cached at ``key``"""
+        vector = embed_text(text, self.dim)
+        with self._lock:
+            slot = self._next % self.max_entries
+            self._vectors[slot] = vector
+            self._scopes[slot] = scope
+            self._keys[slot] = key
+            self._next += 1
+
+    def lookup(self, text, scope):
+        """
+        Find the most similar past question in the same scope
+        
+        Returns:
+            tuple or None: (cache key, similarity) if above the threshold
+        """
+        vector = embed_text(text, self.dim)
+        with self._lock:
+            slots = [i for i, s in enumerate(self._scopes) if s == scope]
+            if slots:
+                similarities = self._vectors[slots] @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._stats["hits"] += 1
+                    return self._keys[slots[best]], float(similarities[best])
+            self._stats["misses"] += 1
+            return None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = min(self._next, self.max_entries)
+        stats["threshold"] = self.threshold
+        return stats
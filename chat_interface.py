@@ -5,9 +5,14 @@ import time
 import cv2
 import base64
 import hashlib
-from datetime import datetime, timedelta
+from datetime import datetime
 from langchain_core.messages import HumanMessage
 from langchain_openai import AzureChatOpenAI
+from ai_engine import ai_engine
+from cache import LRUCache, SemanticCache, normalize_question
+from db import parse_cow_observations, state_get, state_set
+from events import event_bus
+from frame_buffer import CURRENT_FRAME_FILE, latest_frame
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -32,57 +37,76 @@ model = AzureChatOpenAI(
 # Shared data files
 SHARED_DATA_FILE = "cow_analysis_data.json"
 CHAT_LOG_FILE = "chat_log.txt"
-CURRENT_FRAME_FILE = "current_frame.jpg"
 RESPONSE_CACHE_FILE = "response_cache.json"
 
 # Response cache to avoid quota issues
 CACHE_TTL = 600  # 10 minutes
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 500))
+RESPONSE_CACHE_SNAPSHOT_INTERVAL = float(os.getenv("RESPONSE_CACHE_SNAPSHOT_INTERVAL", 30))  # Seconds
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.9))  # Cosine similarity
+
+def analysis_fingerprint(current_data):
+    """
+    Fingerprint of the herd state an answer depends on
+    
+    Built from the parsed per-cow status/feed type rather than the raw
+    analysis text, so consecutive frames describing the same scene share
+    cached answers while any change in cow status invalidates them.
+    """
+    analysis = current_data.get('analysis', '') or ''
+    observations = parse_cow_observations(analysis)
+    if observations:
+        state = ";".join(f"{o['cow']}:{o['status']}:{o['feed_type'] or ''}" for o in observations)
+    else:
+        state = normalize_question(analysis)
+    return hashlib.sha1(f"{current_data.get('status', '')}|{state}".encode()).hexdigest()[:16]
 
 class FarmerChatInterface:
     def __init__(self):
         self.chat_history = []
-        self.response_cache = self._load_cache()
-        self.last_api_call = 0
-        self.min_api_interval = 2  # Minimum 2 seconds between API calls
+        # In-memory LRU shared by request threads, snapshotted to disk in the background
+        self.response_cache = LRUCache(
+            max_entries=RESPONSE_CACHE_SIZE,
+            ttl=CACHE_TTL,
+            snapshot_path=RESPONSE_CACHE_FILE,
+            snapshot_interval=RESPONSE_CACHE_SNAPSHOT_INTERVAL
+        )
+        # Second tier: rephrased questions asked under the same herd state
+        self.semantic_cache = SemanticCache(
+            max_entries=RESPONSE_CACHE_SIZE,
+            threshold=SEMANTIC_CACHE_THRESHOLD
+        ) if SEMANTIC_CACHE_ENABLED else None
+        if self.semantic_cache:
+            for key, cached in self.response_cache.items():
+                if cached.get('fingerprint'):
+                    self.semantic_cache.add(cached['question'], cached['fingerprint'], key)
         
-    def _load_cache(self):
-        """Load cached responses from file"""
-        try:
-            if os.path.exists(RESPONSE_CACHE_FILE):
-                with open(RESPONSE_CACHE_FILE, 'r') as f:
-                    return json.load(f)
-        except:
-            pass
-        return {}
+    def cache_stats(self):
+        """Counters for both response cache tiers"""
+        stats = self.response_cache.stats()
+        stats["semantic"] = self.semantic_cache.stats() if self.semantic_cache else None
+        return stats
     
-    def _save_cache(self):
-        """Save response cache to file with size management"""
+    def _shared_cache_get(self, cache_key):
+        """Look up an answer cached by any process and keep it locally"""
         try:
-            # Evict expired entries first
-            now = datetime.now()
-            self.response_cache = {
-                k: v for k, v in self.response_cache.items()
-                if datetime.fromisoformat(v['timestamp']) > now - timedelta(seconds=CACHE_TTL)
-            }
-            
-            # If cache is too large, remove oldest entries
-            MAX_CACHE_ENTRIES = 500
-            if len(self.response_cache) > MAX_CACHE_ENTRIES:
-                sorted_keys = sorted(
-                    self.response_cache.keys(),
-                    key=lambda k: self.response_cache[k]['timestamp']
-                )
-                entries_to_remove = len(sorted_keys) - MAX_CACHE_ENTRIES
-                for key in sorted_keys[:entries_to_remove]:
-                    del self.response_cache[key]
-            
-            with open(RESPONSE_CACHE_FILE, 'w') as f:
-                json.dump(self.response_cache, f)
+            cached = state_get(f"chat:{cache_key}")
         except Exception as e:
-            print(f"Error saving cache: {e}")
-        
+            print(f"Error reading shared response cache: {e}")
+            return None
+        if cached is not None:
+            self.response_cache.set(cache_key, cached)
+        return cached
+    
     def get_current_analysis(self):
         """Get the latest analysis from the video analyzer"""
+        # In-process: the event bus has the latest analysis without disk I/O
+        latest = event_bus.latest("analysis")
+        if latest:
+            return latest
+        
+        # Standalone: fall back to the snapshot written by the analyzer process
         try:
             if os.path.exists(SHARED_DATA_FILE):
                 with open(SHARED_DATA_FILE, 'r') as f:
@@ -104,6 +128,11 @@ class FarmerChatInterface:
     def get_current_frame(self):
         """Get the current frame from video analyzer"""
         try:
+            # In-process analyzer: decode the frame it already encoded
+            frame = latest_frame.image()
+            if frame is not None:
+                return frame
+            # Standalone analyzer: read its periodic snapshot
             if os.path.exists(CURRENT_FRAME_FILE):
                 return cv2.imread(CURRENT_FRAME_FILE)
             return None
@@ -115,22 +144,24 @@ class FarmerChatInterface:
         """Handle farmer's chat with current analysis context and caching"""
         current_data = self.get_current_analysis()
         
-        # Create a cache key from the question
-        cache_key = hashlib.md5(farmer_question.lower().encode()).hexdigest()
-        
-        # Check cache first
-        if cache_key in self.response_cache:
-            cached = self.response_cache[cache_key]
-            if datetime.fromisoformat(cached['timestamp']) > datetime.now() - timedelta(seconds=CACHE_TTL):
-                print(f"[CACHE HIT] Using cached response for: {farmer_question[:50]}...")
-                return cached['response']
+        # Cache key: normalized question + the herd state it was answered under
+        fingerprint = analysis_fingerprint(current_data)
+        cache_key = hashlib.md5(
+            f"{fingerprint}|{normalize_question(farmer_question)}".encode()
+        ).hexdigest()
         
-        # Rate limit API calls
-        time_since_last_call = time.time() - self.last_api_call
-        if time_since_last_call < self.min_api_interval:
-            wait_time = self.min_api_interval - time_since_last_call
-            print(f"[RATE LIMIT] Waiting {wait_time:.1f}s before next API call...")
-            time.sleep(wait_time)
+        # Check cache first: exact question, then a similar past question,
+        # then answers cached by other worker processes
+        cached = self.response_cache.get(cache_key)
+        if cached is None and self.semantic_cache:
+            match = self.semantic_cache.lookup(farmer_question, fingerprint)
+            if match:
+                cached = self.response_cache.get(match[0])
+        if cached is None:
+            cached = self._shared_cache_get(cache_key)
+        if cached is not None:
+            print(f"[CACHE HIT] Using cached response for: {farmer_question[:50]}...")
+            return cached['response']
         
         # Create context-aware message
         context_message = f"""
@@ -148,17 +179,24 @@ class FarmerChatInterface:
         
         try:
             message = HumanMessage(content=[{"type": "text", "text": context_message}])
-            self.last_api_call = time.time()
-            response = model.invoke([message])
+            # Shares the global request budget with video analysis (chat lane is served first)
+            response = ai_engine.invoke(model, [message], lane="chat")
             response_text = response.content
             
             # Cache the response
-            self.response_cache[cache_key] = {
+            cached = {
                 'response': response_text,
                 'timestamp': datetime.now().isoformat(),
-                'question': farmer_question
+                'question': farmer_question,
+                'fingerprint': fingerprint
             }
-            self._save_cache()
+            self.response_cache.set(cache_key, cached)
+            if self.semantic_cache:
+                self.semantic_cache.add(farmer_question, fingerprint, cache_key)
+            try:
+                state_set(f"chat:{cache_key}", cached, ttl=CACHE_TTL)
+            except Exception as e:
+                print(f"Error sharing cached response: {e}")
             
             return response_text
             
@@ -3,10 +3,16 @@ Database persistence layer for HerdWatch
 Uses SQLite for conversation and alert storage
 """
 
+import atexit
 import sqlite3
 import json
 import os
+import queue
+import re
+import threading
+import time
 from datetime import datetime
+from itertools import groupby
 from contextlib import contextmanager
 from dotenv import load_dotenv
 
@@ -17,6 +23,246 @@ load_dotenv()
 # ────────────────────────────────────────────────────────────
 
 DB_PATH = os.getenv("DB_PATH", "herdwatch.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))  # Idle connections kept open
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))  # Wait on a locked database
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", 256))  # Prepared statements per connection
+
+# Write-behind: inserts are queued and committed in batches by a background thread
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() in ("1", "true", "yes")
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", 0.5))  # Seconds a write may wait
+WRITE_MAX_BATCH = int(os.getenv("WRITE_MAX_BATCH", 500))  # Rows per transaction
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", 10000))  # Producers block beyond this
+
+CONVERSATIONS_PAGE_SIZE = int(os.getenv("CONVERSATIONS_PAGE_SIZE", 50))  # Phones per page
+CONVERSATION_MESSAGE_LIMIT = int(os.getenv("CONVERSATION_MESSAGE_LIMIT", 100))  # Latest messages per phone
+
+# ────────────────────────────────────────────────────────────
+# Connection Pool
+# ────────────────────────────────────────────────────────────
+
+def _connect(path):
+    """Open a tuned connection: WAL journal, NORMAL sync, busy timeout"""
+    conn = sqlite3.connect(
+        path,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,  # Handed between request threads by the pool
+        cached_statements=DB_STATEMENT_CACHE
+    )
+    conn.row_factory = sqlite3.Row
+    # WAL lets readers run alongside the writer; with NORMAL sync a commit
+    # no longer fsyncs (the WAL is synced at checkpoints) and stays durable
+    # across application crashes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    return conn
+
+class ConnectionPool:
+    """Thread-safe pool of reusable SQLite connections
+    
+    Flask serves each request on its own thread, so connections are kept
+    in a shared pool rather than per thread. Reusing a connection also
+    reuses its prepared statement cache. When the pool is empty a new
+    connection is opened; connections beyond ``size`` are closed on return.
+    """
+    
+    def __init__(self, path, size=DB_POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=max(1, int(size)))
+    
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return _connect(self.path)
+    
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()  # Don't hand uncommitted work to the next caller
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+    
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """Pool for the current DB_PATH (recreated if the path changes)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+def close_db():
+    """Flush queued writes and close pooled connections (e.g. on shutdown)"""
+    _writer.close()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+
+# ────────────────────────────────────────────────────────────
+# Write-Behind Writer
+# ────────────────────────────────────────────────────────────
+
+class _Flush:
+    """Queue marker: commit the current batch now, then tell the waiting reader"""
+    
+    def __init__(self):
+        self.committed = threading.Event()  # Set once every write queued before it is committed
+
+
+class WriteBehindWriter:
+    """Background thread that commits queued writes in batches
+    
+    Request handlers enqueue an INSERT and return immediately. The writer
+    drains up to ``max_batch`` items (or whatever arrived within
+    ``flush_interval``), runs consecutive identical statements with one
+    executemany() and commits the batch in a single transaction, so a bulk
+    SMS send costs one fsync instead of one per recipient.
+    
+    Items are either (sql, params) tuples or callables taking a connection,
+    for writes that need lastrowid. Reads call flush() first, so a caller
+    always sees its own writes; flush() waits only for the writes queued
+    before it, not for the queue to drain. An ``on_commit`` callback runs
+    once its write has been committed.
+    """
+    
+    def __init__(self, flush_interval=WRITE_FLUSH_INTERVAL, max_batch=WRITE_MAX_BATCH,
+                 maxsize=WRITE_QUEUE_SIZE, enabled=WRITE_BEHIND_ENABLED):
+        self.flush_interval = flush_interval
+        self.max_batch = max(1, int(max_batch))
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=max(0, int(maxsize)))
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {"written": 0, "batches": 0, "failed": 0}  # Updated by the writer thread only
+    
+    def _ensure_thread(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+    
+    def submit(self, item, on_commit=None):
+        """
+        Queue a write
+        
+        Args:
+            item: (sql, params) tuple, or callable(conn) run inside the batch
+            on_commit: Called (on the writer thread) after the write is committed
+        """
+        if not self.enabled:
+            self._write([item], [on_commit] if on_commit else [])
+            return
+        self._ensure_thread()
+        self._queue.put((item, on_commit))  # Blocks when full: back-pressure on producers
+    
+    def _run(self):
+        while True:
+            batch, callbacks, markers, flush, stop = [], [], 0, None, False
+            entry = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if entry is None or isinstance(entry, _Flush):
+                    markers += 1
+                    flush = entry
+                    stop = entry is None
+                    break
+                item, on_commit = entry
+                batch.append(item)
+                if on_commit is not None:
+                    callbacks.append(on_commit)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    entry = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            
+            try:
+                if batch:
+                    self._write(batch, callbacks)
+            finally:
+                if flush is not None:
+                    flush.committed.set()
+                for _ in range(len(batch) + markers):
+                    self._queue.task_done()
+            if stop:
+                return
+    
+    def _write(self, batch, callbacks=()):
+        """Run a batch in one transaction, grouping identical statements"""
+        try:
+            with get_db() as conn:
+                i = 0
+                while i < len(batch):
+                    item = batch[i]
+                    if callable(item):
+                        item(conn)
+                        i += 1
+                        continue
+                    sql = item[0]
+                    j = i
+                    while j < len(batch) and not callable(batch[j]) and batch[j][0] == sql:
+                        j += 1
+                    conn.executemany(sql, [params for _, params in batch[i:j]])
+                    i = j
+                conn.commit()
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            print(f"Error writing {len(batch)} queued rows: {e}")
+            return
+        for on_commit in callbacks:
+            try:
+                on_commit()
+            except Exception as e:
+                print(f"Error in commit callback: {e}")
+    
+    def pending(self):
+        """Writes queued but not yet committed"""
+        return self._queue.unfinished_tasks
+    
+    def flush(self):
+        """Block until every write queued so far has been committed"""
+        thread = self._thread
+        if thread is None or not thread.is_alive() or not self._queue.unfinished_tasks:
+            return
+        # Writes queued after the marker don't hold up this caller
+        marker = _Flush()
+        self._queue.put(marker)  # Commit now instead of waiting out the interval
+        while not marker.committed.wait(1.0):
+            if not thread.is_alive():
+                return
+    
+    def close(self):
+        """Commit remaining writes and stop the thread"""
+        with self._start_lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+
+_writer = WriteBehindWriter()
+
+def flush_writes():
+    """Commit all queued writes now"""
+    _writer.flush()
+
+atexit.register(close_db)
 
 # ────────────────────────────────────────────────────────────
 # Database Context Manager
@@ -24,18 +270,24 @@ DB_PATH = os.getenv("DB_PATH", "herdwatch.db")
 
 @contextmanager
 def get_db():
-    """Get database connection with row factory"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """Borrow a pooled database connection with row factory"""
+    pool = _get_pool()
+    conn = pool.acquire()
     try:
         yield conn
     finally:
-        conn.close()
+        pool.release(conn)
 
 # ────────────────────────────────────────────────────────────
 # Database Initialization
 # ────────────────────────────────────────────────────────────
 
+def _add_column(conn, table, column, definition):
+    """Add a column to an existing table if it is missing"""
+    columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
 def init_db():
     """Initialize database schema"""
     with get_db() as conn:
@@ -45,9 +297,14 @@ def init_db():
                 phone TEXT NOT NULL,
                 message_type TEXT NOT NULL,
                 message TEXT NOT NULL,
-                timestamp TEXT NOT NULL
+                timestamp TEXT NOT NULL,
+                status TEXT,
+                message_id TEXT
             )
         """)
+        # Databases created before per-recipient delivery tracking
+        _add_column(conn, "conversations", "status", "TEXT")
+        _add_column(conn, "conversations", "message_id", "TEXT")
         
         conn.execute("""
             CREATE TABLE IF NOT EXISTS alerts (
@@ -59,6 +316,95 @@ def init_db():
             )
         """)
         
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS inbound_messages (
+                id TEXT PRIMARY KEY,
+                phone TEXT NOT NULL,
+                message TEXT NOT NULL,
+                received_at TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                reply TEXT,
+                error TEXT,
+                updated_at TEXT
+            )
+        """)
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT,
+                frame INTEGER NOT NULL,
+                timestamp TEXT NOT NULL,
+                analysis TEXT NOT NULL,
+                is_error INTEGER DEFAULT 0
+            )
+        """)
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cow_observations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                analysis_id INTEGER NOT NULL REFERENCES analyses(id) ON DELETE CASCADE,
+                job_id TEXT,
+                frame INTEGER NOT NULL,
+                timestamp TEXT NOT NULL,
+                cow INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                feed_type TEXT
+            )
+        """)
+        
+        # Shared between web workers and the video worker process
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS shared_state (
+                key TEXT PRIMARY KEY,
+                value,
+                expires_at REAL
+            )
+        """)
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS shared_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_type TEXT NOT NULL,
+                data TEXT NOT NULL,
+                published_at REAL NOT NULL
+            )
+        """)
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS video_jobs (
+                id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                cancel_requested INTEGER DEFAULT 0,
+                snapshot TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT,
+                attempts INTEGER DEFAULT 0,
+                progress REAL,
+                resume_frame INTEGER DEFAULT 0,
+                worker_pid INTEGER,
+                heartbeat_at REAL
+            )
+        """)
+        # Job queues created before process-pool execution
+        _add_column(conn, "video_jobs", "attempts", "INTEGER DEFAULT 0")
+        _add_column(conn, "video_jobs", "progress", "REAL")
+        _add_column(conn, "video_jobs", "resume_frame", "INTEGER DEFAULT 0")
+        _add_column(conn, "video_jobs", "worker_pid", "INTEGER")
+        _add_column(conn, "video_jobs", "heartbeat_at", "REAL")
+        
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_phone_timestamp ON conversations (phone, timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_message_id ON conversations (message_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_inbound_status ON inbound_messages (status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_timestamp ON analyses (timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_job_frame ON analyses (job_id, frame)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cow_obs_cow_timestamp ON cow_observations (cow, timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cow_obs_timestamp ON cow_observations (timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_shared_events_published ON shared_events (published_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_video_jobs_status ON video_jobs (status, created_at)")
+        
         conn.commit()
     
     print(f"✓ Initialized database: {DB_PATH}")
@@ -67,7 +413,11 @@ def init_db():
 # Conversation Functions
 # ────────────────────────────────────────────────────────────
 
-def save_message(phone, msg_type, message):
+INSERT_MESSAGE = """INSERT INTO conversations 
+                    (phone, message_type, message, timestamp, status, message_id)
+                    VALUES (?, ?, ?, ?, ?, ?)"""
+
+def save_message(phone, msg_type, message, status=None, message_id=None):
     """
     Save SMS message to conversation history
     
@@ -75,56 +425,117 @@ def save_message(phone, msg_type, message):
         phone: Phone number
         msg_type: "received" or "sent"
         message: Message text
+        status: Provider delivery status for sent messages
+        message_id: Provider message id (matches delivery reports)
     """
-    with get_db() as conn:
-        conn.execute(
-            """INSERT INTO conversations 
-               (phone, message_type, message, timestamp)
-               VALUES (?, ?, ?, ?)""",
-            (phone, msg_type, message, datetime.now().isoformat())
-        )
-        conn.commit()
+    _writer.submit((
+        INSERT_MESSAGE,
+        (phone, msg_type, message, datetime.now().isoformat(), status, message_id)
+    ))
 
-def get_conversation(phone):
+def save_messages(messages):
     """
-    Get all messages with a specific phone number
+    Save several SMS messages (committed together by the writer)
+    
+    Args:
+        messages: List of (phone, msg_type, message[, status, message_id]) tuples
+    """
+    timestamp = datetime.now().isoformat()
+    for phone, msg_type, message, *delivery in messages:
+        status, message_id = (list(delivery) + [None, None])[:2]
+        _writer.submit((INSERT_MESSAGE, (phone, msg_type, message, timestamp, status, message_id)))
+
+def update_message_status(message_id, status):
+    """
+    Record a delivery report for a sent message
+    
+    Args:
+        message_id: Provider message id
+        status: Delivery status ("Success", "Failed", ...)
+    """
+    _writer.submit((
+        "UPDATE conversations SET status = ? WHERE message_id = ?",
+        (status, message_id)
+    ))
+
+def get_conversation(phone, limit=None):
+    """
+    Get messages with a specific phone number, oldest first
     
     Args:
         phone: Phone number
+        limit: Only the latest N messages (None for all)
         
     Returns:
         list: Message dictionaries
     """
+    _writer.flush()
     with get_db() as conn:
+        # Served from the (phone, timestamp) index: no sort step
         rows = conn.execute(
-            """SELECT * FROM conversations 
-               WHERE phone = ? 
-               ORDER BY timestamp ASC""",
-            (phone,)
+            """SELECT * FROM (
+                   SELECT * FROM conversations 
+                   WHERE phone = ? 
+                   ORDER BY timestamp DESC, id DESC
+                   LIMIT ?
+               ) ORDER BY timestamp ASC, id ASC""",
+            (phone, -1 if limit is None else limit)
         ).fetchall()
         return [dict(r) for r in rows]
 
-def get_all_conversations():
+def get_all_conversations(limit=CONVERSATIONS_PAGE_SIZE, offset=0,
+                          messages_per_phone=CONVERSATION_MESSAGE_LIMIT):
     """
-    Get all conversations grouped by phone number
+    Get a page of conversations grouped by phone number
     
+    Args:
+        limit: Maximum number of phones (ordered by phone number)
+        offset: Phones to skip, for pagination
+        messages_per_phone: Latest N messages kept per phone
+        
     Returns:
-        dict: {phone: [messages...]}
+        dict: {phone: [messages...]} with messages oldest first
     """
+    _writer.flush()
     with get_db() as conn:
-        phones = conn.execute(
-            "SELECT DISTINCT phone FROM conversations ORDER BY phone"
-        ).fetchall()
-        
-        result = {}
-        for row in phones:
-            phone = row["phone"]
-            result[phone] = get_conversation(phone)
+        # One query: pick the page of phones, rank each phone's messages
+        # newest first, keep the latest N, then stream them back in order
+        rows = conn.execute(
+            """WITH page AS (
+                   SELECT phone FROM conversations
+                   GROUP BY phone
+                   ORDER BY phone
+                   LIMIT ? OFFSET ?
+               ),
+               ranked AS (
+                   SELECT c.*, ROW_NUMBER() OVER (
+                       PARTITION BY c.phone ORDER BY c.timestamp DESC, c.id DESC
+                   ) AS rn
+                   FROM conversations c JOIN page ON c.phone = page.phone
+               )
+               SELECT id, phone, message_type, message, timestamp, status, message_id
+               FROM ranked
+               WHERE rn <= ?
+               ORDER BY phone, timestamp, id""",
+            (limit, offset, messages_per_phone)
+        )
         
-        return result
+        return {
+            phone: [dict(r) for r in messages]
+            for phone, messages in groupby(rows, key=lambda r: r["phone"])
+        }
+
+def count_conversations():
+    """Number of distinct phones with conversation history"""
+    _writer.flush()
+    with get_db() as conn:
+        return conn.execute(
+            "SELECT COUNT(DISTINCT phone) AS count FROM conversations"
+        ).fetchone()["count"]
 
 def clear_conversations():
     """Delete all conversation history"""
+    _writer.flush()
     with get_db() as conn:
         conn.execute("DELETE FROM conversations")
         conn.commit()
@@ -132,10 +543,113 @@ def clear_conversations():
 
 def delete_conversation(phone):
     """Delete messages from specific phone number"""
+    _writer.flush()
     with get_db() as conn:
         conn.execute("DELETE FROM conversations WHERE phone = ?", (phone,))
         conn.commit()
 
+# ────────────────────────────────────────────────────────────
+# Inbound SMS Functions
+# ────────────────────────────────────────────────────────────
+
+def record_inbound(message_id, phone, message):
+    """
+    Durably store an incoming SMS before it is acknowledged
+    
+    The inbound row (keyed on the provider's message id) and the
+    conversation entry are written in one synchronous transaction.
+    
+    Args:
+        message_id: Africa's Talking message id
+        phone: Sender phone number
+        message: Message text
+        
+    Returns:
+        bool: True if new, False if this id was already received (redelivery)
+    """
+    now = datetime.now().isoformat()
+    with get_db() as conn:
+        cursor = conn.execute(
+            """INSERT OR IGNORE INTO inbound_messages
+               (id, phone, message, received_at, updated_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            (message_id, phone, message, now, now)
+        )
+        if cursor.rowcount == 0:
+            return False
+        conn.execute(INSERT_MESSAGE, (phone, "received", message, now, None, message_id))
+        conn.commit()
+        return True
+
+def claim_inbound(message_id):
+    """
+    Atomically mark an inbound message as being processed
+    
+    Returns:
+        dict or None: The message, or None if it is already claimed or done
+    """
+    _writer.flush()  # A queued finish_inbound() may have reset it to pending
+    with get_db() as conn:
+        cursor = conn.execute(
+            """UPDATE inbound_messages
+               SET status = 'processing', attempts = attempts + 1, updated_at = ?
+               WHERE id = ? AND status = 'pending'""",
+            (datetime.now().isoformat(), message_id)
+        )
+        conn.commit()
+        if cursor.rowcount == 0:
+            return None
+        row = conn.execute(
+            "SELECT * FROM inbound_messages WHERE id = ?", (message_id,)
+        ).fetchone()
+        return dict(row)
+
+def finish_inbound(message_id, status, reply=None, error=None):
+    """
+    Record the outcome of processing an inbound message
+    
+    Args:
+        message_id: Africa's Talking message id
+        status: "replied", "pending" (retry later) or "failed"
+        reply: Reply text sent to the farmer
+        error: Error message if processing failed
+    """
+    _writer.submit((
+        """UPDATE inbound_messages
+           SET status = ?, reply = COALESCE(?, reply), error = ?, updated_at = ?
+           WHERE id = ?""",
+        (status, reply, error, datetime.now().isoformat(), message_id)
+    ))
+
+def get_unfinished_inbound(stale_after=600):
+    """
+    Get inbound messages that were received but not answered, oldest first.
+    Messages claimed more than ``stale_after`` seconds ago and still
+    "processing" were left by a crashed process and are reset to "pending";
+    newer claims belong to live processes (other web workers) and are kept.
+    
+    Args:
+        stale_after: Seconds after which a claim is considered abandoned
+        
+    Returns:
+        list: Message ids
+    """
+    _writer.flush()
+    claimed_before = datetime.fromtimestamp(time.time() - stale_after).isoformat()
+    with get_db() as conn:
+        conn.execute(
+            """UPDATE inbound_messages SET status = 'pending'
+               WHERE status = 'processing' AND updated_at < ?""",
+            (claimed_before,)
+        )
+        conn.commit()
+        rows = conn.execute(
+            """SELECT id FROM inbound_messages
+               WHERE status = 'pending'
+               ORDER BY received_at"""
+        ).fetchall()
+        return [r["id"] for r in rows]
+
 # ────────────────────────────────────────────────────────────
 # Alert Functions
 # ────────────────────────────────────────────────────────────
@@ -148,14 +662,12 @@ def save_alert(alert_type, message):
         alert_type: Type of alert (critical, warning, info)
         message: Alert message
     """
-    with get_db() as conn:
-        conn.execute(
-            """INSERT INTO alerts 
-               (alert_type, message, timestamp)
-               VALUES (?, ?, ?)""",
-            (alert_type, message, datetime.now().isoformat())
-        )
-        conn.commit()
+    _writer.submit((
+        """INSERT INTO alerts 
+           (alert_type, message, timestamp)
+           VALUES (?, ?, ?)""",
+        (alert_type, message, datetime.now().isoformat())
+    ))
 
 def get_alerts(limit=100):
     """
@@ -167,6 +679,7 @@ def get_alerts(limit=100):
     Returns:
         list: Alert dictionaries
     """
+    _writer.flush()
     with get_db() as conn:
         rows = conn.execute(
             """SELECT * FROM alerts 
@@ -178,6 +691,7 @@ def get_alerts(limit=100):
 
 def get_unresolved_alerts():
     """Get all unresolved alerts"""
+    _writer.flush()
     with get_db() as conn:
         rows = conn.execute(
             "SELECT * FROM alerts WHERE resolved = 0 ORDER BY timestamp DESC"
@@ -186,6 +700,7 @@ def get_unresolved_alerts():
 
 def resolve_alert(alert_id):
     """Mark alert as resolved"""
+    _writer.flush()
     with get_db() as conn:
         conn.execute(
             "UPDATE alerts SET resolved = 1 WHERE id = ?",
@@ -195,17 +710,509 @@ def resolve_alert(alert_id):
 
 def clear_alerts():
     """Delete all alerts"""
+    _writer.flush()
     with get_db() as conn:
         conn.execute("DELETE FROM alerts")
         conn.commit()
     print("✓ Cleared alerts")
 
+# ────────────────────────────────────────────────────────────
+# Analysis Functions
+# ────────────────────────────────────────────────────────────
+
+# "Cow 1: Eating, dry fodder." / "Cow 2: standing" — one segment per cow
+COW_PATTERN = re.compile(
+    r"Cow\s*#?\s*(\d+)\**\s*[:\-]\s*(.*?)(?=\s*\**Cow\s*#?\s*\d+\**\s*[:\-]|\n|$)",
+    re.I
+)
+FEED_TYPE_PATTERN = re.compile(r"feed(?:\s*type)?\s*(?:is|:|-)?\s*([a-z][a-z ]*?)(?=[.,;)]|$)", re.I)
+KNOWN_FEEDS = (
+    "dry fodder", "green fodder", "fodder", "hay", "silage", "grass", "napier",
+    "straw", "maize", "concentrate", "pellets", "grain", "water"
+)
+STATUSES = (("eat", "eating"), ("stand", "standing"), ("lying", "lying"),
+            ("resting", "lying"), ("walk", "walking"), ("drink", "drinking"))
+
+def parse_cow_observations(analysis):
+    """
+    Parse per-cow status from "Cow N: [status]" analysis text
+    
+    Args:
+        analysis: Model output for one frame
+        
+    Returns:
+        list: [{"cow": 1, "status": "eating", "feed_type": "hay"}, ...]
+    """
+    observations = []
+    seen = set()
+    for match in COW_PATTERN.finditer(analysis or ""):
+        cow = int(match.group(1))
+        text = match.group(2).strip().lower()
+        if cow in seen or not text:
+            continue
+        seen.add(cow)
+        
+        status = next((label for key, label in STATUSES if key in text), None)
+        if status is None:
+            status = re.split(r"[\s,.;]+", text)[0] or "unknown"
+        
+        feed_type = None
+        if status == "eating":
+            feed_match = FEED_TYPE_PATTERN.search(text)
+            if feed_match:
+                feed_type = feed_match.group(1).strip()
+            else:
+                feed_type = next((f for f in KNOWN_FEEDS if f in text), None)
+        
+        observations.append({"cow": cow, "status": status, "feed_type": feed_type})
+    return observations
+
+def save_analyses(records, on_commit=None):
+    """
+    Save a batch of frame analyses and their parsed cow observations
+    in a single transaction
+    
+    Args:
+        records: List of dicts with job_id, frame, timestamp, analysis
+        on_commit: Called once the batch has been committed
+    """
+    if records:
+        _writer.submit(lambda conn: _insert_analyses(conn, records), on_commit)
+
+def _insert_analyses(conn, records):
+    """Insert analyses and observations on the writer's connection"""
+    observations = []
+    for record in records:
+        analysis = record["analysis"] or ""
+        cursor = conn.execute(
+            """INSERT INTO analyses
+               (job_id, frame, timestamp, analysis, is_error)
+               VALUES (?, ?, ?, ?, ?)""",
+            (record.get("job_id"), record["frame"], record["timestamp"],
+             analysis, int(analysis.startswith("Analysis error")))
+        )
+        for obs in parse_cow_observations(analysis):
+            observations.append((
+                cursor.lastrowid, record.get("job_id"), record["frame"],
+                record["timestamp"], obs["cow"], obs["status"], obs["feed_type"]
+            ))
+    
+    conn.executemany(
+        """INSERT INTO cow_observations
+           (analysis_id, job_id, frame, timestamp, cow, status, feed_type)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        observations
+    )
+
+def get_analysis_history(start=None, end=None, job_id=None, limit=100):
+    """
+    Get frame analyses in a time range, newest first
+    
+    Args:
+        start: ISO timestamp lower bound (inclusive)
+        end: ISO timestamp upper bound (exclusive)
+        job_id: Only analyses from this job
+        limit: Maximum number to return
+        
+    Returns:
+        list: Analysis dictionaries
+    """
+    clauses, params = [], []
+    if start:
+        clauses.append("timestamp >= ?")
+        params.append(start)
+    if end:
+        clauses.append("timestamp < ?")
+        params.append(end)
+    if job_id:
+        clauses.append("job_id = ?")
+        params.append(job_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    
+    _writer.flush()
+    with get_db() as conn:
+        rows = conn.execute(
+            f"""SELECT * FROM analyses {where}
+                ORDER BY timestamp DESC
+                LIMIT ?""",
+            (*params, limit)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+def get_cow_history(cow, start=None, end=None, limit=100):
+    """
+    Get observations of one cow in a time range, newest first
+    
+    Args:
+        cow: Cow number as reported by the analysis ("Cow 3" → 3)
+        start: ISO timestamp lower bound (inclusive)
+        end: ISO timestamp upper bound (exclusive)
+        limit: Maximum number to return
+        
+    Returns:
+        list: Observation dictionaries
+    """
+    clauses, params = ["cow = ?"], [cow]
+    if start:
+        clauses.append("timestamp >= ?")
+        params.append(start)
+    if end:
+        clauses.append("timestamp < ?")
+        params.append(end)
+    
+    _writer.flush()
+    with get_db() as conn:
+        rows = conn.execute(
+            f"""SELECT * FROM cow_observations
+                WHERE {' AND '.join(clauses)}
+                ORDER BY timestamp DESC
+                LIMIT ?""",
+            (*params, limit)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+def get_latest_cow_status():
+    """
+    Get the most recent observation of every cow
+    
+    Returns:
+        dict: {cow_number: observation dict}
+    """
+    _writer.flush()
+    with get_db() as conn:
+        # SQLite fills bare columns from the row holding MAX(); the
+        # (cow, timestamp) index makes this a walk over one entry per cow
+        rows = conn.execute(
+            """SELECT cow, MAX(timestamp) AS timestamp, status, feed_type, frame, job_id
+               FROM cow_observations
+               GROUP BY cow"""
+        ).fetchall()
+        return {r["cow"]: dict(r) for r in rows}
+
+# ────────────────────────────────────────────────────────────
+# Shared State Functions
+# ────────────────────────────────────────────────────────────
+
+def _encode_state(value):
+    """Bytes are stored as a BLOB, numbers as-is, everything else as JSON"""
+    if isinstance(value, (bytes, bytearray)):
+        return sqlite3.Binary(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return json.dumps(value)
+
+def _decode_state(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+def state_get(key, default=None):
+    """
+    Get a shared value (visible to every process using the database)
+    
+    Returns:
+        The stored value, or default if missing or expired
+    """
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT value, expires_at FROM shared_state WHERE key = ?", (key,)
+        ).fetchone()
+    if row is None or (row["expires_at"] is not None and row["expires_at"] <= time.time()):
+        return default
+    return _decode_state(row["value"])
+
+def state_set(key, value, ttl=None):
+    """
+    Store a shared value
+    
+    Args:
+        key: State key
+        value: bytes, number or JSON-serializable value
+        ttl: Seconds until the value expires (None: never)
+    """
+    expires_at = time.time() + ttl if ttl is not None else None
+    with get_db() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, _encode_state(value), expires_at)
+        )
+        conn.commit()
+
+def state_delete(key=None, prefix=None):
+    """Delete one key, or every key starting with prefix"""
+    with get_db() as conn:
+        if prefix is not None:
+            conn.execute("DELETE FROM shared_state WHERE key LIKE ? || '%'", (prefix,))
+        else:
+            conn.execute("DELETE FROM shared_state WHERE key = ?", (key,))
+        conn.commit()
+
+def state_incr(key, amount=1, ttl=None):
+    """
+    Atomically increment a shared counter
+    
+    An expired counter restarts from zero; the expiry is set when the
+    counter is created and not extended by later increments.
+    
+    Returns:
+        int: The new value
+    """
+    now = time.time()
+    expires_at = now + ttl if ttl is not None else None
+    with get_db() as conn:
+        conn.execute(
+            "DELETE FROM shared_state WHERE key = ? AND expires_at <= ?", (key, now)
+        )
+        conn.execute(
+            """INSERT INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)
+               ON CONFLICT(key) DO UPDATE SET value = value + excluded.value""",
+            (key, amount, expires_at)
+        )
+        value = conn.execute(
+            "SELECT value FROM shared_state WHERE key = ?", (key,)
+        ).fetchone()["value"]
+        conn.commit()
+        return value
+
+def state_expiry(key):
+    """Expiry time (time.time() seconds) of a shared value, or None"""
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT expires_at FROM shared_state WHERE key = ?", (key,)
+        ).fetchone()
+        return row["expires_at"] if row else None
+
+def purge_state(event_retention=300):
+    """Delete expired shared values and events older than event_retention seconds"""
+    now = time.time()
+    _writer.flush()
+    with get_db() as conn:
+        conn.execute("DELETE FROM shared_state WHERE expires_at <= ?", (now,))
+        conn.execute("DELETE FROM shared_events WHERE published_at < ?", (now - event_retention,))
+        conn.commit()
+
+def publish_shared_event(event_type, data):
+    """Queue an event for the other processes' event relays"""
+    _writer.submit((
+        """INSERT INTO shared_events (event_type, data, published_at)
+           VALUES (?, ?, ?)""",
+        (event_type, json.dumps(data), time.time())
+    ))
+
+def get_shared_events(after_id=0, limit=500):
+    """
+    Get shared events published after an event id, oldest first
+    
+    Returns:
+        list: [{"id", "event_type", "data", "published_at"}, ...]
+    """
+    _writer.flush()
+    with get_db() as conn:
+        rows = conn.execute(
+            """SELECT * FROM shared_events WHERE id > ?
+               ORDER BY id LIMIT ?""",
+            (after_id, limit)
+        ).fetchall()
+    events = []
+    for r in rows:
+        event = dict(r)
+        event["data"] = json.loads(event["data"])
+        events.append(event)
+    return events
+
+def last_shared_event_id():
+    """Id of the most recent shared event (0 if none)"""
+    _writer.flush()
+    with get_db() as conn:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) AS id FROM shared_events").fetchone()["id"]
+
+# ────────────────────────────────────────────────────────────
+# Video Job Functions
+# ────────────────────────────────────────────────────────────
+
+def _job_row(row):
+    job = dict(row)
+    job["source"] = json.loads(job["source"])
+    job["snapshot"] = json.loads(job["snapshot"]) if job["snapshot"] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+def enqueue_video_job(job_id, source):
+    """
+    Queue a video analysis job for the video worker
+    
+    Args:
+        job_id: New job id
+        source: {"type": "file", "path": ...} or {"type": "webcam", "camera": ..., "duration": ...}
+    """
+    now = datetime.now().isoformat()
+    with get_db() as conn:
+        conn.execute(
+            """INSERT INTO video_jobs (id, source, created_at, updated_at)
+               VALUES (?, ?, ?, ?)""",
+            (job_id, json.dumps(source), now, now)
+        )
+        conn.commit()
+
+def claim_video_job(worker_pid=None):
+    """
+    Atomically take the oldest queued job
+    
+    Args:
+        worker_pid: Process id of the process that will run it
+        
+    Returns:
+        dict or None: The job, now marked "processing" (resume_frame says
+        where an interrupted earlier attempt left off)
+    """
+    with get_db() as conn:
+        while True:
+            row = conn.execute(
+                """SELECT id FROM video_jobs WHERE status = 'queued'
+                   ORDER BY created_at LIMIT 1"""
+            ).fetchone()
+            if row is None:
+                return None
+            # Another worker may claim the same job between the two statements
+            cursor = conn.execute(
+                """UPDATE video_jobs
+                   SET status = 'processing', attempts = attempts + 1, worker_pid = ?,
+                       heartbeat_at = ?, updated_at = ?
+                   WHERE id = ? AND status = 'queued'""",
+                (worker_pid, time.time(), datetime.now().isoformat(), row["id"])
+            )
+            conn.commit()
+            if cursor.rowcount:
+                return _job_row(conn.execute(
+                    "SELECT * FROM video_jobs WHERE id = ?", (row["id"],)
+                ).fetchone())
+
+def update_video_job(job_id, status=None, snapshot=None, progress=None, resume_frame=None,
+                     heartbeat=False):
+    """
+    Record a job's status, latest get_status() snapshot and progress
+    
+    Args:
+        job_id: Job id
+        status: New status (None: unchanged)
+        snapshot: VideoProcessor.get_status() dict
+        progress: Fraction of the video processed (0-1)
+        resume_frame: Last frame whose analysis is stored
+        heartbeat: Also record that the job's process is alive
+    """
+    with get_db() as conn:
+        conn.execute(
+            """UPDATE video_jobs
+               SET status = COALESCE(?, status), snapshot = COALESCE(?, snapshot),
+                   progress = COALESCE(?, progress), resume_frame = COALESCE(?, resume_frame),
+                   heartbeat_at = CASE WHEN ? THEN ? ELSE heartbeat_at END, updated_at = ?
+               WHERE id = ?""",
+            (status, json.dumps(snapshot) if snapshot is not None else None,
+             progress, resume_frame, int(heartbeat), time.time(),
+             datetime.now().isoformat(), job_id)
+        )
+        conn.commit()
+
+def requeue_video_jobs(max_attempts, job_id=None, stale_before=None):
+    """
+    Recover "processing" jobs whose process died
+    
+    Each job goes back to the queue (to resume from its resume_frame) until
+    it has been attempted max_attempts times, then fails. Jobs whose stop
+    was requested are marked stopped instead.
+    
+    Args:
+        max_attempts: Attempts allowed per job
+        job_id: Recover this job (its process exited without finishing it)
+        stale_before: Recover jobs with no heartbeat since this time.time()
+        
+    Returns:
+        list: (job id, new status) tuples
+    """
+    if job_id is not None:
+        where, params = "id = ?", (job_id,)
+    else:
+        where, params = "COALESCE(heartbeat_at, 0) < ?", (stale_before,)
+    with get_db() as conn:
+        rows = conn.execute(
+            f"""SELECT id, attempts, cancel_requested FROM video_jobs
+                WHERE status = 'processing' AND {where}""",
+            params
+        ).fetchall()
+        recovered = []
+        for row in rows:
+            if row["cancel_requested"]:
+                status = "stopped"
+            elif row["attempts"] < max_attempts:
+                status = "queued"
+            else:
+                status = "error"
+            cursor = conn.execute(
+                """UPDATE video_jobs SET status = ?, worker_pid = NULL, updated_at = ?
+                   WHERE id = ? AND status = 'processing'""",
+                (status, datetime.now().isoformat(), row["id"])
+            )
+            if cursor.rowcount:
+                recovered.append((row["id"], status))
+        conn.commit()
+        return recovered
+
+def cancel_video_jobs(job_id=None):
+    """
+    Ask the video worker to stop a job (or every unfinished job)
+    
+    Queued jobs are marked stopped straight away.
+    
+    Returns:
+        int: Number of jobs affected
+    """
+    where, params = "status IN ('queued', 'processing')", ()
+    if job_id is not None:
+        where += " AND id = ?"
+        params = (job_id,)
+    with get_db() as conn:
+        count = conn.execute(
+            f"UPDATE video_jobs SET cancel_requested = 1, updated_at = ? WHERE {where}",
+            (datetime.now().isoformat(), *params)
+        ).rowcount
+        conn.execute(
+            "UPDATE video_jobs SET status = 'stopped' WHERE cancel_requested = 1 AND status = 'queued'"
+        )
+        conn.commit()
+        return count
+
+def get_video_job(job_id):
+    """Get one video job, or None"""
+    with get_db() as conn:
+        row = conn.execute("SELECT * FROM video_jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_row(row) if row else None
+
+def get_video_jobs(status=None, limit=50):
+    """
+    Get video jobs, newest first
+    
+    Args:
+        status: Only jobs with this status (or a tuple of statuses)
+        limit: Maximum number to return
+    """
+    clauses, params = [], []
+    if status is not None:
+        statuses = (status,) if isinstance(status, str) else tuple(status)
+        clauses.append(f"status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with get_db() as conn:
+        rows = conn.execute(
+            f"SELECT * FROM video_jobs {where} ORDER BY created_at DESC LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+        return [_job_row(r) for r in rows]
+
 # ────────────────────────────────────────────────────────────
 # Statistics
 # ────────────────────────────────────────────────────────────
 
 def get_stats():
     """Get database statistics"""
+    _writer.flush()
     with get_db() as conn:
         conv_count = conn.execute(
             "SELECT COUNT(*) as count FROM conversations"
@@ -219,10 +1226,15 @@ def get_stats():
             "SELECT COUNT(DISTINCT phone) as count FROM conversations"
         ).fetchone()["count"]
         
+        analysis_count = conn.execute(
+            "SELECT COUNT(*) as count FROM analyses"
+        ).fetchone()["count"]
+        
         return {
             "total_messages": conv_count,
             "active_phones": phone_count,
-            "unresolved_alerts": alert_count
+            "unresolved_alerts": alert_count,
+            "total_analyses": analysis_count
         }
 
 # Initialize database on import
@@ -0,0 +1,133 @@
+"""
+In-process event bus for HerdWatch
+VideoProcessor publishes status/analysis/frame updates; HTTP readers and the
+/events Server-Sent Events stream consume them without touching the disk
+"""
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ────────────────────────────────────────────────────────────
+# Configuration
+# ────────────────────────────────────────────────────────────
+
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", 100))  # Per-subscriber backlog
+SSE_KEEPALIVE_SECONDS = int(os.getenv("SSE_KEEPALIVE_SECONDS", 15))
+
+
+class Subscription:
+    """A subscriber's bounded event queue (oldest events dropped when full)"""
+
+    def __init__(self, maxsize=EVENT_BUFFER_SIZE):
+        self._queue = queue.Queue(maxsize=max(1, maxsize))
+        self.dropped = 0
+
+    def put(self, event):
+        while True:
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Next event, or None if nothing arrived within timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """Publish/subscribe hub that also remembers the latest event of each type"""
+
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subscribers = set()
+        self._forwarders = []  # callback(event_type, data), e.g. to other processes
+        self._latest = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, data):
+        """
+        Publish an event to every subscriber
+
+        Args:
+            event_type: "status", "analysis", "frame", ...
+            data: JSON-serializable payload
+        """
+        with self._lock:
+            event = {
+                "id": next(self._ids),
+                "type": event_type,
+                "data": data,
+                "published_at": time.time(),
+            }
+            self._latest[event_type] = event
+            subscribers = list(self._subscribers)
+            forwarders = list(self._forwarders)
+
+        for subscription in subscribers:
+            subscription.put(event)
+        for forward in forwarders:
+            try:
+                forward(event_type, data)
+            except Exception as e:
+                print(f"Error forwarding {event_type} event: {e}")
+        return event
+
+    def forward(self, callback):
+        """Also pass every published event to callback(event_type, data)"""
+        with self._lock:
+            self._forwarders.append(callback)
+
+    def subscribe(self):
+        """Register a new subscriber"""
+        subscription = Subscription(self.buffer_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def latest(self, event_type, default=None):
+        """Payload of the most recent event of a type (no disk access)"""
+        with self._lock:
+            event = self._latest.get(event_type)
+        return event["data"] if event else default
+
+    def snapshot(self):
+        """Most recent event of every type, oldest first (for new subscribers)"""
+        with self._lock:
+            return sorted(self._latest.values(), key=lambda e: e["id"])
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+def format_sse(event):
+    """Serialize an event in text/event-stream format"""
+    return (
+        f"id: {event['id']}\n"
+        f"event: {event['type']}\n"
+        f"data: {json.dumps(event['data'])}\n\n"
+    )
+
+
+# Global event bus instance
+event_bus = EventBus()
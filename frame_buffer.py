@@ -0,0 +1,230 @@
+"""
+Latest analyzed frame and live preview stream for HerdWatch
+Each sampled frame is JPEG-encoded once in the video pipeline; the same bytes
+are sent to the model and served by /video/current-frame, which answers
+repeat polls for an unchanged frame with 304 Not Modified. The decode loop
+also feeds a low-resolution MJPEG preview (/video/stream) at its own rate.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from events import Subscription
+
+load_dotenv()
+
+# ────────────────────────────────────────────────────────────
+# Configuration
+# ────────────────────────────────────────────────────────────
+
+CURRENT_FRAME_FILE = "current_frame.jpg"  # Snapshot for readers in other processes
+MAX_FRAME_SOURCES = 16  # Jobs whose latest frame is kept
+
+PREVIEW_WIDTH = int(os.getenv("PREVIEW_WIDTH", 640))  # Pixels; height keeps the aspect ratio
+PREVIEW_FPS = float(os.getenv("PREVIEW_FPS", 5))
+PREVIEW_JPEG_QUALITY = int(os.getenv("PREVIEW_JPEG_QUALITY", 70))
+PREVIEW_CLIENT_BUFFER = int(os.getenv("PREVIEW_CLIENT_BUFFER", 2))  # Frames queued per viewer
+PREVIEW_RESEND_SECONDS = 15  # Repeat the last frame while idle to detect closed viewers
+PREVIEW_IDLE_TIMEOUT = int(os.getenv("PREVIEW_IDLE_TIMEOUT", 60))  # Seconds without a frame to send before a viewer is closed
+PREVIEW_BOUNDARY = "frame"
+
+
+def encode_jpeg(frame, quality=None):
+    """
+    Encode a frame as JPEG
+
+    Args:
+        frame: BGR image
+        quality: JPEG quality 0-100 (default: OpenCV's 95)
+
+    Returns:
+        bytes: JPEG data
+    """
+    params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)] if quality is not None else []
+    ok, buffer = cv2.imencode(".jpg", frame, params)
+    if not ok:
+        raise ValueError("Could not encode frame as JPEG")
+    return buffer.tobytes()
+
+
+class LatestFrame:
+    """Most recent frame of each job, kept as encoded JPEG bytes
+
+    Every published frame gets a new ETag (unique across restarts), so HTTP
+    clients can revalidate with If-None-Match instead of downloading the
+    same image again.
+    """
+
+    def __init__(self, max_sources=MAX_FRAME_SOURCES):
+        self.max_sources = max(1, int(max_sources))
+        self._frames = OrderedDict()  # job_id -> frame, least recently updated first
+        self._latest = None
+        self._epoch = format(int(time.time() * 1000), "x")
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, jpeg, frame_num=None, job_id=None, etag=None):
+        """
+        Replace the latest frame of a job
+
+        Args:
+            jpeg: Encoded JPEG bytes
+            frame_num: Frame number within the source
+            job_id: Job the frame belongs to
+            etag: Keep the ETag assigned by another process (default: new one)
+
+        Returns:
+            dict: {"jpeg", "etag", "frame", "job_id", "timestamp"}
+        """
+        frame = {
+            "jpeg": jpeg,
+            "etag": etag or f"{self._epoch}-{next(self._versions)}",
+            "frame": frame_num,
+            "job_id": job_id,
+            "timestamp": time.time(),
+        }
+        with self._lock:
+            self._frames[job_id] = frame
+            self._frames.move_to_end(job_id)
+            while len(self._frames) > self.max_sources:
+                self._frames.popitem(last=False)
+            self._latest = frame
+        return frame
+
+    def get(self, job_id=None):
+        """Latest frame of a job, or of any job when job_id is None"""
+        with self._lock:
+            return self._latest if job_id is None else self._frames.get(job_id)
+
+    def image(self, job_id=None):
+        """Latest frame decoded to a BGR image, or None"""
+        frame = self.get(job_id)
+        if frame is None:
+            return None
+        return cv2.imdecode(np.frombuffer(frame["jpeg"], dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class PreviewStream:
+    """MJPEG preview fed by the video decode loops
+
+    The decode loop asks ``wants_frame()`` before doing any work, so frames
+    are only retrieved, scaled and encoded while someone is watching, at
+    most ``fps`` times per second per job, and each frame is encoded once
+    for all viewers. Every viewer has a small bounded queue; a slow viewer
+    loses its oldest frames instead of delaying the decoder or other viewers.
+
+    A viewer without a job id follows the job that most recently started
+    sending preview frames (falling back to the newest remaining one when
+    it finishes), so several running jobs are never interleaved.
+    """
+
+    def __init__(self, width=PREVIEW_WIDTH, fps=PREVIEW_FPS, quality=PREVIEW_JPEG_QUALITY,
+                 client_buffer=PREVIEW_CLIENT_BUFFER):
+        self.width = max(1, int(width))
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.quality = quality
+        self.client_buffer = max(1, int(client_buffer))
+        self._viewers = {}  # Subscription -> job_id (None: the followed job)
+        self._last_sent = {}  # job_id -> time.monotonic() of the last preview frame
+        self._latest = {}  # job_id -> last multipart chunk, oldest job first
+        self._followed = None  # Job shown to viewers without a job id
+        self._lock = threading.Lock()
+        self.stats = {"frames": 0, "dropped": 0}
+
+    def wants_frame(self, job_id=None):
+        """True if a viewer is watching this job and a preview frame is due"""
+        with self._lock:
+            # A job's first frame is always wanted by followers: it takes over
+            followed = job_id == self._followed or job_id not in self._latest
+            if not any(j == job_id or (j is None and followed) for j in self._viewers.values()):
+                return False
+            return time.monotonic() - self._last_sent.get(job_id, 0.0) >= self.interval
+
+    def publish(self, frame, job_id=None):
+        """Scale and encode a decoded frame once and queue it for every viewer of the job"""
+        height, width = frame.shape[:2]
+        if width > self.width:
+            frame = cv2.resize(frame, (self.width, max(1, height * self.width // width)),
+                               interpolation=cv2.INTER_AREA)
+        jpeg = encode_jpeg(frame, self.quality)
+        chunk = (
+            f"--{PREVIEW_BOUNDARY}\r\n"
+            f"Content-Type: image/jpeg\r\n"
+            f"Content-Length: {len(jpeg)}\r\n\r\n"
+        ).encode() + jpeg + b"\r\n"
+
+        with self._lock:
+            if job_id not in self._latest:
+                self._followed = job_id  # Newest job takes over the default preview
+            self._last_sent[job_id] = time.monotonic()
+            self._latest[job_id] = chunk
+            followed = job_id == self._followed
+            viewers = [s for s, j in self._viewers.items() if j == job_id or (j is None and followed)]
+            self.stats["frames"] += 1
+
+        for subscription in viewers:
+            subscription.put(chunk)
+
+    def stream(self, job_id=None):
+        """
+        Generate the multipart/x-mixed-replace body for one viewer
+
+        Args:
+            job_id: Only show this job's frames (default: the followed job)
+
+        Yields:
+            bytes: One multipart JPEG part per preview frame
+
+        A closed viewer is only noticed when a write fails, so while there
+        is nothing to show (the last frame is resent otherwise) the stream
+        ends after PREVIEW_IDLE_TIMEOUT seconds.
+        """
+        subscription = Subscription(self.client_buffer)
+        with self._lock:
+            self._viewers[subscription] = job_id
+            latest = self._latest_chunk(job_id)
+        try:
+            idle_since = None
+            if latest is not None:
+                yield latest
+            while True:
+                chunk = subscription.get(timeout=PREVIEW_RESEND_SECONDS)
+                if chunk is None:
+                    with self._lock:
+                        chunk = self._latest_chunk(job_id)
+                if chunk is None:
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since >= PREVIEW_IDLE_TIMEOUT:
+                        return
+                    continue
+                idle_since = None
+                yield chunk
+        finally:
+            with self._lock:
+                self._viewers.pop(subscription, None)
+                self.stats["dropped"] += subscription.dropped
+
+    def _latest_chunk(self, job_id):
+        return self._latest.get(self._followed if job_id is None else job_id)
+
+    def finish(self, job_id):
+        """Forget a finished job (its viewers stay connected for a while for the next one)"""
+        with self._lock:
+            self._last_sent.pop(job_id, None)
+            self._latest.pop(job_id, None)
+            if self._followed == job_id:
+                self._followed = next(reversed(self._latest), None)
+
+    def viewer_count(self):
+        with self._lock:
+            return len(self._viewers)
+
+
+# Global latest-frame holder and preview stream
+latest_frame = LatestFrame()
+preview_stream = PreviewStream()
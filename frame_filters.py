@@ -0,0 +1,202 @@
+"""
+Frame filtering helpers for HerdWatch video analysis
+Cheap image checks that decide whether a frame needs a model call
+"""
+
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# ────────────────────────────────────────────────────────────
+# Perceptual Hashing
+# ────────────────────────────────────────────────────────────
+
+def dhash(frame, hash_size=8):
+    """
+    Compute a difference hash (dHash) of a frame
+
+    The frame is shrunk to (hash_size + 1) x hash_size grayscale pixels and
+    each bit records whether a pixel is brighter than its right neighbour,
+    so small noise/compression changes leave most bits untouched.
+
+    Args:
+        frame: BGR or grayscale image (numpy array)
+        hash_size: Bits per row/column (8 gives a 64-bit hash)
+
+    Returns:
+        int: Hash value
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), "big")
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count("1")
+
+# ────────────────────────────────────────────────────────────
+# Near-Duplicate Cache
+# ────────────────────────────────────────────────────────────
+
+class FrameHashCache:
+    """LRU cache of analyses keyed by perceptual hash with fuzzy lookup"""
+
+    def __init__(self, max_entries=64, threshold=5):
+        """
+        Args:
+            max_entries: Maximum hashes kept before evicting the least recently used
+            threshold: Maximum Hamming distance for two frames to count as the same
+        """
+        self.max_entries = max(1, int(max_entries))
+        self.threshold = int(threshold)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, frame_hash):
+        """
+        Find a cached value for a near-identical frame
+
+        Args:
+            frame_hash: Hash from dhash()
+
+        Returns:
+            Cached value, or None on a miss
+        """
+        with self._lock:
+            # Newest entries first: consecutive frames are the likeliest match
+            for key in reversed(self._entries):
+                if hamming_distance(key, frame_hash) <= self.threshold:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+            self.misses += 1
+            return None
+
+    def store(self, frame_hash, value):
+        """Cache a value for a frame hash, evicting the oldest entry if full"""
+        with self._lock:
+            self._entries[frame_hash] = value
+            self._entries.move_to_end(frame_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, frame_hash, value=None):
+        """Remove a hash (only if it still maps to ``value`` when given)"""
+        with self._lock:
+            if frame_hash in self._entries and (value is None or self._entries[frame_hash] is value):
+                del self._entries[frame_hash]
+
+    def clear(self):
+        """Drop all cached entries (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Get hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+# ────────────────────────────────────────────────────────────
+# Motion Gating
+# ────────────────────────────────────────────────────────────
+
+class MotionGate:
+    """Frame-differencing motion detector that gates expensive analysis"""
+
+    def __init__(self, threshold=0.02, pixel_threshold=25, max_staleness=60, size=(160, 120)):
+        """
+        Args:
+            threshold: Fraction of changed pixels (0-1) that counts as motion
+            pixel_threshold: Minimum grayscale difference for a pixel to count as changed
+            max_staleness: Seconds after which a frame passes even without motion
+            size: (width, height) the frames are downscaled to before comparing
+        """
+        self.threshold = float(threshold)
+        self.pixel_threshold = int(pixel_threshold)
+        self.max_staleness = float(max_staleness)
+        self.size = tuple(size)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget the reference frame and counters (start of a new stream)"""
+        with self._lock:
+            self._reference = None
+            self._last_passed = None
+            self.last_score = 0.0
+            self.passed_motion = 0
+            self.passed_stale = 0
+            self.skipped = 0
+
+    def _prepare(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def check(self, frame, timestamp):
+        """
+        Decide whether a frame should be analyzed
+
+        Frames are compared against the last frame that passed the gate, so
+        slow changes accumulate until they cross the threshold.
+
+        Args:
+            frame: BGR image
+            timestamp: Seconds (video position or wall clock) used for staleness
+
+        Returns:
+            bool: True if the frame should be sent for analysis
+        """
+        current = self._prepare(frame)
+        with self._lock:
+            if self._reference is None:
+                self._reference = current
+                self._last_passed = timestamp
+                self.passed_motion += 1
+                return True
+
+            diff = cv2.absdiff(current, self._reference)
+            self.last_score = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+            if self.last_score >= self.threshold:
+                self.passed_motion += 1
+            elif timestamp - self._last_passed >= self.max_staleness:
+                self.passed_stale += 1
+            else:
+                self.skipped += 1
+                return False
+
+            self._reference = current
+            self._last_passed = timestamp
+            return True
+
+    def stats(self):
+        """Get gate counters"""
+        with self._lock:
+            checked = self.passed_motion + self.passed_stale + self.skipped
+            return {
+                "threshold": self.threshold,
+                "max_staleness": self.max_staleness,
+                "last_score": round(self.last_score, 4),
+                "passed_motion": self.passed_motion,
+                "passed_stale": self.passed_stale,
+                "skipped": self.skipped,
+                "skip_rate": round(self.skipped / checked, 3) if checked else 0.0,
+            }
@@ -3,8 +3,9 @@
    Full API integration with all Flask endpoints.
    Endpoints used:
      GET  /api/health        → check if backend is running
-     GET  /analysis/status    → poll every 5s
-     GET  /analysis/log       → load frame log
+     GET  /events             → live updates (Server-Sent Events)
+     GET  /analysis/status    → poll every 5s (fallback when /events is down)
+     GET  /analysis/log       → load frame log (?since=cursor for new entries)
      POST /test               → AI chat
      POST /send               → send SMS (use_ai toggle)
      GET  /conversations      → load all threads
@@ -47,6 +48,7 @@ const state = {
     { id: "COW-600", name: "Cow #600", status: "eating", detail: "Tag 600 · Black & white", tag: "600" },
   ],
   conversations: {},
+  convOffset: 0,
   chartData: [],
   recentSends: [],
   herdFilter: "all",
@@ -201,10 +203,19 @@ function updateStatusUI(d) {
 
 // ─── GET /analysis/log ────────────────────────────────────────
 async function loadAnalysisLog() {
-  const lines = document.getElementById("logLines")?.value || 100;
+  const lines = parseInt(document.getElementById("logLines")?.value || 100);
   try {
-    const data = await apiGet(`/analysis/log?lines=${lines}`);
-    state.logEntries = data.entries || [];
+    // After the first load, only fetch entries newer than our cursor
+    const incremental = state.logCursor != null && state.logLines === lines;
+    const data = await apiGet(incremental
+      ? `/analysis/log?since=${state.logCursor}&lines=${lines}`
+      : `/analysis/log?lines=${lines}`);
+    const entries = data.entries || [];
+    state.logEntries = (incremental && !data.truncated)
+      ? state.logEntries.concat(entries).slice(-lines)
+      : entries;
+    state.logCursor = data.cursor;
+    state.logLines = lines;
     document.getElementById("totalFrames").textContent =
       data.total ? data.total.toLocaleString() : "0";
     renderLogTable();
@@ -230,7 +241,7 @@ function renderLogTable() {
   tbody.innerHTML = entries.map(e => `
     <tr class="${e.is_error ? "is-error" : ""}">
       <td style="white-space:nowrap">${e.timestamp || "—"}</td>
-      <td><span class="frame-badge">${e.frame || "—"}</span></td>
+      <td><span class="frame-badge" title="${e.job_id ? `Job ${e.job_id}` : ""}">${e.frame || "—"}</span></td>
       <td>${e.analysis}</td>
       <td>${e.is_error
       ? `<span class="status-badge-err">Error</span>`
@@ -518,7 +529,9 @@ async function sendSMS() {
 
   try {
     const data = await apiPost("/send", { recipients, message, use_ai });
-    feedback.textContent = `✓ Sent to ${data.recipients?.join(", ") || recipients}`;
+    feedback.textContent = data.failed
+      ? `⚠ Sent to ${data.sent} of ${data.sent + data.failed} recipients (${data.failed} failed)`
+      : `✓ Sent to ${data.recipients?.join(", ") || recipients}`;
     feedback.className = "sms-feedback ok";
     showToast("SMS sent successfully", "success");
 
@@ -569,13 +582,20 @@ document.addEventListener("DOMContentLoaded", () => {
 });
 
 // ─── GET /conversations ───────────────────────────────────────
-async function loadConversations() {
+// Conversations are paged by phone; "Load more" fetches the next page
+async function loadConversations(append = false) {
   const list = document.getElementById("convList");
-  list.innerHTML = `<div class="conv-empty">Loading…</div>`;
+  if (!append) {
+    state.conversations = {};
+    state.convOffset = 0;
+    list.innerHTML = `<div class="conv-empty">Loading…</div>`;
+  }
 
   try {
-    const data = await apiGet("/conversations");
-    state.conversations = data.conversations || {};
+    const data = await apiGet(`/conversations?offset=${state.convOffset || 0}`);
+    const page = data.conversations || {};
+    Object.assign(state.conversations, page);
+    state.convOffset = (state.convOffset || 0) + Object.keys(page).length;
     const phones = Object.keys(state.conversations);
 
     if (!phones.length) {
@@ -593,7 +613,11 @@ async function loadConversations() {
           <div class="conv-item-count">${msgs.length} message${msgs.length !== 1 ? "s" : ""}</div>
         </div>
       `;
-    }).join("");
+    }).join("") + (data.has_more ? `
+        <div class="conv-item" onclick="loadConversations(true)">
+          <div class="conv-item-preview">Load more (${data.total_conversations - phones.length} remaining)</div>
+        </div>
+      ` : "");
   } catch (err) {
     list.innerHTML = `<div class="conv-empty">⚠ Could not load conversations.<br/>Make sure Flask is running.</div>`;
   }
@@ -711,6 +735,39 @@ function handleVideoFileSelect() {
   document.getElementById("uploadBtn").style.display = "block";
 }
 
+const UPLOAD_MAX_RETRIES = 5;  // Per chunk, with growing delays, before giving up
+
+function setUploadProgress(offset, size) {
+  const pct = size ? Math.floor(offset * 100 / size) : 0;
+  document.getElementById("pbFill").style.width = `${pct}%`;
+  document.getElementById("pbText").textContent = `${pct}%`;
+}
+
+// Send one chunk; on a network error or offset conflict, ask the server how
+// much it has and continue from there
+async function putUploadChunk(upload, offset) {
+  const chunk = selectedFile.slice(offset, Math.min(offset + upload.chunk_size, upload.size));
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const r = await fetch(API_BASE + `/video/uploads/${upload.upload_id}?offset=${offset}`, {
+        method: "PUT",
+        headers: { "Content-Type": "application/octet-stream" },
+        body: chunk,
+      });
+      const json = await r.json();
+      if (r.ok || (r.status === 409 && json.offset !== undefined)) return json.offset;
+      throw new Error(json.error || `Chunk upload failed: ${r.status}`);
+    } catch (e) {
+      if (attempt >= UPLOAD_MAX_RETRIES) throw e;
+      debug.error(`Chunk at ${offset} failed, retrying`, e);
+      await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+      try {
+        return (await apiGet(`/video/uploads/${upload.upload_id}`)).offset;
+      } catch (_) { /* still offline: resend the same chunk */ }
+    }
+  }
+}
+
 async function uploadVideo() {
   if (!selectedFile) {
     showToast("No file selected", "error");
@@ -718,28 +775,43 @@ async function uploadVideo() {
   }
   
   try {
-    const formData = new FormData();
-    formData.append("file", selectedFile);
-    
     document.getElementById("uploadProgress").style.display = "block";
     
-    const response = await fetch(API_BASE + "/video/upload", {
-      method: "POST",
-      body: formData,
+    // Chunked, resumable upload; re-selecting the same file after a failure
+    // continues where the server left off
+    const upload = await apiPost("/video/uploads", {
+      filename: selectedFile.name,
+      size: selectedFile.size,
     });
+    let offset = upload.offset;
+    let processing = false;
+    setUploadProgress(offset, upload.size);
     
-    if (!response.ok) throw new Error(`Upload failed: ${response.status}`);
+    while (offset < upload.size) {
+      offset = await putUploadChunk(upload, offset);
+      setUploadProgress(offset, upload.size);
+      
+      // Start analysis as soon as the first chunk is in; it follows the upload
+      if (!processing) {
+        processing = true;
+        try {
+          await apiPost("/video/process", { source: "file", filename: upload.filename });
+          showToast("Processing started while uploading", "success");
+          pollVideoStatus();
+        } catch (e) {
+          showToast(`Could not start processing: ${e.message}`, "error");
+        }
+      }
+    }
     
-    const json = await response.json();
+    await apiPost(`/video/uploads/${upload.upload_id}/complete`, {});
     showToast("Video uploaded successfully!", "success");
     
-    // Start processing
-    await apiPost("/video/process", {
-      source: "file",
-      filename: json.filename,
-    });
+    if (!processing) {  // Resumed upload that was already complete
+      await apiPost("/video/process", { source: "file", filename: upload.filename });
+      showToast("Processing started", "success");
+    }
     
-    showToast("Processing started", "success");
     selectedFile = null;
     document.getElementById("videoFileInput").value = "";
     document.getElementById("fileInfo").style.display = "none";
@@ -891,27 +963,62 @@ state.feedType = "—";
 state.feedTime = "—";
 state.alerts = [];
 state.lastFramePoolTime = 0;
+state.frameEtag = null;
+state.previewStreaming = false;
+
+// Live preview: while a job is running the <img> shows the MJPEG stream
+// from /video/stream; otherwise it shows the last analyzed frame
+function startLivePreview() {
+  if (state.previewStreaming) return;
+  state.previewStreaming = true;
+  const img = document.getElementById("liveFrameImg");
+  img.onerror = stopLivePreview;
+  if (img.src.startsWith("blob:")) URL.revokeObjectURL(img.src);
+  img.src = API_BASE + "/video/stream";
+  img.style.display = "block";
+  document.getElementById("frameNotAvailable").style.display = "none";
+}
+
+function stopLivePreview() {
+  if (!state.previewStreaming) return;
+  state.previewStreaming = false;
+  const img = document.getElementById("liveFrameImg");
+  img.onerror = null;
+  img.removeAttribute("src");  // Closes the stream
+  state.frameEtag = null;
+  state.lastFramePoolTime = 0;
+  pollLiveFrame();
+}
 
 // Live frame viewer - poll every 3 seconds
 function pollLiveFrame() {
+  if (state.previewStreaming) return;  // The MJPEG stream is already updating the image
   const now = Date.now();
   if (now - state.lastFramePoolTime < 3000) return; // Skip if polled recently
   
   state.lastFramePoolTime = now;
   
-  fetch(API_BASE + "/video/current-frame")
+  // Revalidate with the last ETag: 304 means the frame hasn't changed
+  const headers = state.frameEtag ? { "If-None-Match": state.frameEtag } : {};
+  fetch(API_BASE + "/video/current-frame", { headers, cache: "no-store" })
     .then(r => {
-      if (r.ok) return r.blob();
+      if (r.status === 304) return null;
+      if (r.ok) {
+        state.frameEtag = r.headers.get("ETag");
+        return r.blob();
+      }
       throw new Error("No frame");
     })
     .then(blob => {
-      const url = URL.createObjectURL(blob);
+      if (!blob) return;
       const img = document.getElementById("liveFrameImg");
-      img.src = url;
+      if (img.src.startsWith("blob:")) URL.revokeObjectURL(img.src);
+      img.src = URL.createObjectURL(blob);
       img.style.display = "block";
       document.getElementById("frameNotAvailable").style.display = "none";
     })
     .catch(() => {
+      state.frameEtag = null;
       document.getElementById("liveFrameImg").style.display = "none";
       document.getElementById("frameNotAvailable").style.display = "flex";
     });
@@ -1075,8 +1182,11 @@ function updateErrorBadge() {
 async function enhancedPollAnalysisStatus() {
   // Await the original async fetch so state.analysisStatus is populated before we act
   await pollAnalysisStatus();
-  
-  // Now state.analysisStatus is guaranteed to be updated
+  applyAnalysisFeatures();
+}
+
+// Run feature hooks against the current state.analysisStatus
+function applyAnalysisFeatures() {
   if (state.analysisStatus) {
     parseFeedType(state.analysisStatus.analysis);
     syncHerdStatus();
@@ -1084,11 +1194,99 @@ async function enhancedPollAnalysisStatus() {
     updateErrorBadge();
     checkForAnomalies();
     updateLiveFrameAnalysis();
-    pollLiveFrame();
+    if (!state.eventsConnected) pollLiveFrame();
     updateConnectionStatus(state.backendHealthy);
   }
 }
 
+// ─── GET /events  (Server-Sent Events) ───────────────────────
+// Pushes status, analysis and frame updates; polling only runs while the
+// stream is disconnected.
+function connectEvents() {
+  if (!window.EventSource) return false;
+
+  const source = new EventSource(API_BASE + "/events");
+
+  source.onopen = () => {
+    debug.log("Live event stream connected");
+    state.eventsConnected = true;
+    stopPolling();
+  };
+
+  source.onerror = () => {
+    // EventSource reconnects on its own; poll in the meantime
+    if (state.eventsConnected) debug.warn("Live event stream lost, falling back to polling");
+    state.eventsConnected = false;
+    startPolling();
+  };
+
+  source.addEventListener("analysis", (e) => {
+    const data = JSON.parse(e.data);
+    state.analysisStatus = data;
+    updateStatusUI(data);
+    applyAnalysisFeatures();
+    if (data.status === "running") appendLogEntry(data);
+  });
+
+  source.addEventListener("status", (e) => {
+    const data = JSON.parse(e.data);
+    const procStatus = document.getElementById("procStatus");
+    if (procStatus) {
+      procStatus.textContent = data.status || "idle";
+      document.getElementById("procFrames").textContent = data.frame_count || "0";
+      document.getElementById("procAnalysis").textContent = (data.latest_analysis || "—").substring(0, 100);
+    }
+    if (data.is_processing) startLivePreview();
+    else {
+      stopLivePreview();
+      loadHerdData();
+    }
+  });
+
+  source.addEventListener("frame", () => {
+    state.lastFramePoolTime = 0;  // New frame available: bypass the poll throttle
+    pollLiveFrame();
+  });
+
+  state.eventSource = source;
+  return true;
+}
+
+// Add a pushed analysis to the log table without re-fetching /analysis/log
+function appendLogEntry(data) {
+  const ts = data.timestamp ? new Date(data.timestamp) : new Date();
+  const pad = (n) => String(n).padStart(2, "0");
+  state.logEntries.push({
+    timestamp: `${ts.getFullYear()}-${pad(ts.getMonth() + 1)}-${pad(ts.getDate())} ` +
+               `${pad(ts.getHours())}:${pad(ts.getMinutes())}:${pad(ts.getSeconds())}`,
+    job_id: data.job_id || null,
+    frame: data.frame_count || 0,
+    analysis: data.analysis || "",
+    is_error: (data.analysis || "").startsWith("Analysis error"),
+  });
+  const limit = parseInt(document.getElementById("logLines")?.value || 100);
+  if (state.logEntries.length > limit) state.logEntries.splice(0, state.logEntries.length - limit);
+  renderLogTable();
+}
+
+// Polling loops — only used while the event stream is unavailable
+function startPolling() {
+  if (state.pollTimers) return;
+  state.logCursor = null;  // Pushed log entries aren't cursor-tracked: reload in full
+  state.pollTimers = [
+    setInterval(enhancedPollAnalysisStatus, POLL_INTERVAL),
+    setInterval(loadAnalysisLog, LOG_POLL_INTERVAL),
+    setInterval(loadHerdData, 10000), // Poll herd data every 10 seconds
+    setInterval(pollLiveFrame, 3000),
+  ];
+}
+
+function stopPolling() {
+  if (!state.pollTimers) return;
+  state.pollTimers.forEach(clearInterval);
+  state.pollTimers = null;
+}
+
 // Add chat context indicator to chat input area
 function updateChatContext() {
   let contextHTML = "—";
@@ -1182,17 +1380,14 @@ document.addEventListener("DOMContentLoaded", () => {
   state.consecutiveErrors = 0;
   state.framesAnalyzed = 0;
   
-  // Ensure pollLiveFrame runs when dashboard is active
+  // Refresh the live frame when the dashboard becomes active; further
+  // updates arrive as "frame" events (or via the polling fallback)
   const originalSetView = window.setView;
   window.setView = function(name, btn) {
     originalSetView(name, btn);
     if (name === "dashboard") {
+      state.lastFramePoolTime = 0;
       pollLiveFrame();
-      // Poll frame every 3 seconds when dashboard is active
-      if (state.framePollInterval) clearInterval(state.framePollInterval);
-      state.framePollInterval = setInterval(pollLiveFrame, 3000);
-    } else {
-      if (state.framePollInterval) clearInterval(state.framePollInterval);
     }
   };
 });
@@ -1244,10 +1439,8 @@ document.addEventListener("DOMContentLoaded", async () => {
     // First poll immediately (enhanced version awaits fetch + runs feature hooks)
     await enhancedPollAnalysisStatus();
     loadAnalysisLog();
-    // Also start live frame polling right away for the dashboard view
+    // Also load the live frame right away for the dashboard view
     pollLiveFrame();
-    if (state.framePollInterval) clearInterval(state.framePollInterval);
-    state.framePollInterval = setInterval(pollLiveFrame, 3000);
   } else {
     // Demo mode: show placeholder data
     updateStatusUI({ 
@@ -1273,11 +1466,11 @@ document.addEventListener("DOMContentLoaded", async () => {
   ];
   drawChart();
 
-  // Start polling loops (only if backend is healthy)
+  // Live updates (only if backend is healthy): prefer the event stream,
+  // poll until it connects or if the browser lacks EventSource
   if (state.backendHealthy) {
-    setInterval(enhancedPollAnalysisStatus, POLL_INTERVAL);
-    setInterval(loadAnalysisLog, LOG_POLL_INTERVAL);
-    setInterval(loadHerdData, 10000); // Poll herd data every 10 seconds
+    startPolling();
+    connectEvents();
   }
 
   // Redraw chart on resize
@@ -0,0 +1,49 @@
+"""
+Gunicorn configuration for HerdWatch
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', 5000)}"
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+
+# /events (SSE) and /video/stream (MJPEG) hold a thread per viewer
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", 8))
+
+timeout = 120  # /test and /send wait on the model
+graceful_timeout = 30
+keepalive = 5
+
+# Each worker opens its own database connections and background threads
+preload_app = False
+
+# Recycle workers now and then to bound memory growth
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+
+def on_starting(server):
+    """Warn about per-process state that breaks with several workers"""
+    if workers <= 1:
+        return
+    if os.getenv("VIDEO_WORKER_MODE", "inline").lower() != "external":
+        server.log.warning(
+            "VIDEO_WORKER_MODE is not 'external': each of the %d workers would run "
+            "its own video jobs. Set VIDEO_WORKER_MODE=external and run worker.py.", workers
+        )
+    if os.getenv("RATELIMIT_STORAGE_URI", "memory://").startswith("memory://"):
+        server.log.warning(
+            "RATELIMIT_STORAGE_URI is memory://: rate limits are counted per worker. "
+            "Set RATELIMIT_STORAGE_URI=sqlite://"
+        )
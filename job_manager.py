@@ -0,0 +1,435 @@
+"""
+Multi-stream job manager for HerdWatch video analysis
+Runs several video files/cameras concurrently, one VideoProcessor per job,
+either on threads in this process or queued in the database and run by a
+pool of job processes (worker.py)
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from video_processor import VideoProcessor
+from db import (cancel_video_jobs, claim_video_job, enqueue_video_job, flush_writes,
+                get_video_job, get_video_jobs, requeue_video_jobs, update_video_job)
+from events import event_bus
+from uploads import upload_store
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ────────────────────────────────────────────────────────────
+# Configuration
+# ────────────────────────────────────────────────────────────
+
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", 6))  # One per barn camera
+MAX_JOB_HISTORY = int(os.getenv("MAX_JOB_HISTORY", 50))  # Finished jobs kept for status queries
+
+# Process pool (worker.py)
+VIDEO_WORKER_PROCESSES = int(os.getenv("VIDEO_WORKER_PROCESSES", 2))  # Jobs run at once, one process each
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", 1.0))  # Seconds between queue checks
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", 2))  # Seconds between progress reports
+JOB_HEARTBEAT_TIMEOUT = float(os.getenv("JOB_HEARTBEAT_TIMEOUT", 30))  # Silent this long: job is requeued
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))  # Runs per job before it is failed
+JOB_CANCEL_GRACE = float(os.getenv("JOB_CANCEL_GRACE", 15))  # Seconds before a stopped job is killed
+
+
+class JobLimitError(Exception):
+    """Raised when starting a job would exceed MAX_CONCURRENT_JOBS"""
+
+
+class JobManager:
+    """Track concurrent analysis jobs, each with its own processor state
+
+    Every job gets its own frame counter, status and latest analysis. Model
+    calls from all jobs share the global ai_engine budget; each job uses its
+    own scheduling lane there, so a busy stream can't starve the others.
+    """
+
+    def __init__(self, max_jobs=MAX_CONCURRENT_JOBS, history=MAX_JOB_HISTORY):
+        self.max_jobs = max(1, int(max_jobs))
+        self.history = max(1, int(history))
+        self._jobs = OrderedDict()  # job_id -> VideoProcessor, oldest first
+        self._lock = threading.Lock()
+
+    # ── Job lifecycle ────────────────────────────────────────
+
+    def _new_job(self, job_id=None):
+        """Reserve a processor for a new job (caller must hold the lock)"""
+        active = sum(1 for p in self._jobs.values() if p.is_processing)
+        if active >= self.max_jobs:
+            raise JobLimitError(f"Maximum of {self.max_jobs} concurrent jobs reached")
+
+        self._prune()
+        job_id = job_id or uuid.uuid4().hex[:8]
+        processor = VideoProcessor(job_id=job_id)
+        self._jobs[job_id] = processor
+        return job_id, processor
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond the history limit"""
+        finished = [j for j, p in self._jobs.items() if not p.is_processing]
+        for job_id in finished[:max(0, len(self._jobs) - self.history + 1)]:
+            del self._jobs[job_id]
+
+    def start_file(self, video_path, job_id=None):
+        """
+        Start analyzing an uploaded video file (analysis follows a file
+        that is still being uploaded)
+
+        Args:
+            video_path: Path to the video
+            job_id: Id to use (default: a new one)
+
+        Returns:
+            str: Job id
+
+        Raises:
+            JobLimitError: Too many jobs are already running
+        """
+        with self._lock:
+            job_id, processor = self._new_job(job_id)
+            processor.start_video_processing(
+                video_path, growing=lambda: upload_store.in_progress(video_path)
+            )
+        return job_id
+
+    def start_webcam(self, duration=60, camera=0, job_id=None):
+        """
+        Start analyzing a webcam or network camera stream
+
+        Args:
+            duration: Seconds to analyze
+            camera: Device index or stream URL
+            job_id: Id to use (default: a new one)
+
+        Returns:
+            str: Job id
+
+        Raises:
+            JobLimitError: Too many jobs are already running
+        """
+        with self._lock:
+            job_id, processor = self._new_job(job_id)
+            processor.start_webcam_processing(duration, camera)
+        return job_id
+
+    def stop(self, job_id=None):
+        """
+        Stop one job, or every running job when job_id is None
+
+        Returns:
+            bool: True if at least one job was stopped
+        """
+        with self._lock:
+            if job_id is not None:
+                targets = [self._jobs[job_id]] if job_id in self._jobs else []
+            else:
+                targets = list(self._jobs.values())
+
+        stopped = False
+        for processor in targets:
+            if processor.is_processing:
+                processor.stop_processing()
+                stopped = True
+        return stopped
+
+    # ── Queries ──────────────────────────────────────────────
+
+    def get(self, job_id):
+        """Get a job's processor, or None if unknown"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self):
+        """Most recently started running job, else the most recent job"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for processor in reversed(jobs):
+            if processor.is_processing:
+                return processor
+        return jobs[-1] if jobs else None
+
+    def status(self, job_id=None):
+        """
+        Get status for one job (default: latest job)
+
+        Returns:
+            dict or None: Job status, None if the job id is unknown
+        """
+        processor = self.get(job_id) if job_id else self.latest()
+        if processor is None:
+            return None
+        return processor.get_status()
+
+    def list_jobs(self):
+        """Summaries of all tracked jobs, oldest first"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        summaries = []
+        for processor in jobs:
+            status = processor.get_status()
+            summaries.append({
+                "job_id": status["job_id"],
+                "source": status["source"],
+                "created_at": status["created_at"],
+                "status": status["status"],
+                "is_processing": status["is_processing"],
+                "frame_count": status["frame_count"],
+                "latest_analysis": status["latest_analysis"],
+            })
+        return summaries
+
+    @property
+    def is_processing(self):
+        """True while any job is running"""
+        with self._lock:
+            return any(p.is_processing for p in self._jobs.values())
+
+    def active_count(self):
+        """Number of running jobs"""
+        with self._lock:
+            return sum(1 for p in self._jobs.values() if p.is_processing)
+
+
+class QueuedJobManager:
+    """JobManager interface for web workers when jobs run in worker.py
+
+    Starting a job inserts it into the video_jobs table; the video worker
+    process claims it, runs it with its own JobManager and writes status
+    snapshots back, which every web worker reads from the database.
+    Jobs beyond the worker's capacity wait in the queue instead of being
+    rejected.
+    """
+
+    def __init__(self, max_jobs=MAX_CONCURRENT_JOBS, history=MAX_JOB_HISTORY):
+        self.max_jobs = max(1, int(max_jobs))
+        self.history = max(1, int(history))
+
+    def start_file(self, video_path):
+        """Queue an uploaded video file; returns the job id"""
+        job_id = uuid.uuid4().hex[:8]
+        enqueue_video_job(job_id, {"type": "file", "path": video_path})
+        return job_id
+
+    def start_webcam(self, duration=60, camera=0):
+        """Queue a webcam or network camera stream; returns the job id"""
+        job_id = uuid.uuid4().hex[:8]
+        enqueue_video_job(job_id, {"type": "webcam", "camera": camera, "duration": duration})
+        return job_id
+
+    def stop(self, job_id=None):
+        """Ask the worker to stop one job, or every unfinished job"""
+        return cancel_video_jobs(job_id) > 0
+
+    @staticmethod
+    def _status(job):
+        """Job row → the dict VideoProcessor.get_status() returns"""
+        status = dict(job["snapshot"] or {})
+        status.update({
+            "job_id": job["id"],
+            "source": job["source"],
+            "created_at": job["created_at"],
+            "is_processing": job["status"] == "processing",
+            "status": job["status"],
+            "progress": job["progress"],
+            "attempts": job["attempts"],
+            "resume_frame": job["resume_frame"],
+        })
+        status.setdefault("frame_count", 0)
+        status.setdefault("latest_analysis", "Waiting for the video worker"
+                          if job["status"] == "queued" else "")
+        status.setdefault("timestamp", job["updated_at"] or datetime.now().isoformat())
+        return status
+
+    def status(self, job_id=None):
+        """Status of one job (default: latest running, else latest job), or None"""
+        if job_id:
+            job = get_video_job(job_id)
+        else:
+            job = next(iter(get_video_jobs(status="processing", limit=1)), None)
+            job = job or next(iter(get_video_jobs(limit=1)), None)
+        return self._status(job) if job else None
+
+    def list_jobs(self):
+        """Summaries of recent jobs, oldest first"""
+        summaries = []
+        for job in reversed(get_video_jobs(limit=self.history)):
+            status = self._status(job)
+            summaries.append({key: status.get(key) for key in (
+                "job_id", "source", "created_at", "status", "is_processing",
+                "frame_count", "progress", "latest_analysis"
+            )})
+        return summaries
+
+    @property
+    def is_processing(self):
+        return self.active_count() > 0
+
+    def active_count(self):
+        return len(get_video_jobs(status="processing", limit=self.history))
+
+
+# ────────────────────────────────────────────────────────────
+# Process Pool
+# ────────────────────────────────────────────────────────────
+
+def _report(job_id, processor, status=None):
+    """Write a job process's progress and heartbeat to its video_jobs row"""
+    snapshot = processor.get_status()
+    update_video_job(
+        job_id,
+        status=status,
+        snapshot=snapshot,
+        progress=snapshot["progress"],
+        resume_frame=snapshot["resume_frame"],
+        heartbeat=True
+    )
+
+
+def run_job_process(job):
+    """
+    Entry point of a job process: run one claimed job to the end
+
+    A heartbeat thread reports progress every JOB_HEARTBEAT_INTERVAL
+    seconds and stops the processor once a stop is requested. Events and
+    frames go to the shared database for the web workers.
+
+    Args:
+        job: Claimed video_jobs row
+    """
+    from shared_state import forward_events  # Only needed in job processes
+
+    forward_events(event_bus)
+    job_id = job["id"]
+    source = job["source"]
+    processor = VideoProcessor(job_id=job_id)
+    processor.source = source
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                row = get_video_job(job_id)
+                if row is not None and row["cancel_requested"] and processor.is_processing:
+                    processor.stop_processing()
+                _report(job_id, processor)
+            except Exception as e:
+                print(f"Error reporting job {job_id}: {e}")
+
+    threading.Thread(target=heartbeat, name="job-heartbeat", daemon=True).start()
+    finished = False
+    try:
+        if source["type"] == "file":
+            processor.process_video_file(
+                source["path"],
+                start_frame=job["resume_frame"] or 0,
+                growing=lambda: upload_store.in_progress(source["path"])
+            )
+        else:
+            processor.process_webcam(source.get("duration", 60), source.get("camera", 0))
+        finished = True
+    finally:
+        done.set()
+        flush_writes()  # Job processes exit without running atexit handlers
+        status = processor.current_status
+        if status in ("idle", "processing"):
+            # Left "processing" after a crash so the pool retries the job
+            status = "completed" if finished else None
+        _report(job_id, processor, status=status)
+
+
+class JobPool:
+    """Run queued video jobs in a pool of separate processes
+
+    Each claimed job runs in its own (spawned) process, so decoding,
+    resizing and encoding never compete with the web workers for the GIL.
+    The pool restarts jobs whose process crashed and, through heartbeats,
+    those left behind by a pool that died; a restarted file job resumes
+    after the last frame whose analysis was stored.
+    """
+
+    def __init__(self, processes=VIDEO_WORKER_PROCESSES, poll_interval=WORKER_POLL_INTERVAL,
+                 heartbeat_timeout=JOB_HEARTBEAT_TIMEOUT, max_attempts=JOB_MAX_ATTEMPTS,
+                 cancel_grace=JOB_CANCEL_GRACE):
+        self.processes = max(1, int(processes))
+        self.poll_interval = poll_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max(1, int(max_attempts))
+        self.cancel_grace = cancel_grace
+        self._context = multiprocessing.get_context("spawn")  # No threads/locks inherited
+        self._running = {}  # job_id -> Process
+        self._cancelled = {}  # job_id -> time the stop request was first seen
+
+    def run(self):
+        """Claim and run jobs until interrupted"""
+        print(f"🎬 Video worker started ({self.processes} job processes)")
+        try:
+            while True:
+                self.poll()
+                time.sleep(self.poll_interval)
+        finally:
+            self.shutdown()
+
+    def poll(self):
+        """Reap finished processes, enforce stops, recover and start jobs"""
+        self._reap()
+        self._enforce_cancel()
+        for job_id, status in requeue_video_jobs(
+                self.max_attempts, stale_before=time.time() - self.heartbeat_timeout):
+            print(f"Job {job_id} stopped sending heartbeats: {status}")
+            if job_id in self._running:
+                self._running[job_id].terminate()  # Hung; reaped on the next poll
+
+        while len(self._running) < self.processes:
+            job = claim_video_job(os.getpid())
+            if job is None:
+                break
+            process = self._context.Process(
+                target=run_job_process, args=(job,), name=f"job-{job['id']}"
+            )
+            process.start()
+            self._running[job["id"]] = process
+            resume = f" from frame {job['resume_frame']}" if job["resume_frame"] else ""
+            print(f"▶️  Started job {job['id']} (attempt {job['attempts']}){resume}: {job['source']}")
+
+    def _reap(self):
+        for job_id, process in list(self._running.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            del self._running[job_id]
+            self._cancelled.pop(job_id, None)
+            # A process that exits without finishing its job crashed
+            for _, status in requeue_video_jobs(self.max_attempts, job_id=job_id):
+                print(f"⚠️  Job {job_id} process exited with code {process.exitcode}: {status}")
+
+    def _enforce_cancel(self):
+        """Kill job processes that ignore a stop request for too long"""
+        if not self._running:
+            return
+        now = time.time()
+        for job in get_video_jobs(status="processing", limit=max(self.processes * 4, 50)):
+            job_id = job["id"]
+            if job_id not in self._running or not job["cancel_requested"]:
+                continue
+            first_seen = self._cancelled.setdefault(job_id, now)
+            if now - first_seen >= self.cancel_grace:
+                print(f"Killing job {job_id}: did not stop within {self.cancel_grace}s")
+                self._running[job_id].terminate()
+
+    def shutdown(self):
+        """Stop every job process; their jobs are requeued to resume later"""
+        for process in self._running.values():
+            process.terminate()
+        for job_id, process in list(self._running.items()):
+            process.join()
+            requeue_video_jobs(self.max_attempts + 1, job_id=job_id)
+        self._running.clear()
+
+
+# Global job manager instance
+job_manager = JobManager()
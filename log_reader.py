@@ -0,0 +1,269 @@
+"""
+Incremental reader for the HerdWatch analysis log
+Tails analysis_log.txt by byte offset, follows rotation, and keeps a
+bounded ring buffer of parsed entries with cursor pagination. Cursors are
+positions in the log files, so every web worker agrees on them.
+"""
+
+import os
+import re
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ────────────────────────────────────────────────────────────
+# Configuration
+# ────────────────────────────────────────────────────────────
+
+ANALYSIS_LOG_FILE = "analysis_log.txt"
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", 5000))  # Parsed entries kept in memory
+LOG_BACKUP_COUNT = 7  # Matches the RotatingFileHandler in video_processor
+LOG_READ_SIZE = 1024 * 1024  # Bytes read from the log per block
+
+# Entry header: "2025-07-31 16:27:20 - JOB 3f2a9c1e - FRAME 90: Cow 1: Eating"
+# (logs written before concurrent jobs have no "JOB <id> - " part).
+# Lines that don't start with a header continue the previous entry.
+ENTRY_HEADER = re.compile(
+    r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - (?:JOB (\S+) - )?FRAME (\d+): ?(.*)$"
+)
+
+
+def parse_header(line):
+    """
+    Parse the first line of a log entry
+
+    Returns:
+        dict or None: {"timestamp", "job_id", "frame", "analysis"} if the
+        line starts an entry (job_id is None in older logs)
+    """
+    match = ENTRY_HEADER.match(line)
+    if not match:
+        return None
+    return {
+        "timestamp": match.group(1),
+        "job_id": match.group(2),
+        "frame": int(match.group(3)),
+        "analysis": match.group(4),
+    }
+
+
+def parse_cursor(cursor):
+    """
+    Split a cursor from read() into the log position it names
+
+    Returns:
+        tuple: (inode, byte offset) of the entry's first line
+
+    Raises:
+        ValueError: Not a cursor
+    """
+    inode, offset = str(cursor).split("-")
+    return int(inode), int(offset)
+
+
+class AnalysisLogReader:
+    """Tail-follow parser for the rotating analysis log
+
+    Each refresh() reads only the bytes appended since the previous call.
+    When the handler rotates the file (analysis_log.txt → .1), the rest of
+    the old file is read from its new name before starting on the new one.
+    Each entry's cursor is "<inode>-<offset>" of its first line. Rotation
+    renames files without changing their inode, so the cursor stays valid,
+    and readers in different processes (or restarted ones) hand out the
+    same cursor for the same entry. Clients pass it back to ask for
+    everything after the last entry they have seen.
+    """
+
+    def __init__(self, path=ANALYSIS_LOG_FILE, max_entries=LOG_BUFFER_SIZE,
+                 backup_count=LOG_BACKUP_COUNT, position=None, on_entry=None,
+                 read_size=LOG_READ_SIZE):
+        """
+        Args:
+            path: Log file to follow
+            max_entries: Parsed entries kept in memory
+            backup_count: Rotated backups (.1 ... .N) to read history from
+            position: (inode, offset) saved from position() to resume from;
+                rotated history is not re-read when resuming
+            on_entry: Optional callable invoked with every parsed entry
+            read_size: Bytes read from the log per block
+        """
+        self.path = path
+        self.backup_count = backup_count
+        self.read_size = read_size
+        self.entries = deque(maxlen=max(1, int(max_entries)))
+        self.total = 0  # Entries parsed since startup (including evicted ones)
+        self.on_entry = on_entry
+
+        self._inode, self._offset = position if position else (None, 0)
+        self._partial = b""     # Bytes of an incomplete trailing line
+        self._current = None    # Entry whose continuation lines may still follow
+        self._cursor = None     # Cursor of the newest finished entry
+        self._file = None       # Inode of the file being parsed
+        self._line_start = 0    # Offset of the first byte of self._partial
+        self._loaded = position is not None
+        self._lock = threading.Lock()
+
+    # ── Parsing ──────────────────────────────────────────────
+
+    def _finish_current(self):
+        if self._current is None:
+            return
+        entry = self._current
+        entry["analysis"] = entry["analysis"].strip()
+        entry["is_error"] = entry["analysis"].startswith("Analysis error")
+        self._cursor = entry["cursor"]
+        self.entries.append(entry)
+        self.total += 1
+        self._current = None
+        if self.on_entry is not None:
+            self.on_entry(entry)
+
+    def _consume(self, data):
+        """Parse a chunk of appended bytes"""
+        data = self._partial + data
+        lines = data.split(b"\n")
+        self._partial = lines.pop()  # Empty if the chunk ended with a newline
+
+        start = self._line_start
+        for raw in lines:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r")
+            header = parse_header(line)
+            if header is not None:
+                self._finish_current()
+                header["cursor"] = f"{self._file}-{start}"
+                self._current = header
+            elif self._current is not None:
+                self._current["analysis"] += "\n" + line
+            elif line.strip():
+                # Text without a header (e.g. hand-edited log): keep it visible
+                self._current = {"timestamp": "", "job_id": None, "frame": 0, "analysis": line,
+                                 "cursor": f"{self._file}-{start}"}
+            start += len(raw) + 1
+        self._line_start = start
+
+    def _read_from(self, path, offset):
+        """Read and parse a file from a byte offset; returns the new offset"""
+        with open(path, "rb") as f:
+            self._file = os.fstat(f.fileno()).st_ino
+            self._line_start = offset - len(self._partial)
+            f.seek(offset)
+            while True:
+                chunk = f.read(self.read_size)
+                if not chunk:
+                    break
+                self._consume(chunk)
+                offset += len(chunk)
+
+        # Each log record is written in one call, so data that ends on a line
+        # boundary ends on a record boundary too (a block boundary may not)
+        if not self._partial:
+            self._finish_current()
+        return offset
+
+    def _end_of_file(self):
+        """Flush state at the end of a file (rotation or truncation)"""
+        if self._partial:
+            self._consume(b"\n")
+        self._finish_current()
+
+    # ── Refresh ──────────────────────────────────────────────
+
+    def _load_history(self):
+        """Parse rotated backups oldest-first so the buffer starts full"""
+        for i in range(self.backup_count, 0, -1):
+            backup = f"{self.path}.{i}"
+            if os.path.exists(backup):
+                self._read_from(backup, 0)
+                self._end_of_file()
+        self._loaded = True
+
+    def refresh(self):
+        """Parse anything appended since the last call (O(new bytes))"""
+        with self._lock:
+            if not self._loaded:
+                self._load_history()
+
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+
+            if self._inode is not None and stat.st_ino != self._inode:
+                # Rotated: finish the old file, which now lives at .1
+                rotated = f"{self.path}.1"
+                try:
+                    if os.stat(rotated).st_ino == self._inode:
+                        self._read_from(rotated, self._offset)
+                except FileNotFoundError:
+                    pass
+                self._end_of_file()
+                self._offset = 0
+            elif stat.st_size < self._offset:
+                # Truncated in place
+                self._end_of_file()
+                self._offset = 0
+
+            self._inode = stat.st_ino
+            if stat.st_size > self._offset:
+                self._offset = self._read_from(self.path, self._offset)
+
+    def position(self):
+        """(inode, offset) of the last complete line, for resuming later"""
+        with self._lock:
+            return self._inode, self._offset - len(self._partial)
+
+    # ── Queries ──────────────────────────────────────────────
+
+    def read(self, limit=30, since=None, job_id=None):
+        """
+        Get parsed entries
+
+        Args:
+            limit: Maximum entries to return
+            since: Cursor of the last entry the client has; None for the latest entries
+            job_id: Only entries logged by this job
+
+        Returns:
+            dict: {"entries", "cursor", "total", "has_more", "truncated"}
+
+        Raises:
+            ValueError: ``since`` is not a cursor
+        """
+        self.refresh()
+        limit = max(0, int(limit))
+
+        with self._lock:
+            entries = list(self.entries)
+            latest_cursor = self._cursor
+            total = self.total
+
+        def of_job(items):
+            return items if job_id is None else [e for e in items if e["job_id"] == job_id]
+
+        truncated = False
+        if since is None:
+            matching = of_job(entries)
+            page = matching[-limit:] if limit else []
+            has_more = False
+        else:
+            inode, offset = parse_cursor(since)
+            since = f"{inode}-{offset}"
+            start = None
+            for i in range(len(entries) - 1, -1, -1):
+                if entries[i]["cursor"] == since:
+                    start = i + 1
+                    break
+            truncated = start is None  # The client's entry was evicted (or rotated away)
+            newer = of_job(entries[start or 0:])
+            page = newer[:limit]
+            has_more = len(newer) > limit
+
+        return {
+            "entries": page,
+            "cursor": page[-1]["cursor"] if page else (since if since is not None else latest_cursor),
+            "total": total,
+            "has_more": has_more,
+            "truncated": truncated,
+        }
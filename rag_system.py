@@ -4,11 +4,21 @@ Enables semantic search over historical analysis logs
 """
 
 import os
+import re
+import glob
 import json
-from datetime import datetime
+import uuid
+import hashlib
+import threading
+from datetime import datetime, timedelta
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_openai import AzureOpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstore import FAISS
+from langchain_community.vectorstores import FAISS
+from db import parse_cow_observations
+from log_reader import AnalysisLogReader
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,125 +29,516 @@ load_dotenv()
 
 ANALYSIS_LOG_FILE = "analysis_log.txt"
 INDEX_PATH = "herd_index"
+INDEX_META_FILE = "meta.json"  # Log position covered by the index, inside INDEX_PATH
+INDEX_VERSION = 3  # One entry-aligned index per day, entries labelled with their job
+RAG_DEFAULT_DAYS = int(os.getenv("RAG_DEFAULT_DAYS", 7))  # Days searched when a question gives no time window
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE", "embedding_cache.npz")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))  # Texts per embedding request
+EMBEDDING_CACHE_MAX_SHARDS = 32  # New-vector files merged into EMBEDDING_CACHE_FILE at this count
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with a content-hash keyed on-disk cache
+    
+    The analysis log repeats the same lines ("Cow 1: Eating") thousands of
+    times, so each distinct text is embedded once: texts are looked up by
+    SHA-1 of model + content, only unique misses are sent to the provider
+    (EMBEDDING_BATCH_SIZE per request). The vectors of each miss batch are
+    appended as a small float32 shard next to the main .npz file, and the
+    shards are merged into it every EMBEDDING_CACHE_MAX_SHARDS batches, so
+    a batch doesn't rewrite the whole cache.
+    """
+    
+    def __init__(self, base, model_name="", path=EMBEDDING_CACHE_FILE,
+                 batch_size=EMBEDDING_BATCH_SIZE):
+        self.base = base
+        self.model_name = model_name
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self._rows = {}  # content hash -> row in self._vectors
+        self._vectors = None
+        self._shards = []  # Shard files loaded or written, not yet merged
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "requests": 0}
+        self._load()
+    
+    def _key(self, text):
+        return hashlib.sha1(f"{self.model_name}\n{text}".encode("utf-8")).hexdigest()
+    
+    def _shard_paths(self):
+        root, ext = os.path.splitext(self.path)
+        return sorted(glob.glob(f"{glob.escape(root)}-*{ext}"))
+    
+    def _load(self):
+        keys, vectors = [], []
+        for path in [self.path] + self._shard_paths():
+            try:
+                with np.load(path) as data:
+                    vectors.append(data["vectors"].astype(np.float32))
+                    keys.extend(data["keys"].tolist())
+            except FileNotFoundError:
+                continue  # Merged by another process meanwhile
+            except Exception as e:
+                print(f"Warning: Could not load embedding cache {path}: {e}")
+                continue
+            if path != self.path:
+                self._shards.append(path)
+        if vectors:
+            self._vectors = np.concatenate(vectors)
+            self._rows = {k: i for i, k in enumerate(keys)}
+    
+    @staticmethod
+    def _write(path, keys, vectors):
+        """Write keys and vectors to an .npz file atomically"""
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"  # Unique per writer, not matched as a shard
+        with open(tmp_path, "wb") as f:
+            np.savez(f, keys=np.array(keys), vectors=vectors)
+        os.replace(tmp_path, path)
+    
+    def _save(self, keys, vectors):
+        """Append new vectors as a shard; merge the shards once there are enough"""
+        root, ext = os.path.splitext(self.path)
+        shard = f"{root}-{uuid.uuid4().hex}{ext}"
+        self._write(shard, keys, vectors)
+        self._shards.append(shard)
+        if len(self._shards) < EMBEDDING_CACHE_MAX_SHARDS:
+            return
+        
+        keys = sorted(self._rows, key=self._rows.get)
+        self._write(self.path, keys, self._vectors[[self._rows[k] for k in keys]])
+        for shard in self._shards:
+            try:
+                os.remove(shard)
+            except FileNotFoundError:
+                pass
+        self._shards = []
+    
+    def embed_documents(self, texts):
+        keys = [self._key(t) for t in texts]
+        with self._lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+            self.stats["hits"] += len(texts) - len(missing)
+            self.stats["misses"] += len(missing)
+            
+            if missing:
+                pending = list(missing.items())
+                new_vectors = []
+                for i in range(0, len(pending), self.batch_size):
+                    batch = [text for _, text in pending[i:i + self.batch_size]]
+                    new_vectors.extend(self.base.embed_documents(batch))
+                    self.stats["requests"] += 1
+                
+                new_vectors = np.asarray(new_vectors, dtype=np.float32)
+                start = 0 if self._vectors is None else len(self._vectors)
+                self._vectors = new_vectors if self._vectors is None else np.vstack([self._vectors, new_vectors])
+                for offset, (key, _) in enumerate(pending):
+                    self._rows[key] = start + offset
+                try:
+                    self._save([key for key, _ in pending], new_vectors)
+                except Exception as e:
+                    print(f"Warning: Could not save embedding cache {self.path}: {e}")
+            
+            return [self._vectors[self._rows[key]].tolist() for key in keys]
+    
+    def embed_query(self, text):
+        # Questions are rarely repeated verbatim; don't grow the cache with them
+        return self.base.embed_query(text)
+
+# ────────────────────────────────────────────────────────────
+# Query Filters
+# ────────────────────────────────────────────────────────────
+
+COW_QUERY_PATTERN = re.compile(r"\bcow\s*#?\s*(\d+)\b", re.I)
+LAST_PERIOD_PATTERN = re.compile(r"\b(?:last|past)\s+(\d+)?\s*(hour|day|week)s?\b", re.I)
+# Parts of the day as (start hour, end hour)
+DAY_PARTS = {
+    "morning": (5, 12),
+    "afternoon": (12, 17),
+    "evening": (17, 24),
+    "night": (18, 30),  # Into the early hours of the next day
+}
+
+def parse_query_filters(question, now=None):
+    """
+    Extract a time window and cow number from a farmer's question
+    
+    Understands "cow 3", "today", "yesterday", "this morning/afternoon/
+    evening", "yesterday morning", "last night", "last 6 hours",
+    "past 3 days" and "last week".
+    
+    Args:
+        question: Question text
+        now: Reference time (default: current time)
+        
+    Returns:
+        dict: {"start": datetime or None, "end": datetime or None, "cow": int or None}
+    """
+    now = now or datetime.now()
+    text = question.lower().replace("tonight", "this evening")
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end = None
+    
+    cow_match = COW_QUERY_PATTERN.search(text)
+    cow = int(cow_match.group(1)) if cow_match else None
+    
+    period = LAST_PERIOD_PATTERN.search(text)
+    if "last night" in text:
+        start, end = midnight - timedelta(hours=6), midnight + timedelta(hours=6)
+    elif period:
+        count = int(period.group(1) or 1)
+        unit = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}[period.group(2)]
+        start, end = now - count * unit, now
+    else:
+        day = None
+        if "yesterday" in text:
+            day = midnight - timedelta(days=1)
+        elif "today" in text or re.search(r"\bthis\s+(morning|afternoon|evening)\b", text):
+            day = midnight
+        if day is not None:
+            start, end = day, day + timedelta(days=1)
+            for part, (first, last) in DAY_PARTS.items():
+                if part in text:
+                    start, end = day + timedelta(hours=first), day + timedelta(hours=last)
+                    break
+    
+    return {"start": start, "end": end, "cow": cow}
+
+
+def _log_time(value):
+    """Format a datetime like the analysis log timestamps (sortable as text)"""
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
 
 class HerdRAG:
-    """Retrieval-Augmented Generation for cow analysis history"""
+    """Retrieval-Augmented Generation for cow analysis history
+    
+    Each log entry becomes one document carrying its timestamp, frame and
+    the cows it mentions. Documents are partitioned into one FAISS index per
+    day, so a query only searches the days inside its time window (the last
+    RAG_DEFAULT_DAYS when none is given) and latency stays flat as months of
+    logs accumulate. Within those days, the entries in the exact time range
+    that mention the cow are selected from their metadata first and only
+    those are ranked (a FAISS IDSelector), so a narrow question never loses
+    its matches to closer entries outside the filter.
     
-    def __init__(self):
+    Indexing is incremental: only log entries appended since the last
+    indexed position are embedded and added, and only the day indexes that
+    changed are saved. The position (log inode and byte offset) is saved in
+    herd_index/meta.json; day indexes are loaded from disk on first use
+    instead of being rebuilt.
+    """
+    
+    def __init__(self, index_path=INDEX_PATH):
         """Initialize RAG system with Azure OpenAI embeddings"""
-        self.vectorstore = None
-        self.last_indexed = 0
-        self.index_path = INDEX_PATH
+        self.index_path = index_path
+        self.indexed_entries = 0
+        self.days = {}  # "YYYY-MM-DD" -> entries indexed that day
+        self._day_indexes = {}  # Loaded day indexes
+        self._day_entries = {}  # day -> [(index position, timestamp, cows)] for filtering
         self._embeddings = None
+        self._reader = None
+        self._position = None  # (inode, offset) covered by the index
+        self._lock = threading.Lock()
+        self._load_meta()
         
     @property
     def embeddings(self):
         """Lazy load embeddings to avoid initialization errors"""
         if self._embeddings is None:
             try:
-                self._embeddings = AzureOpenAIEmbeddings(
-                    azure_deployment=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
-                    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                    api_key=os.getenv("AZURE_OPENAI_API_KEY")
+                deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")
+                self._embeddings = CachedEmbeddings(
+                    AzureOpenAIEmbeddings(
+                        azure_deployment=deployment,
+                        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                        api_key=os.getenv("AZURE_OPENAI_API_KEY")
+                    ),
+                    model_name=deployment or ""
                 )
             except Exception as e:
                 print(f"Warning: Could not initialize embeddings: {e}")
                 return None
         return self._embeddings
     
+    # ── Persistence ──────────────────────────────────────────
+    
+    def _meta_path(self):
+        return os.path.join(self.index_path, INDEX_META_FILE)
+    
+    def _day_path(self, day):
+        return os.path.join(self.index_path, "days", day)
+    
+    def _load_meta(self):
+        """Load the indexed log position and day list, if present"""
+        try:
+            with open(self._meta_path(), "r") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if meta.get("version") != INDEX_VERSION:
+            print("Analysis index format changed, rebuilding")
+            return
+        
+        self._position = (meta["inode"], meta["offset"])
+        self.indexed_entries = meta.get("entries", 0)
+        self.days = meta.get("days", {})
+        print(f"✓ Loaded analysis index: {self.indexed_entries} entries over {len(self.days)} days")
+    
+    def _save_meta(self, position):
+        meta = {
+            "version": INDEX_VERSION,
+            "inode": position[0],
+            "offset": position[1],
+            "entries": self.indexed_entries,
+            "days": self.days,
+            "updated_at": datetime.now().isoformat()
+        }
+        os.makedirs(self.index_path, exist_ok=True)
+        tmp_path = f"{self._meta_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path())
+    
+    def _day_index(self, day):
+        """Get a day's FAISS index, loading it from disk on first use"""
+        if day not in self._day_indexes and day in self.days:
+            try:
+                self._day_indexes[day] = FAISS.load_local(
+                    self._day_path(day), self.embeddings,
+                    allow_dangerous_deserialization=True  # Our own pickle, written by build_index
+                )
+            except Exception as e:
+                print(f"Warning: Could not load index for {day}: {e}")
+                return None
+        return self._day_indexes.get(day)
+    
+    def reset(self):
+        """Forget the index so the next build_index() starts from scratch"""
+        with self._lock:
+            self.indexed_entries = 0
+            self.days = {}
+            self._day_indexes = {}
+            self._day_entries = {}
+            self._position = None
+            self._reader = None
+    
+    # ── Indexing ─────────────────────────────────────────────
+    
+    def _new_entries(self, log_file):
+        """Parse log entries appended since the indexed position"""
+        if self._reader is None or self._reader.path != log_file:
+            self._reader = AnalysisLogReader(log_file, max_entries=1, position=self._position)
+        
+        entries = []
+        self._reader.on_entry = entries.append
+        try:
+            self._reader.refresh()
+        finally:
+            self._reader.on_entry = None
+        return entries, self._reader.position()
+    
+    @staticmethod
+    def _to_document(entry):
+        """One document per log entry, with timestamp/job/frame/cow metadata"""
+        observations = parse_cow_observations(entry["analysis"])
+        job = f"JOB {entry['job_id']} - " if entry.get("job_id") else ""
+        return Document(
+            page_content=f"{entry['timestamp']} - {job}FRAME {entry['frame']}: {entry['analysis']}",
+            metadata={
+                "timestamp": entry["timestamp"],
+                "day": entry["timestamp"][:10],
+                "job_id": entry.get("job_id"),
+                "frame": entry["frame"],
+                "cows": [o["cow"] for o in observations],
+            }
+        )
+    
     def build_index(self, log_file=ANALYSIS_LOG_FILE):
         """
-        Parse log file and build/update FAISS index
+        Embed log entries appended since the last call and add them to
+        their day's index
         
         Args:
             log_file: Path to analysis log file
+            
+        Returns:
+            bool: True if new entries were indexed
         """
         if not os.path.exists(log_file):
             return False
         
-        # Check if file has been modified since last index
-        mtime = os.path.getmtime(log_file)
-        if mtime <= self.last_indexed:
-            return False  # No changes
-        
-        try:
-            with open(log_file, "r", encoding="utf-8") as f:
-                entries = f.readlines()
-            
-            # Filter out error entries and empty lines
-            clean_entries = [
-                e.strip() for e in entries 
-                if e.strip() and "Analysis error" not in e
-            ]
-            
-            if not clean_entries:
+        with self._lock:
+            try:
+                entries, position = self._new_entries(log_file)
+                
+                # Filter out error entries, empty analyses and undated lines
+                docs = [
+                    self._to_document(e) for e in entries
+                    if e["analysis"] and not e["is_error"] and e["timestamp"]
+                ]
+                
+                if not docs:
+                    self._position = position
+                    return False
+                
+                if self.embeddings is None:
+                    print("Warning: Embeddings not available, RAG disabled")
+                    self._reader = None  # Re-read these entries next time
+                    return False
+                
+                by_day = {}
+                for doc in docs:
+                    by_day.setdefault(doc.metadata["day"], []).append(doc)
+                
+                # Add to each day's index and save only the days that changed
+                for day, day_docs in by_day.items():
+                    index = self._day_index(day)
+                    if index is None:
+                        index = FAISS.from_documents(day_docs, self.embeddings)
+                        self._day_indexes[day] = index
+                    else:
+                        index.add_documents(day_docs)
+                    self._day_entries.pop(day, None)
+                    index.save_local(self._day_path(day))
+                    self.days[day] = self.days.get(day, 0) + len(day_docs)
+                
+                self.indexed_entries += len(docs)
+                self._position = position
+                self._save_meta(position)
+                
+                print(f"✓ Indexed {len(docs)} new entries across {len(by_day)} day(s)")
+                return True
+                
+            except Exception as e:
+                print(f"Error building index: {e}")
+                self._reader = None  # Resume from the last saved position
                 return False
+    
+    # ── Retrieval ────────────────────────────────────────────
+    
+    def _entries(self, day, index):
+        """(position, timestamp, cows) of every entry in a day index, cached"""
+        entries = self._day_entries.get(day)
+        if entries is None:
+            entries = []
+            for position, doc_id in index.index_to_docstore_id.items():
+                metadata = index.docstore.search(doc_id).metadata
+                entries.append((position, metadata["timestamp"], metadata["cows"]))
+            self._day_entries[day] = entries
+        return entries
+    
+    @staticmethod
+    def _search_positions(index, vector, k, positions=None):
+        """
+        Rank entries of a day index by distance to the query vector
+        
+        Args:
+            index: LangChain FAISS store
+            vector: Query embedding
+            k: Results wanted
+            positions: Only rank these index positions (None: all)
             
-            # Split into chunks for embedding
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=200,
-                chunk_overlap=20
+        Returns:
+            list: (Document, distance) pairs, closest first
+        """
+        query = np.array([vector], dtype=np.float32)
+        if positions is None:
+            distances, found = index.index.search(query, min(k, index.index.ntotal))
+        else:
+            selector = faiss.IDSelectorBatch(np.array(positions, dtype=np.int64))
+            distances, found = index.index.search(
+                query, min(k, len(positions)), params=faiss.SearchParameters(sel=selector)
             )
-            docs = splitter.create_documents(clean_entries)
-            
-            if self.embeddings is None:
-                print("Warning: Embeddings not available, RAG disabled")
-                return False
-            
-            # Build FAISS index
-            self.vectorstore = FAISS.from_documents(docs, self.embeddings)
-            self.vectorstore.save_local(self.index_path)
-            self.last_indexed = mtime
-            
-            print(f"✓ Updated analysis index: {len(docs)} chunks")
-            return True
-            
-        except Exception as e:
-            print(f"Error building index: {e}")
-            return False
+        return [
+            (index.docstore.search(index.index_to_docstore_id[int(position)]), float(distance))
+            for position, distance in zip(found[0], distances[0])
+            if position != -1
+        ]
     
-    def retrieve(self, query, k=5):
+    def retrieve(self, query, k=5, start=None, end=None, cow=None):
         """
         Retrieve k most relevant log entries for query
         
         Args:
             query: Search query
             k: Number of results to return
+            start: Only entries at or after this datetime
+            end: Only entries before this datetime
+            cow: Only entries that mention this cow number
             
         Returns:
-            list: Document objects with page_content
+            list: Document objects with page_content and metadata
         """
-        if self.vectorstore is None:
-            if not self.build_index():
-                return []
+        if not self.days:
+            self.build_index()
+        if not self.days or self.embeddings is None:
+            return []
         
-        if self.vectorstore is None:
+        # Only search the day partitions inside the window
+        if start is None and end is None:
+            days = sorted(self.days)[-RAG_DEFAULT_DAYS:]
+        else:
+            first = start.strftime("%Y-%m-%d") if start else ""
+            last = end.strftime("%Y-%m-%d") if end else "9999-99-99"
+            days = [d for d in sorted(self.days) if first <= d <= last]
+        if not days:
             return []
         
+        start_text, end_text = _log_time(start), _log_time(end)
+        filtered = start_text is not None or end_text is not None or cow is not None
+        
         try:
-            return self.vectorstore.similarity_search(query, k=k)
+            vector = self.embeddings.embed_query(query)
+            scored = []
+            for day in days:
+                index = self._day_index(day)
+                if index is None:
+                    continue
+                positions = None
+                if filtered:
+                    # Select by metadata first, then rank only the matches
+                    positions = [
+                        position for position, timestamp, cows in self._entries(day, index)
+                        if (start_text is None or timestamp >= start_text)
+                        and (end_text is None or timestamp < end_text)
+                        and (cow is None or cow in cows)
+                    ]
+                    if not positions:
+                        continue
+                    if len(positions) == index.index.ntotal:
+                        positions = None
+                scored.extend(self._search_positions(index, vector, k, positions))
+            scored.sort(key=lambda pair: pair[1])  # L2 distance: smaller is closer
+            return [doc for doc, _ in scored[:k]]
         except Exception as e:
             print(f"Error retrieving documents: {e}")
             return []
     
-    def get_context(self, query):
+    def get_context(self, query, k=5):
         """
         Return formatted context string for prompt
         
+        Time windows ("this morning", "yesterday", "last 6 hours") and cow
+        numbers ("cow 3") in the question narrow the search.
+        
         Args:
             query: User question or search query
+            k: Number of historical entries to include
             
         Returns:
             str: Formatted historical context
         """
-        docs = self.retrieve(query)
+        docs = self.retrieve(query, k=k, **parse_query_filters(query))
         
         if not docs:
             return "No historical analysis available."
         
-        # Format documents for inclusion in prompt
+        # Format documents for inclusion in prompt, oldest first
+        docs.sort(key=lambda doc: doc.metadata.get("timestamp", ""))
         context_parts = []
-        for i, doc in enumerate(docs, 1):
+        for doc in docs:
             context_parts.append(f"• {doc.page_content}")
         
         return "\n".join(context_parts)
@@ -163,7 +564,7 @@ def get_historical_context(question, k=5):
     """
     try:
         herd_rag.build_index()
-        return herd_rag.get_context(question)
+        return herd_rag.get_context(question, k=k)
     except Exception as e:
         print(f"Error getting context: {e}")
         return "Historical data unavailable."
@@ -171,7 +572,7 @@ def get_historical_context(question, k=5):
 def rebuild_index():
     """Force rebuild of FAISS index"""
     try:
-        herd_rag.last_indexed = 0
+        herd_rag.reset()
         return herd_rag.build_index()
     except Exception as e:
         print(f"Error rebuilding index: {e}")
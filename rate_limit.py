@@ -0,0 +1,62 @@
+"""
+Rate limiting primitives for HerdWatch
+Token bucket shared by threads and asyncio code
+"""
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket rate limiter usable from both threads and coroutines
+
+    Callers reserve a token up front (the balance may go negative) and then
+    wait out the deficit, so waiters are served in reservation order without
+    polling.
+    """
+
+    def __init__(self, rate, capacity=1):
+        """
+        Args:
+            rate: Tokens added per second (<= 0 disables limiting)
+            capacity: Maximum burst size
+        """
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens=1):
+        """Take tokens and return how long the caller must wait for them"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """Block the calling thread until tokens are available"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        """Wait (without blocking the event loop) until tokens are available"""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def available(self):
+        """Current token balance (negative while callers are queued)"""
+        with self._lock:
+            elapsed = time.monotonic() - self._updated
+            return min(self.capacity, self._tokens + elapsed * self.rate)
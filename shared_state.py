@@ -0,0 +1,131 @@
+"""
+Shared state for multi-process HerdWatch deployments
+Under gunicorn each request may land on a different web worker, and with
+VIDEO_WORKER_MODE=external video jobs run in worker.py. Live events, the
+latest frame and rate-limit counters are exchanged through the SQLite
+database so that any process can answer any request.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from limits.storage import Storage
+from db import (get_shared_events, last_shared_event_id, publish_shared_event, purge_state,
+                state_delete, state_expiry, state_get, state_incr, state_set)
+from frame_buffer import latest_frame
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ────────────────────────────────────────────────────────────
+# Configuration
+# ────────────────────────────────────────────────────────────
+
+SHARED_EVENT_POLL_INTERVAL = float(os.getenv("SHARED_EVENT_POLL_INTERVAL", 0.5))  # Seconds
+SHARED_EVENT_RETENTION = 300  # Seconds shared events are kept for relays to pick up
+SHARED_PURGE_INTERVAL = 60  # Seconds between deleting expired state and old events
+FRAME_STATE_TTL = 3600  # Seconds a job's last frame stays available
+
+
+def forward_events(bus):
+    """
+    Copy every event published on ``bus`` to the shared database
+
+    Used by the video worker process. Frame events also store the frame's
+    JPEG bytes, which the web workers' relays load into their latest_frame.
+    """
+    def forward(event_type, data):
+        if event_type == "frame":
+            frame = latest_frame.get(data.get("job_id"))
+            if frame is not None:
+                state_set(f"frame:{frame['job_id']}", frame["jpeg"], ttl=FRAME_STATE_TTL)
+        publish_shared_event(event_type, data)
+
+    bus.forward(forward)
+
+
+class EventRelay:
+    """Republish events from other processes on this process's event bus
+
+    A background thread polls the shared_events table for rows newer than
+    the last one seen, so SSE clients, /analysis/status and
+    /video/current-frame work on every web worker. Frames keep the ETag
+    assigned by the video worker, so a poll answered by a different web
+    worker still gets 304 Not Modified.
+    """
+
+    def __init__(self, bus, interval=SHARED_EVENT_POLL_INTERVAL):
+        self.bus = bus
+        self.interval = interval
+        self.relayed = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start relaying events published from now on (idempotent)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-relay", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        last_id = last_shared_event_id()
+        last_purge = time.time()
+        while True:
+            time.sleep(self.interval)
+            try:
+                for event in get_shared_events(last_id):
+                    last_id = event["id"]
+                    self._deliver(event["event_type"], event["data"])
+                if time.time() - last_purge >= SHARED_PURGE_INTERVAL:
+                    purge_state(SHARED_EVENT_RETENTION)
+                    last_purge = time.time()
+            except Exception as e:
+                print(f"Error relaying shared events: {e}")
+
+    def _deliver(self, event_type, data):
+        if event_type == "frame":
+            jpeg = state_get(f"frame:{data.get('job_id')}")
+            if jpeg is not None:
+                latest_frame.publish(jpeg, data.get("frame"), data.get("job_id"), etag=data.get("etag"))
+        self.bus.publish(event_type, data)
+        self.relayed += 1
+
+
+class SQLiteLimiterStorage(Storage):
+    """Rate-limit counters in the shared_state table
+
+    Selected with RATELIMIT_STORAGE_URI=sqlite:// so that every web worker
+    counts requests against the same limits (fixed-window strategy).
+    Registered with flask-limiter by importing this module.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+    PREFIX = "limit:"
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        return state_incr(self.PREFIX + key, amount, ttl=expiry)
+
+    def get(self, key):
+        return int(state_get(self.PREFIX + key, 0))
+
+    def get_expiry(self, key):
+        return state_expiry(self.PREFIX + key) or time.time()
+
+    def check(self):
+        try:
+            state_get(self.PREFIX)
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        state_delete(prefix=self.PREFIX)
+
+    def clear(self, key):
+        state_delete(self.PREFIX + key)
@@ -0,0 +1,122 @@
+"""
+Background reply worker for incoming SMS
+/sms/receive stores the message and acknowledges immediately; AI replies
+are generated and sent here, at most once per Africa's Talking message id
+"""
+
+import os
+import queue
+import threading
+from db import claim_inbound, finish_inbound, get_unfinished_inbound, save_message
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ────────────────────────────────────────────────────────────
+# Configuration
+# ────────────────────────────────────────────────────────────
+
+SMS_REPLY_WORKERS = int(os.getenv("SMS_REPLY_WORKERS", 2))  # Replies generated concurrently
+SMS_REPLY_MAX_ATTEMPTS = int(os.getenv("SMS_REPLY_MAX_ATTEMPTS", 3))
+SMS_REPLY_RETRY_DELAY = float(os.getenv("SMS_REPLY_RETRY_DELAY", 30))  # Seconds, times attempt number
+SMS_REPLY_CLAIM_TIMEOUT = float(os.getenv("SMS_REPLY_CLAIM_TIMEOUT", 600))  # Seconds before a claim is abandoned
+
+
+class ReplyWorker:
+    """Queue of inbound message ids answered by background threads
+
+    Each message is claimed in the database before processing, so a
+    message id that is enqueued twice (webhook redelivery, restart) is
+    only answered once. Messages still pending at startup are requeued,
+    as are claims older than ``claim_timeout`` (their process died); newer
+    claims may belong to another live web worker and are left alone.
+    """
+
+    def __init__(self, respond, sms, workers=SMS_REPLY_WORKERS,
+                 max_attempts=SMS_REPLY_MAX_ATTEMPTS, retry_delay=SMS_REPLY_RETRY_DELAY,
+                 claim_timeout=SMS_REPLY_CLAIM_TIMEOUT):
+        """
+        Args:
+            respond: Callable(question) -> reply text
+            sms: at.SMS sender
+        """
+        self.respond = respond
+        self.sms = sms
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_delay = retry_delay
+        self.claim_timeout = claim_timeout
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self.stats = {"replied": 0, "retried": 0, "failed": 0}
+
+    def start(self):
+        """Start worker threads and requeue unanswered messages (idempotent)"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"sms-reply-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        unfinished = get_unfinished_inbound(self.claim_timeout)
+        for message_id in unfinished:
+            self._queue.put(message_id)
+        if unfinished:
+            print(f"Requeued {len(unfinished)} unanswered SMS")
+
+    def enqueue(self, message_id):
+        """Queue an inbound message (already stored with record_inbound)"""
+        self.start()
+        self._queue.put(message_id)
+
+    def pending(self):
+        """Messages waiting for a worker"""
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            message_id = self._queue.get()
+            try:
+                self._process(message_id)
+            except Exception as e:
+                print(f"Error processing SMS {message_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _process(self, message_id):
+        msg = claim_inbound(message_id)
+        if msg is None:
+            return  # Already answered or being answered
+
+        reply = msg["reply"]  # Kept from an earlier attempt whose send failed
+        try:
+            if not reply:
+                reply = self.respond(msg["message"])
+
+            result = self.sms.send_bulk([msg["phone"]], reply)
+            if not result.get("success"):
+                raise RuntimeError(result.get("error") or result["recipients"][0]["status"])
+            delivery = result["recipients"][0]
+
+            save_message(msg["phone"], "sent", reply, delivery["status"], delivery["message_id"])
+            finish_inbound(message_id, "replied", reply=reply)
+            with self._lock:
+                self.stats["replied"] += 1
+
+        except Exception as e:
+            error = str(e)[:200]
+            if msg["attempts"] < self.max_attempts:
+                finish_inbound(message_id, "pending", reply=reply, error=error)
+                timer = threading.Timer(self.retry_delay * msg["attempts"], self._queue.put, (message_id,))
+                timer.daemon = True
+                timer.start()
+                with self._lock:
+                    self.stats["retried"] += 1
+            else:
+                finish_inbound(message_id, "failed", reply=reply, error=error)
+                with self._lock:
+                    self.stats["failed"] += 1
+            print(f"SMS reply to {msg['phone']} failed (attempt {msg['attempts']}): {error}")
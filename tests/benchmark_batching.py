@@ -0,0 +1,107 @@
+"""
+Benchmark for HerdWatch batched frame analysis
+Compares single-frame requests against batched (parts/mosaic) requests
+on the same sampled frames: throughput, request count and agreement
+
+Usage:
+    python tests/benchmark_batching.py cow.mp4 [frames] [batch_size]
+"""
+import sys
+import os
+import re
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+from video_processor import VideoProcessor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COW_PATTERN = re.compile(r"Cow\s*(\d+)\s*:\s*([^.\n,]*)", re.I)
+
+
+def sample_frames(video_path, count, interval=3):
+    """Read ``count`` frames spaced ``interval`` seconds apart"""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    step = max(1, int(fps * interval))
+    frames, numbers = [], []
+    for target in range(step, step * (count + 1), step):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, target - 1)
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, (640, 480)))
+        numbers.append(target)
+    cap.release()
+    return frames, numbers
+
+
+def summarize(analysis):
+    """Reduce an analysis to (cow count, number eating) for comparison"""
+    cows = COW_PATTERN.findall(analysis or "")
+    eating = sum(1 for _, status in cows if "eat" in status.lower())
+    return len(cows), eating
+
+
+def run_single(processor, frames, numbers):
+    started = time.time()
+    results = {n: processor.analyze_frame(f) for n, f in zip(numbers, frames)}
+    return results, time.time() - started, len(frames)
+
+
+def run_batched(processor, frames, numbers, batch_size):
+    started = time.time()
+    results, requests = {}, 0
+    for i in range(0, len(frames), batch_size):
+        results.update(processor.analyze_frames(frames[i:i + batch_size], numbers[i:i + batch_size]))
+        requests += 1
+    return results, time.time() - started, requests
+
+
+def test_batching(video_path="cow.mp4", count=12, batch_size=4):
+    """Benchmark single-frame vs batched analysis on the same frames"""
+    print("=" * 60)
+    print("🐄 HerdWatch Batched Analysis Benchmark")
+    print("=" * 60)
+
+    frames, numbers = sample_frames(video_path, count)
+    if not frames:
+        print(f"❌ Could not read frames from {video_path}")
+        return
+    print(f"📹 {len(frames)} frames from {video_path}, batch size {batch_size}")
+
+    processor = VideoProcessor()
+    baseline, base_time, base_requests = run_single(processor, frames, numbers)
+    print(f"\n[single] {base_requests} requests in {base_time:.1f}s "
+          f"({len(frames) / base_time:.2f} frames/s)")
+
+    for mode in ("parts", "mosaic"):
+        processor.batch_mode = mode
+        results, elapsed, requests = run_batched(processor, frames, numbers, batch_size)
+
+        errors = sum(1 for r in results.values() if r.startswith("Analysis error"))
+        count_match = sum(1 for n in numbers if summarize(results[n])[0] == summarize(baseline[n])[0])
+        eating_match = sum(1 for n in numbers if summarize(results[n]) == summarize(baseline[n]))
+
+        print(f"\n[{mode}] {requests} requests in {elapsed:.1f}s "
+              f"({len(frames) / elapsed:.2f} frames/s, {base_time / elapsed:.1f}x single)")
+        print(f"   cow count agreement:   {count_match}/{len(numbers)}")
+        print(f"   eating agreement:      {eating_match}/{len(numbers)}")
+        print(f"   unattributed frames:   {errors}")
+
+    print("\n" + "=" * 60)
+    print("✅ Benchmark completed")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    test_batching(
+        args[0] if len(args) > 0 else "cow.mp4",
+        int(args[1]) if len(args) > 1 else 12,
+        int(args[2]) if len(args) > 2 else 4,
+    )
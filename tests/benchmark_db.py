@@ -0,0 +1,136 @@
+"""
+Benchmark for HerdWatch database writes under webhook load
+Simulates concurrent /sms/receive requests (two save_message calls each)
+against a scratch database, comparing the old connect-per-call setup, pooled
+WAL connections and the write-behind writer: inserts/sec and p50/p99 latency
+
+Usage:
+    python tests/benchmark_db.py [threads] [requests_per_thread]
+"""
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+
+@contextmanager
+def legacy_get_db():
+    """The original get_db(): a fresh rollback-journal connection per call"""
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def legacy_save_message(phone, msg_type, message):
+    """The original save_message(): one connection and one commit per row"""
+    with legacy_get_db() as conn:
+        conn.execute(db.INSERT_MESSAGE, (phone, msg_type, message, datetime.now().isoformat(), None, None))
+        conn.commit()
+
+
+def pooled_save_message(phone, msg_type, message):
+    """Pooled WAL connection, still one commit per row (write-behind off)"""
+    with db.get_db() as conn:
+        conn.execute(db.INSERT_MESSAGE, (phone, msg_type, message, datetime.now().isoformat(), None, None))
+        conn.commit()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_load(save_message, threads, requests_per_thread):
+    """Each worker handles webhook requests: save received + save reply"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(n):
+        phone = f"+2547000{n:05d}"
+        local = []
+        for i in range(requests_per_thread):
+            started = time.perf_counter()
+            try:
+                save_message(phone, "received", f"How are my cows? ({i})")
+                save_message(phone, "sent", "All cows are eating normally.")
+            except sqlite3.Error as e:
+                errors.append(str(e))
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    db.flush_writes()  # Count write-behind rows only once committed
+    elapsed = time.perf_counter() - started
+
+    return {
+        "inserts_per_second": len(latencies) * 2 / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": len(errors),
+    }
+
+
+def test_db_write_throughput(threads=16, requests_per_thread=50):
+    """Benchmark connect-per-call vs pooled WAL connections vs write-behind"""
+    print("=" * 60)
+    print("🐄 HerdWatch Database Write Benchmark")
+    print("=" * 60)
+    print(f"🧵 {threads} threads × {requests_per_thread} webhook requests")
+
+    modes = (
+        ("connect-per-call", legacy_save_message, legacy_get_db),
+        ("pooled WAL", pooled_save_message, db.get_db),
+        ("write-behind", db.save_message, db.get_db),
+    )
+    original_get_db = db.get_db
+    original_path = db.DB_PATH
+    results = {}
+    try:
+        for label, save_message, get_db in modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                db.DB_PATH = os.path.join(tmp, "bench.db")
+                db.get_db = get_db  # init_db() too, so the baseline never switches to WAL
+                db.init_db()
+                db.get_db = original_get_db
+                results[label] = run_load(save_message, threads, requests_per_thread)
+                db.close_db()
+
+            r = results[label]
+            print(f"\n[{label}] {r['inserts_per_second']:.0f} inserts/s, "
+                  f"p50 {r['p50_ms']:.2f} ms, p99 {r['p99_ms']:.2f} ms, "
+                  f"{r['errors']} errors")
+    finally:
+        db.get_db = original_get_db
+        db.DB_PATH = original_path
+
+    baseline = max(results["connect-per-call"]["inserts_per_second"], 1e-9)
+    for label in ("pooled WAL", "write-behind"):
+        print(f"\n⚡ {label}: {results[label]['inserts_per_second'] / baseline:.1f}x")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    test_db_write_throughput(*args)
@@ -0,0 +1,102 @@
+"""
+Test script for the HerdWatch chat response caches
+LRU eviction, TTL expiry, counters, snapshots, concurrent use and the
+semantic (similar question) tier
+"""
+import sys
+import os
+import tempfile
+import threading
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import LRUCache, SemanticCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")          # "b" is now least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_miss():
+    cache = LRUCache(max_entries=10, ttl=0.05)
+    cache.set("q", "answer")
+    assert cache.get("q") == "answer"
+    time.sleep(0.1)
+
+    assert cache.get("q") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["expirations"] == 1
+    assert stats["size"] == 0
+
+
+def test_snapshot_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.json")
+        cache = LRUCache(max_entries=10, ttl=60, snapshot_path=path, snapshot_interval=3600)
+        cache.set("q1", {"response": "r1"})
+        cache.set("q2", {"response": "r2"}, ttl=-1)  # Already expired: not persisted
+        cache.snapshot()
+
+        restored = LRUCache(max_entries=10, ttl=60, snapshot_path=path, snapshot_interval=3600)
+        assert restored.get("q1") == {"response": "r1"}
+        assert restored.get("q2") is None
+
+
+def test_concurrent_access():
+    cache = LRUCache(max_entries=50, ttl=None)
+
+    def worker(n):
+        for i in range(2000):
+            cache.set(f"{n}-{i % 100}", i)
+            cache.get(f"{(n + 1) % 8}-{i % 100}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = cache.stats()
+    assert stats["size"] == 50
+    assert stats["hits"] + stats["misses"] == 8 * 2000
+
+
+def test_semantic_matches_rephrased_questions():
+    semantic = SemanticCache(max_entries=10, threshold=0.9)
+    semantic.add("How many cows are eating right now?", "state-a", "key-eating")
+    semantic.add("What's the current feeding pattern?", "state-a", "key-pattern")
+
+    assert semantic.lookup("how many cows eating?", "state-a")[0] == "key-eating"
+    assert semantic.lookup("what is the feeding pattern currently", "state-a")[0] == "key-pattern"
+    # Different subject, or same question under a different herd state
+    assert semantic.lookup("How many cows are lying down right now?", "state-a") is None
+    assert semantic.lookup("How many cows are eating right now?", "state-b") is None
+
+    # Question words, modals and negations change the question
+    semantic.add("Are the cows eating?", "state-a", "key-are")
+    assert semantic.lookup("Are the cows eating right now?", "state-a")[0] == "key-are"
+    for other in ("Which cows are eating?", "Should the cows be eating?",
+                  "Are the cows not eating?", "Were the cows eating?"):
+        assert semantic.lookup(other, "state-a") is None, other
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🐄 HerdWatch Response Cache Test")
+    print("=" * 60)
+    for test in (test_evicts_least_recently_used, test_expired_entries_miss,
+                 test_snapshot_round_trip, test_concurrent_access,
+                 test_semantic_matches_rephrased_questions):
+        test()
+        print(f"✓ {test.__name__}")
+    print("=" * 60)
@@ -0,0 +1,104 @@
+"""
+Test script for the HerdWatch analysis log reader
+Multi-line entries, appends, rotation and cursor pagination shared by
+several readers (web workers)
+"""
+import sys
+import os
+import tempfile
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_reader import AnalysisLogReader
+
+RECORDS = [
+    "2025-07-31 16:27:20 - JOB a1 - FRAME 30: Cow 1: Eating\nCow 2: Lying down",
+    "2025-07-31 16:27:21 - JOB a1 - FRAME 60: Cow 1: Walking\nCow 2: Lying down\nCow 3: Drinking",
+    "2025-07-31 16:27:22 - FRAME 90: Cow 1: Standing",
+]
+
+
+def write_log(*records, mode="w", path=None):
+    path = path or os.path.join(tempfile.mkdtemp(), "analysis_log.txt")
+    with open(path, mode) as f:
+        for record in records:
+            f.write(record + "\n")
+    return path
+
+
+def test_small_reads_keep_multi_line_entries_whole():
+    path = write_log(*RECORDS)
+    for read_size in (1, 7, 64, 1024 * 1024):
+        reader = AnalysisLogReader(path, read_size=read_size)
+        entries = reader.read(limit=10)["entries"]
+        assert [e["frame"] for e in entries] == [30, 60, 90], read_size
+        assert entries[1]["analysis"] == "Cow 1: Walking\nCow 2: Lying down\nCow 3: Drinking"
+        assert entries[0]["job_id"] == "a1" and entries[2]["job_id"] is None
+
+
+def test_appended_entries_follow_cursor():
+    path = write_log(*RECORDS[:1])
+    reader = AnalysisLogReader(path, read_size=5)
+    first = reader.read(limit=10)
+    assert len(first["entries"]) == 1
+
+    write_log(*RECORDS[1:], mode="a", path=path)
+    newer = reader.read(limit=10, since=first["cursor"])
+    assert [e["frame"] for e in newer["entries"]] == [60, 90]
+    assert not newer["truncated"]
+
+
+def test_rotated_file_is_finished_before_the_new_one():
+    path = write_log(*RECORDS[:2])
+    reader = AnalysisLogReader(path, read_size=16)
+    reader.refresh()
+
+    os.replace(path, f"{path}.1")
+    write_log(RECORDS[2], path=path)
+    assert [e["frame"] for e in reader.read(limit=10)["entries"]] == [30, 60, 90]
+
+
+def test_cursors_agree_across_readers():
+    path = write_log(*RECORDS[:2])
+    early = AnalysisLogReader(path)
+    early.refresh()
+    os.replace(path, f"{path}.1")
+    write_log(RECORDS[2], path=path)
+
+    # A reader started after the rotation (another web worker, or one that
+    # was recycled) hands out the same cursors and accepts the other's
+    late = AnalysisLogReader(path, read_size=3)
+    assert early.read(limit=10)["entries"] == late.read(limit=10)["entries"]
+    cursor = early.read(limit=2)["entries"][0]["cursor"]
+    assert [e["frame"] for e in late.read(limit=10, since=cursor)["entries"]] == [90]
+
+    write_log(RECORDS[0], mode="a", path=path)
+    latest = late.read(limit=10)["cursor"]
+    empty = early.read(limit=10, since=latest)
+    assert empty["entries"] == [] and empty["cursor"] == latest and not empty["truncated"]
+
+
+def test_unknown_cursor_is_truncated():
+    reader = AnalysisLogReader(write_log(*RECORDS))
+    result = reader.read(limit=10, since="1-0")
+    assert result["truncated"] and len(result["entries"]) == 3
+    for bad in ("12", "a-b", "-5"):
+        try:
+            reader.read(since=bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted cursor {bad!r}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🐄 HerdWatch Analysis Log Reader Test")
+    print("=" * 60)
+    for test in (test_small_reads_keep_multi_line_entries_whole,
+                 test_appended_entries_follow_cursor,
+                 test_rotated_file_is_finished_before_the_new_one,
+                 test_cursors_agree_across_readers, test_unknown_cursor_is_truncated):
+        test()
+        print(f"✓ {test.__name__}")
+    print("=" * 60)
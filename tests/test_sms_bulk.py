@@ -0,0 +1,115 @@
+"""
+Test script for HerdWatch bulk SMS dispatch
+Runs SMS.send_bulk against a local stub of the Africa's Talking SMS API
+(no credentials or network needed)
+"""
+import sys
+import os
+import threading
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from at import SMS
+
+
+class StubProvider:
+    """Mimics africastalking.SMS.send responses
+
+    Numbers in ``flaky`` fail with GatewayError (501) the first ``failures``
+    times they are sent; numbers in ``invalid`` always get InvalidPhoneNumber.
+    """
+
+    def __init__(self, flaky=(), invalid=(), failures=1, raise_first=False):
+        self.flaky = {n: failures for n in flaky}
+        self.invalid = set(invalid)
+        self.raise_first = raise_first
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def send(self, message, recipients, sender):
+        with self._lock:
+            self.calls.append(list(recipients))
+            if self.raise_first:
+                self.raise_first = False
+                raise ConnectionError("Gateway timeout")
+
+            results = []
+            for number in recipients:
+                if number in self.invalid:
+                    results.append({"number": number, "statusCode": 403,
+                                    "status": "InvalidPhoneNumber", "messageId": "None"})
+                elif self.flaky.get(number, 0) > 0:
+                    self.flaky[number] -= 1
+                    results.append({"number": number, "statusCode": 501,
+                                    "status": "GatewayError", "messageId": "None"})
+                else:
+                    results.append({"number": number, "statusCode": 101, "status": "Success",
+                                    "messageId": f"ATXid_{number}", "cost": "KES 0.8000"})
+        return {"SMSMessageData": {"Message": f"Sent to {len(results)}", "Recipients": results}}
+
+
+def farmers(count):
+    return [f"+2547{i:08d}" for i in range(count)]
+
+
+def test_chunks_large_broadcast():
+    """2,000+ recipients are split into provider-sized chunks"""
+    provider = StubProvider()
+    numbers = farmers(2050)
+    result = SMS(client=provider).send_bulk(numbers, "Feed alert", chunk_size=100, backoff=0)
+
+    assert result["status"] == "sent"
+    assert result["sent"] == 2050
+    assert len(provider.calls) == 21
+    assert max(len(c) for c in provider.calls) == 100
+    assert [r["number"] for r in result["recipients"]] == numbers
+    assert result["recipients"][0]["message_id"] == f"ATXid_{numbers[0]}"
+
+
+def test_retries_transient_failures_only():
+    """Gateway errors are retried for the affected numbers; invalid numbers are not"""
+    numbers = farmers(10)
+    provider = StubProvider(flaky=numbers[:3], invalid=numbers[9:], failures=2)
+    result = SMS(client=provider).send_bulk(numbers, "Feed alert", chunk_size=5, backoff=0)
+
+    assert result["status"] == "partial"
+    assert result["sent"] == 9
+    assert result["failed"] == 1
+    by_number = {r["number"]: r for r in result["recipients"]}
+    assert by_number[numbers[0]]["attempts"] == 3
+    assert by_number[numbers[9]]["status"] == "InvalidPhoneNumber"
+    assert by_number[numbers[9]]["attempts"] == 1
+    # Retries only resend the failed numbers
+    assert sorted(len(c) for c in provider.calls) == [3, 3, 5, 5]
+
+
+def test_retries_failed_request():
+    """A chunk whose request raises is retried as a whole"""
+    provider = StubProvider(raise_first=True)
+    result = SMS(client=provider).send_bulk(farmers(5), "Feed alert",
+                                            chunk_size=5, max_workers=1, backoff=0)
+
+    assert result["sent"] == 5
+    assert len(provider.calls) == 2
+
+
+def test_gives_up_after_max_retries():
+    numbers = farmers(2)
+    provider = StubProvider(flaky=numbers, failures=10)
+    result = SMS(client=provider).send_bulk(numbers, "Feed alert", max_retries=2, backoff=0)
+
+    assert result["success"] is False
+    assert result["status"] == "error"
+    assert all(r["attempts"] == 3 for r in result["recipients"])
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🐄 HerdWatch Bulk SMS Test")
+    print("=" * 60)
+    for test in (test_chunks_large_broadcast, test_retries_transient_failures_only,
+                 test_retries_failed_request, test_gives_up_after_max_retries):
+        test()
+        print(f"✓ {test.__name__}")
+    print("=" * 60)
@@ -0,0 +1,150 @@
+"""
+Test script for HerdWatch resumable uploads
+Chunk offsets, resuming after a dropped connection, checksum verification
+and upload tracking for analysis of partial files
+"""
+import sys
+import os
+import hashlib
+import io
+import tempfile
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TMP = tempfile.mkdtemp()
+os.environ["DB_PATH"] = os.path.join(TMP, "test.db")  # Before db is imported
+
+from uploads import UploadError, UploadStore
+
+DATA = os.urandom(3 * 1024 * 1024)
+
+
+def make_store():
+    return UploadStore(folder=tempfile.mkdtemp(dir=TMP))
+
+
+class FakeFile:
+    """Stands in for the request's FileStorage of a spooled part"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+
+def expect_error(call, status):
+    try:
+        call()
+    except UploadError as e:
+        assert e.status == status, e.status
+        return e
+    raise AssertionError(f"expected UploadError {status}")
+
+
+def test_chunks_must_continue_at_offset():
+    store = make_store()
+    upload = store.create("barn cam.mp4", len(DATA))
+    assert upload["filename"] == "barn_cam.mp4" and upload["offset"] == 0
+
+    store.write_chunk(upload["upload_id"], 0, io.BytesIO(DATA[:1000]), 1000)
+    e = expect_error(lambda: store.write_chunk(upload["upload_id"], 0, io.BytesIO(b"x"), 1), 409)
+    assert e.offset == 1000
+    expect_error(lambda: store.write_chunk(upload["upload_id"], 1000, io.BytesIO(DATA), len(DATA)), 400)
+
+
+def test_resume_after_dropped_connection():
+    store = make_store()
+    upload = store.create("cow.mp4", len(DATA))
+    # Connection drops half way through a 2MB chunk: the received half is kept
+    half = DATA[:1024 * 1024]
+    assert store.write_chunk(upload["upload_id"], 0, io.BytesIO(half), 2 * 1024 * 1024)["offset"] == len(half)
+
+    # Starting the same upload again resumes it
+    resumed = store.create("cow.mp4", len(DATA))
+    assert resumed["upload_id"] == upload["upload_id"] and resumed["offset"] == len(half)
+    assert store.in_progress(resumed["filepath"])
+
+    expect_error(lambda: store.complete(upload["upload_id"]), 409)
+    store.write_chunk(upload["upload_id"], len(half), io.BytesIO(DATA[len(half):]), len(DATA) - len(half))
+    done = store.complete(upload["upload_id"], hashlib.sha256(DATA).hexdigest())
+    assert done["status"] == "complete" and done["offset"] == len(DATA)
+    assert not store.in_progress(done["filepath"])
+    with open(done["filepath"], "rb") as f:
+        assert f.read() == DATA
+
+
+def test_checksum_mismatch_discards_file():
+    store = make_store()
+    upload = store.create("bad.mp4", 10, sha256="0" * 64)
+    store.write_chunk(upload["upload_id"], 0, io.BytesIO(b"0123456789"), 10)
+
+    expect_error(lambda: store.complete(upload["upload_id"]), 422)
+    assert not os.path.exists(upload["filepath"])
+    assert store.get(upload["upload_id"]) is None
+
+
+def test_new_upload_of_same_name_replaces_old_session():
+    store = make_store()
+    old = store.create("cam.mp4", 100, sha256="a" * 64)
+    store.write_chunk(old["upload_id"], 0, io.BytesIO(b"x" * 40), 40)
+
+    # Same name and size but a different video: start over, not resume
+    new = store.create("cam.mp4", 100, sha256="b" * 64)
+    assert new["upload_id"] != old["upload_id"] and new["offset"] == 0
+    # A different size also starts over
+    newer = store.create("cam.mp4", 50)
+    assert newer["offset"] == 0
+
+    # Chunks of the replaced sessions can't write into the new file
+    expect_error(lambda: store.write_chunk(old["upload_id"], 0, io.BytesIO(b"y" * 10), 10), 404)
+    expect_error(lambda: store.write_chunk(new["upload_id"], 0, io.BytesIO(b"y" * 10), 10), 404)
+    assert store.write_chunk(newer["upload_id"], 0, io.BytesIO(b"z" * 10), 10)["offset"] == 10
+
+
+def test_single_request_upload_replaces_chunked_session():
+    store = make_store()
+    upload = store.create("pen.mp4", 100)
+    store.write_chunk(upload["upload_id"], 0, io.BytesIO(b"x" * 40), 40)
+
+    # The same file is then sent as one multipart request
+    spool = store.spool_file()
+    spool.write(b"new video")
+    spool.seek(0)  # As the multipart parser leaves it
+    name, filepath, size = store.keep_spooled(FakeFile(spool), "pen.mp4")
+    assert (name, size) == ("pen.mp4", 9) and not store.in_progress(filepath)
+
+    # The chunked upload's next chunk can't append to the new file
+    expect_error(lambda: store.write_chunk(upload["upload_id"], 40, io.BytesIO(b"y" * 10), 10), 404)
+    with open(filepath, "rb") as f:
+        assert f.read() == b"new video"
+
+
+def test_single_request_upload_size_limit():
+    store = UploadStore(folder=tempfile.mkdtemp(dir=TMP), max_size=10)
+    spool = store.spool_file()
+    spool.write(b"x" * 11)
+    spool.seek(0)
+    expect_error(lambda: store.keep_spooled(FakeFile(spool), "big.mp4"), 413)
+
+    store.discard_spooled([spool])
+    assert os.listdir(store.folder) == []
+
+
+def test_rejects_invalid_uploads():
+    store = make_store()
+    expect_error(lambda: store.create("notes.txt", 10), 400)
+    expect_error(lambda: store.create("big.mp4", store.max_size + 1), 413)
+    expect_error(lambda: store.write_chunk("missing", 0, io.BytesIO(b"x"), 1), 404)
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("🐄 HerdWatch Resumable Upload Test")
+    print("=" * 60)
+    for test in (test_chunks_must_continue_at_offset, test_resume_after_dropped_connection,
+                 test_checksum_mismatch_discards_file,
+                 test_new_upload_of_same_name_replaces_old_session,
+                 test_single_request_upload_replaces_chunked_session,
+                 test_single_request_upload_size_limit, test_rejects_invalid_uploads):
+        test()
+        print(f"✓ {test.__name__}")
+    print("=" * 60)
@@ -0,0 +1,331 @@
+"""
+Resumable video uploads for HerdWatch
+Large videos are sent in chunks that are written straight into their final
+file in the uploads folder, so a dropped connection only loses the chunk in
+flight and the client resumes from the offset the server reports. Upload
+sessions live in the shared database, so any web worker can take any chunk,
+and a video can be analyzed while it is still being uploaded.
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from datetime import datetime
+from werkzeug.utils import secure_filename
+from db import state_delete, state_get, state_set
+from dotenv import load_dotenv
+
+try:
+    import fcntl  # Serializes writers across processes (not available on Windows)
+except ImportError:
+    fcntl = None
+
+load_dotenv()
+
+# ────────────────────────────────────────────────────────────
+# Configuration
+# ────────────────────────────────────────────────────────────
+
+UPLOAD_FOLDER = "uploads"
+ALLOWED_EXTENSIONS = {"mp4", "avi", "mov", "mkv"}
+MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))  # Suggested bytes per chunk
+UPLOAD_MAX_CHUNK_SIZE = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", 64 * 1024 * 1024))  # Larger chunks are refused
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600))  # Seconds an idle upload can be resumed
+UPLOAD_BUFFER_SIZE = 1024 * 1024  # Bytes held in memory while copying a chunk to disk
+SPOOL_PREFIX = ".upload-"  # Single-request uploads in progress
+
+
+class UploadError(Exception):
+    """Raised when an upload request can't be accepted
+
+    ``status`` is the HTTP status code to answer with; ``offset`` (when
+    set) is where the client should continue.
+    """
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def allowed_file(filename):
+    """Check if file extension is allowed"""
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file, read in UPLOAD_BUFFER_SIZE blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_BUFFER_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadStore:
+    """Chunked, resumable uploads into the uploads folder
+
+    The file on disk is the source of truth for how much has arrived: a
+    chunk must start exactly at the current file size, and a chunk cut off
+    by a dropped connection still keeps the bytes that made it. Memory use
+    is one UPLOAD_BUFFER_SIZE block per chunk in flight.
+    """
+
+    def __init__(self, folder=UPLOAD_FOLDER, max_size=MAX_FILE_SIZE, ttl=UPLOAD_SESSION_TTL):
+        self.folder = folder
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()  # Writers in this process (fcntl covers other processes)
+        self._writing = set()
+        os.makedirs(folder, exist_ok=True)
+
+    # ── Sessions ─────────────────────────────────────────────
+
+    def create(self, filename, size, sha256=None):
+        """
+        Start an upload (or find the unfinished upload of the same file)
+
+        Args:
+            filename: Original file name
+            size: Total size in bytes
+            sha256: Expected SHA-256 hex digest (optional, checked on completion)
+
+        Returns:
+            dict: Upload session, with the current "offset"
+
+        Raises:
+            UploadError: Invalid name or size
+
+        An unfinished upload of the same name is resumed only when its size
+        and checksum match; otherwise it is invalidated and the file is
+        started over, so its remaining chunks can't land in the new file.
+        """
+        name = secure_filename(filename or "")
+        if not name or not allowed_file(name):
+            raise UploadError(f"File type not allowed. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}")
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError("size must be a positive number of bytes")
+        if size > self.max_size:
+            raise UploadError(f"File too large. Max size: {self.max_size // 1024 // 1024}MB", 413)
+
+        sha256 = sha256.lower() if sha256 else None
+        existing = self.find(name)
+        if existing is not None and existing["size"] == size and existing["sha256"] == sha256:
+            return self._with_offset(existing)  # Resume instead of starting over
+
+        upload = {
+            "upload_id": uuid.uuid4().hex,
+            "filename": name,
+            "filepath": os.path.join(self.folder, name),
+            "size": size,
+            "sha256": sha256,
+            "status": "uploading",
+            "created_at": datetime.now().isoformat(),
+        }
+        with open(upload["filepath"], "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)  # Let a chunk in flight finish first
+            if existing is not None:
+                state_delete(f"upload:{existing['upload_id']}")
+            f.truncate(0)  # Replaces any earlier file of that name
+            self._save(upload)
+        return self._with_offset(upload)
+
+    def get(self, upload_id):
+        """Upload session with its current offset, or None"""
+        upload = state_get(f"upload:{upload_id}")
+        return self._with_offset(upload) if upload else None
+
+    def find(self, filename):
+        """Unfinished upload of a file, or None"""
+        upload_id = state_get(f"uploading:{secure_filename(filename)}")
+        return state_get(f"upload:{upload_id}") if upload_id else None
+
+    def in_progress(self, path):
+        """True while the file at ``path`` is still being uploaded"""
+        return self.find(os.path.basename(path)) is not None
+
+    def _save(self, upload):
+        state_set(f"upload:{upload['upload_id']}", upload, ttl=self.ttl)
+        if upload["status"] == "uploading":
+            state_set(f"uploading:{upload['filename']}", upload["upload_id"], ttl=self.ttl)
+        else:
+            state_delete(f"uploading:{upload['filename']}")
+
+    def _with_offset(self, upload):
+        upload = dict(upload)
+        try:
+            upload["offset"] = os.path.getsize(upload["filepath"])
+        except OSError:
+            upload["offset"] = 0
+        return upload
+
+    # ── Data ─────────────────────────────────────────────────
+
+    def write_chunk(self, upload_id, offset, stream, length):
+        """
+        Append one chunk, copying it from the request stream block by block
+
+        Args:
+            upload_id: Upload id
+            offset: Byte position of the chunk (must equal the current size)
+            stream: Readable request body
+            length: Chunk size in bytes (Content-Length)
+
+        Returns:
+            dict: Upload session with the new offset
+
+        Raises:
+            UploadError: Unknown upload, wrong offset, chunk too large, or
+            another request is writing the same upload
+        """
+        upload = state_get(f"upload:{upload_id}")
+        if upload is None:
+            raise UploadError("Unknown or expired upload", 404)
+        if upload["status"] != "uploading":
+            raise UploadError("Upload already completed", 409, offset=upload["size"])
+        if length is None:
+            raise UploadError("Content-Length required", 411)
+        if length > UPLOAD_MAX_CHUNK_SIZE:
+            raise UploadError(f"Chunk too large. Max: {UPLOAD_MAX_CHUNK_SIZE} bytes", 413)
+        if offset + length > upload["size"]:
+            raise UploadError("Chunk extends past the declared size", 400)
+
+        with self._lock:
+            if upload_id in self._writing:
+                raise UploadError("Another chunk of this upload is being written", 409)
+            self._writing.add(upload_id)
+        try:
+            with open(upload["filepath"], "r+b") as f:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        raise UploadError("Another chunk of this upload is being written", 409)
+                if state_get(f"upload:{upload_id}") is None:
+                    raise UploadError("Upload was replaced by a new upload of this file", 404)
+                current = os.fstat(f.fileno()).st_size
+                if offset != current:
+                    raise UploadError(f"Expected offset {current}", 409, offset=current)
+                f.seek(offset)
+                remaining = length
+                while remaining > 0:
+                    block = stream.read(min(UPLOAD_BUFFER_SIZE, remaining))
+                    if not block:
+                        break  # Client went away; the bytes written so far are kept
+                    f.write(block)
+                    remaining -= len(block)
+                self._save(upload)  # Refresh the session's expiry (still holding the lock)
+        finally:
+            with self._lock:
+                self._writing.discard(upload_id)
+
+        return self._with_offset(upload)
+
+    def complete(self, upload_id, sha256=None):
+        """
+        Finish an upload after checking its size and checksum
+
+        Args:
+            upload_id: Upload id
+            sha256: Expected SHA-256 hex digest (default: the one given at creation)
+
+        Returns:
+            dict: Completed upload session, with the file's "sha256"
+
+        Raises:
+            UploadError: Unknown upload, data missing, or checksum mismatch
+            (the file is deleted and the upload must start over)
+        """
+        upload = self.get(upload_id)
+        if upload is None:
+            raise UploadError("Unknown or expired upload", 404)
+        if upload["status"] == "complete":
+            return upload
+        if upload["offset"] != upload["size"]:
+            raise UploadError(
+                f"Upload incomplete: {upload['offset']} of {upload['size']} bytes", 409,
+                offset=upload["offset"]
+            )
+
+        expected = (sha256 or upload["sha256"] or "").lower() or None
+        actual = file_sha256(upload["filepath"])
+        if expected is not None and actual != expected:
+            self.abort(upload_id)
+            raise UploadError("Checksum mismatch; upload the file again", 422)
+
+        upload.update(status="complete", sha256=actual, completed_at=datetime.now().isoformat())
+        del upload["offset"]
+        self._save(upload)
+        return self._with_offset(upload)
+
+    def abort(self, upload_id):
+        """Delete an upload and its partial file; returns False if unknown"""
+        upload = state_get(f"upload:{upload_id}")
+        if upload is None:
+            return False
+        state_delete(f"upload:{upload_id}")
+        if state_get(f"uploading:{upload['filename']}") == upload_id:
+            state_delete(f"uploading:{upload['filename']}")
+            if os.path.exists(upload["filepath"]):
+                os.remove(upload["filepath"])
+        return True
+
+    # ── Single-request uploads ───────────────────────────────
+
+    def spool_file(self):
+        """
+        Open a file in the uploads folder for a multipart upload to stream into
+
+        Used as the request's file stream so the upload is written once,
+        then renamed into place by ``keep_spooled``.
+        """
+        return open(os.path.join(self.folder, f"{SPOOL_PREFIX}{uuid.uuid4().hex}"), "w+b")
+
+    def keep_spooled(self, file, filename):
+        """
+        Move a spooled multipart upload to its final name
+
+        Returns:
+            tuple: (filename, filepath, size)
+
+        Raises:
+            UploadError: The file is larger than the size limit (it is left
+            for ``discard_spooled``)
+
+        An unfinished chunked upload of the same name is invalidated under
+        the file lock first, so its remaining chunks can't land in the new file.
+        """
+        name = secure_filename(filename)
+        filepath = os.path.join(self.folder, name)
+        size = os.fstat(file.stream.fileno()).st_size
+        if size > self.max_size:
+            raise UploadError(f"File too large. Max size: {self.max_size // 1024 // 1024}MB", 413)
+        file.stream.close()
+
+        with open(filepath, "ab") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)  # Let a chunk in flight finish first
+            existing = self.find(name)
+            if existing is not None:
+                state_delete(f"upload:{existing['upload_id']}")
+            state_delete(f"uploading:{name}")
+            os.replace(file.stream.name, filepath)
+        return name, filepath, size
+
+    @staticmethod
+    def discard_spooled(streams):
+        """Delete spooled multipart files that were not kept"""
+        for stream in streams:
+            path = getattr(stream, "name", None)
+            if isinstance(path, str) and os.path.basename(path).startswith(SPOOL_PREFIX):
+                stream.close()
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+# Global upload store
+upload_store = UploadStore()
@@ -4,17 +4,27 @@ Handles video analysis with Azure OpenAI for both uploaded files and webcam stre
 """
 
 import cv2
+import numpy as np
 import base64
 import os
 import json
+import math
+import queue
+import re
 import threading
 import time
 import logging
+from concurrent.futures import CancelledError, Future, InvalidStateError
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
 from langchain_core.messages import HumanMessage
 from langchain_openai import AzureChatOpenAI
 from dotenv import load_dotenv
+from ai_engine import ai_engine
+from db import init_db, save_analyses
+from events import event_bus
+from frame_buffer import CURRENT_FRAME_FILE, encode_jpeg, latest_frame, preview_stream
+from frame_filters import FrameHashCache, MotionGate, dhash
 
 load_dotenv()
 
@@ -39,6 +49,67 @@ SHARED_DATA_FILE = "cow_analysis_data.json"
 ANALYSIS_LOG_FILE = "analysis_log.txt"
 UPLOADS_DIR = "uploads"
 
+# The shared data file is only a snapshot for out-of-process readers (the
+# standalone chat CLI); in-process readers use the event bus instead
+SHARED_DATA_WRITE_INTERVAL = float(os.getenv("SHARED_DATA_WRITE_INTERVAL", 5))  # Seconds
+
+# Analysis pipeline tuning (request concurrency and rate live in ai_engine)
+FRAME_QUEUE_SIZE = int(os.getenv("FRAME_QUEUE_SIZE", 8))  # Sampled frames in flight
+
+# Batched analysis: pack ANALYSIS_BATCH_SIZE frames into one model request,
+# either as separate image parts ("parts") or one tiled image ("mosaic")
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", 1))
+ANALYSIS_BATCH_MODE = os.getenv("ANALYSIS_BATCH_MODE", "parts").lower()
+ANALYSIS_BATCH_MAX_WAIT = float(os.getenv("ANALYSIS_BATCH_MAX_WAIT", 10))  # Seconds a partial batch may wait
+
+ANALYSIS_PROMPT = (
+    "Detect cows in this image. For each cow, report: 1) If it's eating or standing, "
+    "2) The feed type if eating. Keep response concise. "
+    "Format: 'Cow 1: [status]. Cow 2: [status].' If no cows, say 'No cows detected.'"
+)
+
+BATCH_PROMPT = (
+    "You are given {count} video frames from a barn camera, labelled {labels}. "
+    "Analyze each frame independently. Detect cows in the frame. For each cow, report: "
+    "1) If it's eating or standing, 2) The feed type if eating. Keep each answer concise. "
+    "Start each frame's answer on a new line with its label, exactly like "
+    "'FRAME 90: Cow 1: [status]. Cow 2: [status].' "
+    "If a frame has no cows, write 'FRAME <n>: No cows detected.'"
+)
+
+# A label starts a line, optionally after markdown ("**FRAME 180:**",
+# "- FRAME 180 -", "### Frame 180:"), so "as in frame 180:" inside an
+# answer doesn't start a new one
+BATCH_LABEL = r"^[ \t>#*_-]*FRAME\s*{}\s*[*_]*\s*[:\-]\s*[*_]*"
+BATCH_ANSWER_PATTERN = re.compile(
+    BATCH_LABEL.format(r"(\d+)") + r"(.*?)(?=" + BATCH_LABEL.format(r"\d+") + r"|\Z)",
+    re.S | re.I | re.M
+)
+
+# Frame sampling: "seek" jumps straight to sampled frames, "grab" skips frames
+# without retrieving them, "decode" decodes every frame (legacy behaviour)
+FRAME_SAMPLING_MODE = os.getenv("FRAME_SAMPLING_MODE", "seek").lower()
+SEEK_MIN_FRAME_GAP = int(os.getenv("SEEK_MIN_FRAME_GAP", 15))  # Below this, grabbing is cheaper than seeking
+# Files still being uploaded are re-read from the last frame this often
+UPLOAD_FOLLOW_INTERVAL = float(os.getenv("UPLOAD_FOLLOW_INTERVAL", 2))  # Seconds
+
+# Near-duplicate frame cache: reuse the analysis of a recent frame whose
+# perceptual hash is within DEDUP_HAMMING_THRESHOLD bits
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+DEDUP_HAMMING_THRESHOLD = int(os.getenv("DEDUP_HAMMING_THRESHOLD", 5))
+DEDUP_CACHE_SIZE = int(os.getenv("DEDUP_CACHE_SIZE", 64))
+
+# Motion gating: only analyze a sampled frame when enough of the scene has
+# changed since the last analyzed frame, or MOTION_MAX_STALENESS has passed
+MOTION_GATE_ENABLED = os.getenv("MOTION_GATE_ENABLED", "true").lower() in ("1", "true", "yes")
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", 0.02))  # Fraction of pixels changed
+MOTION_PIXEL_THRESHOLD = int(os.getenv("MOTION_PIXEL_THRESHOLD", 25))  # Grayscale delta per pixel
+MOTION_MAX_STALENESS = float(os.getenv("MOTION_MAX_STALENESS", 60))  # Seconds
+
+# Structured analysis store: rows are buffered and written to SQLite in batches
+ANALYSIS_DB_BATCH_SIZE = int(os.getenv("ANALYSIS_DB_BATCH_SIZE", 20))
+ANALYSIS_DB_FLUSH_INTERVAL = float(os.getenv("ANALYSIS_DB_FLUSH_INTERVAL", 10))  # Seconds
+
 # Create uploads directory if it doesn't exist
 if not os.path.exists(UPLOADS_DIR):
     os.makedirs(UPLOADS_DIR)
@@ -47,12 +118,42 @@ if not os.path.exists(UPLOADS_DIR):
 class VideoProcessor:
     """Process video files or webcam stream with Azure OpenAI analysis"""
     
-    def __init__(self):
+    def __init__(self, queue_size=FRAME_QUEUE_SIZE, batch_size=ANALYSIS_BATCH_SIZE,
+                 batch_mode=ANALYSIS_BATCH_MODE, job_id=None):
+        self.job_id = job_id
+        self.source = None
+        self.created_at = datetime.now().isoformat()
         self.is_processing = False
         self.current_status = "idle"
         self.frame_count = 0
+        self.total_frames = None  # Known for video files
+        self.resume_frame = 0  # Last frame whose analysis has been stored
         self.latest_analysis = "Ready for analysis"
         self.processing_thread = None
+        self._last_shared_write = 0.0
+        self._last_shared_data = None  # Last published analysis, for the final snapshot
+        self._db_buffer = []  # Analyses not yet written to the database
+        self._last_db_flush = time.time()
+        
+        # Pipeline configuration
+        self.queue_size = max(1, int(queue_size))
+        self.batch_size = max(1, int(batch_size))
+        self.batch_mode = batch_mode
+        self.lane = job_id or "video"  # AI engine scheduling lane (one per stream)
+        self.stats = self._new_stats()
+        self.sampling = self._new_sampling(FRAME_SAMPLING_MODE)
+        self.dedup_cache = (
+            FrameHashCache(max_entries=DEDUP_CACHE_SIZE, threshold=DEDUP_HAMMING_THRESHOLD)
+            if DEDUP_ENABLED else None
+        )
+        self.motion_gate = (
+            MotionGate(
+                threshold=MOTION_THRESHOLD,
+                pixel_threshold=MOTION_PIXEL_THRESHOLD,
+                max_staleness=MOTION_MAX_STALENESS
+            )
+            if MOTION_GATE_ENABLED else None
+        )
         
         # Thread safety
         self._lock = threading.Lock()
@@ -65,6 +166,10 @@ class VideoProcessor:
         self.analysis_logger = logging.getLogger("analysis")
         self.analysis_logger.setLevel(logging.INFO)
         
+        # The logger is process-wide; every processor shares one handler
+        if self.analysis_logger.handlers:
+            return
+        
         handler = RotatingFileHandler(
             ANALYSIS_LOG_FILE,
             maxBytes=5 * 1024 * 1024,  # 5MB per file
@@ -74,6 +179,28 @@ class VideoProcessor:
         formatter = logging.Formatter("%(message)s")
         handler.setFormatter(formatter)
         self.analysis_logger.addHandler(handler)
+    
+    @staticmethod
+    def _new_stats():
+        """Fresh pipeline counters for a processing run"""
+        return {
+            "frames_sampled": 0,
+            "frames_analyzed": 0,
+            "requests": 0,
+            "started_at": None,
+            "finished_at": None,
+        }
+    
+    @staticmethod
+    def _new_sampling(mode):
+        """Fresh frame sampling counters for a processing run"""
+        return {
+            "mode": mode,
+            "frames_decoded": 0,   # Frames fully decoded and retrieved
+            "frames_skipped": 0,   # Frames grabbed or seeked over without retrieval
+            "decode_seconds": 0.0,
+            "skip_seconds": 0.0,
+        }
         
     def analyze_frame(self, frame):
         """Analyze a single frame with Azure OpenAI"""
@@ -81,37 +208,555 @@ class VideoProcessor:
             return "No frame to analyze"
         
         try:
-            # Convert frame to base64
-            _, img_buffer = cv2.imencode('.jpg', frame)
-            image_data = base64.b64encode(img_buffer).decode('utf-8')
-            
-            # Create message with image
-            message = HumanMessage(
-                content=[
-                    {
-                        "type": "text", 
-                        "text": "Detect cows in this image. For each cow, report: 1) If it's eating or standing, 2) The feed type if eating. Keep response concise. Format: 'Cow 1: [status]. Cow 2: [status].' If no cows, say 'No cows detected.'"
-                    },
-                    {
-                        "type": "image_url", 
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
-                    }
-                ]
-            )
+            message = self._frame_message(frame)
+            return ai_engine.submit(self._analyze_async(message)).result()
+        except Exception as e:
+            return f"Analysis error: {str(e)[:100]}"
+    
+    def analyze_frames(self, frames, frame_numbers):
+        """Analyze several frames in a single Azure OpenAI request
+        
+        Args:
+            frames: List of frames (already resized)
+            frame_numbers: Frame number for each frame, used as its label
             
-            # Get response from Azure OpenAI
-            response = model.invoke([message])
+        Returns:
+            dict: {frame_number: analysis text}
+        """
+        try:
+            message = self._batch_message(frames, frame_numbers)
+            return ai_engine.submit(self._analyze_batch_async(message, frame_numbers)).result()
+        except Exception as e:
+            error = f"Analysis error: {str(e)[:100]}"
+            return {n: error for n in frame_numbers}
+    
+    def _frame_message(self, frame, jpeg=None):
+        """Build the single-frame analysis message (``jpeg``: frame already encoded)"""
+        return HumanMessage(
+            content=[
+                {
+                    "type": "text", 
+                    "text": ANALYSIS_PROMPT
+                },
+                self._image_part(frame, jpeg)
+            ]
+        )
+    
+    def _batch_message(self, frames, frame_numbers, jpegs=None):
+        """Build one message carrying several labelled frames
+        
+        ``jpegs`` optionally holds each frame already encoded, reused in
+        parts mode instead of encoding the frames again.
+        """
+        labels = ", ".join(f"FRAME {n}" for n in frame_numbers)
+        content = [{
+            "type": "text",
+            "text": BATCH_PROMPT.format(count=len(frames), labels=labels)
+        }]
+        
+        if self.batch_mode == "mosaic":
+            content.append(self._image_part(self._build_mosaic(frames, frame_numbers)))
+        else:
+            jpegs = jpegs or [None] * len(frames)
+            for frame_num, frame, jpeg in zip(frame_numbers, frames, jpegs):
+                content.append({"type": "text", "text": f"FRAME {frame_num}:"})
+                content.append(self._image_part(frame, jpeg))
+        
+        return HumanMessage(content=content)
+    
+    async def _analyze_async(self, message):
+        """Send one analysis request through the shared AI engine"""
+        with self._lock:
+            self.stats["requests"] += 1
+        try:
+            response = await ai_engine.ainvoke(model, [message], lane=self.lane)
             return response.content
-            
         except Exception as e:
             return f"Analysis error: {str(e)[:100]}"
     
-    def process_video_file(self, video_path, frame_interval=None):
+    async def _analyze_batch_async(self, message, frame_numbers):
+        """Send one batched request and split the answer per frame"""
+        with self._lock:
+            self.stats["requests"] += 1
+        try:
+            response = await ai_engine.ainvoke(model, [message], lane=self.lane)
+            return self._split_batch_answer(response.content, frame_numbers)
+        except Exception as e:
+            error = f"Analysis error: {str(e)[:100]}"
+            return {n: error for n in frame_numbers}
+    
+    @staticmethod
+    def _image_part(frame, jpeg=None):
+        """Build a base64 JPEG image_url message part, encoding the frame unless ``jpeg`` is given"""
+        if jpeg is None:
+            jpeg = encode_jpeg(frame)
+        image_data = base64.b64encode(jpeg).decode('utf-8')
+        return {
+            "type": "image_url",
+            "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
+        }
+    
+    @staticmethod
+    def _build_mosaic(frames, frame_numbers, size=(640, 480)):
+        """Tile frames into one labelled grid image of at most 2x the base size"""
+        cols = math.ceil(math.sqrt(len(frames)))
+        rows = math.ceil(len(frames) / cols)
+        tile_w = size[0] * 2 // cols
+        tile_h = size[1] * 2 // rows
+        mosaic = np.zeros((tile_h * rows, tile_w * cols, 3), dtype=np.uint8)
+        
+        for i, (frame_num, frame) in enumerate(zip(frame_numbers, frames)):
+            row, col = divmod(i, cols)
+            tile = cv2.resize(frame, (tile_w, tile_h))
+            cv2.putText(tile, f"FRAME {frame_num}", (8, 28), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.8, (0, 0, 0), 4, cv2.LINE_AA)
+            cv2.putText(tile, f"FRAME {frame_num}", (8, 28), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.8, (255, 255, 255), 2, cv2.LINE_AA)
+            mosaic[row * tile_h:(row + 1) * tile_h, col * tile_w:(col + 1) * tile_w] = tile
+        
+        return mosaic
+    
+    @staticmethod
+    def _split_batch_answer(text, frame_numbers):
+        """Attribute a batched response back to its frames
+        
+        Frames the model didn't label get an "Analysis error" entry so they
+        show up as errors in the log and are not cached.
+        """
+        answers = {}
+        for match in BATCH_ANSWER_PATTERN.finditer(text or ""):
+            frame_num = int(match.group(1))
+            if frame_num in frame_numbers and frame_num not in answers:
+                answers[frame_num] = match.group(2).strip().strip("*_").strip()
+        
+        return {
+            n: answers.get(n) or f"Analysis error: batch response missing FRAME {n}"
+            for n in frame_numbers
+        }
+    
+    def _submit_analysis(self, frame, jpeg, frame_num, batch):
+        """Queue a frame for analysis, reusing the result for near-duplicate frames
+        
+        The dedup cache stores futures rather than strings, so a frame that
+        matches one still being analyzed shares that in-flight call. Failed
+        or cancelled analyses are evicted so they are retried next time.
+        
+        In batched mode the frame is appended to ``batch`` with a placeholder
+        future that is resolved once ``_submit_batch`` sends the batch.
+        
+        Returns:
+            Future resolving to the analysis text
+        """
+        frame_hash = None
+        if self.dedup_cache is not None:
+            frame_hash = dhash(frame)
+            cached = self.dedup_cache.lookup(frame_hash)
+            if cached is not None:
+                return cached
+        
+        if self.batch_size > 1:
+            future = Future()
+            batch.append((frame_num, frame, jpeg, future))
+        else:
+            future = ai_engine.submit(self._analyze_async(self._frame_message(frame, jpeg)))
+        
+        if frame_hash is not None:
+            self.dedup_cache.store(frame_hash, future)
+            
+            def forget_failed(done):
+                if done.cancelled() or done.exception() is not None or \
+                        str(done.result()).startswith("Analysis error"):
+                    self.dedup_cache.discard(frame_hash, done)
+            
+            future.add_done_callback(forget_failed)
+        
+        return future
+    
+    def _submit_batch(self, batch):
+        """Send the accumulated batch as one request and resolve its frame futures"""
+        if not batch:
+            return
+        items = list(batch)
+        batch.clear()
+        
+        frame_numbers = [frame_num for frame_num, _, _, _ in items]
+        message = self._batch_message(
+            [frame for _, frame, _, _ in items], frame_numbers,
+            jpegs=[jpeg for _, _, jpeg, _ in items]
+        )
+        batch_future = ai_engine.submit(self._analyze_batch_async(message, frame_numbers))
+        
+        def resolve(done):
+            if done.cancelled():
+                answers = {}
+            elif done.exception() is not None:
+                error = f"Analysis error: {str(done.exception())[:100]}"
+                answers = {frame_num: error for frame_num, _, _, _ in items}
+            else:
+                answers = done.result()
+            for frame_num, _, _, future in items:
+                if frame_num not in answers:
+                    future.cancel()
+                    continue
+                try:
+                    future.set_result(answers[frame_num])
+                except InvalidStateError:
+                    pass  # Cancelled by the sink
+        
+        batch_future.add_done_callback(resolve)
+    
+    def _motion_summary(self):
+        """Summarize how many sampled frames the motion gate let through"""
+        if self.motion_gate is None:
+            return {"enabled": False}
+        stats = self.motion_gate.stats()
+        stats["enabled"] = True
+        return stats
+    
+    def _dedup_summary(self):
+        """Summarize near-duplicate cache effectiveness"""
+        if self.dedup_cache is None:
+            return {"enabled": False}
+        stats = self.dedup_cache.stats()
+        stats["enabled"] = True
+        stats["skipped_calls"] = stats["hits"]
+        return stats
+    
+    def _read_frames(self, cap, frame_skip, deadline=None, mode=None):
+        """Yield every nth frame from an open capture
+        
+        Args:
+            cap: Open cv2.VideoCapture
+            frame_skip: Yield one frame out of every ``frame_skip``
+            deadline: Optional time.time() value after which reading stops
+            mode: Sampling mode ("seek", "grab" or "decode"), default from env
+            
+        Yields:
+            tuple: (frame_number, frame)
+        """
+        mode = mode or FRAME_SAMPLING_MODE
+        with self._lock:
+            self.sampling = self._new_sampling(mode)
+        
+        if mode == "seek":
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            # Live sources report no frame count and can't seek; short gaps
+            # are cheaper to grab through than to seek over
+            if deadline is None and total_frames > 0 and frame_skip >= SEEK_MIN_FRAME_GAP:
+                yield from self._seek_frames(cap, frame_skip, total_frames)
+                return
+            mode = "grab"
+            with self._lock:
+                self.sampling["mode"] = mode
+        
+        yield from self._sequential_frames(cap, frame_skip, deadline, grab=(mode == "grab"))
+    
+    def _sequential_frames(self, cap, frame_skip, deadline=None, grab=True):
+        """Read frames in order, retrieving only the sampled ones when ``grab`` is set"""
+        while cap.isOpened() and self.is_processing:
+            if deadline is not None and time.time() >= deadline:
+                break
+            
+            with self._lock:
+                current_frame = self.frame_count + 1
+            
+            # Process every nth frame
+            sampled = current_frame % frame_skip == 0
+            started = time.perf_counter()
+            if sampled or not grab:
+                ret, frame = cap.read()
+            else:
+                ret, frame = cap.grab(), None
+            elapsed = time.perf_counter() - started
+            
+            if not ret:
+                break
+            
+            # Live preview runs at its own rate, independent of sampling
+            if preview_stream.wants_frame(self.job_id):
+                if frame is None:
+                    ret, frame = cap.retrieve()
+                if ret:
+                    preview_stream.publish(frame, self.job_id)
+            
+            with self._lock:
+                self.frame_count = current_frame
+                if sampled:
+                    self.sampling["frames_decoded"] += 1
+                    self.sampling["decode_seconds"] += elapsed
+                else:
+                    self.sampling["frames_skipped"] += 1
+                    self.sampling["skip_seconds"] += elapsed
+            
+            if sampled:
+                yield current_frame, frame
+    
+    def _seek_frames(self, cap, frame_skip, total_frames):
+        """Jump directly to each sampled frame with CAP_PROP_POS_FRAMES
+        
+        Falls back to sequential grabbing from the current position as soon
+        as the container reports a position other than the one requested,
+        since some codecs/containers only seek to the nearest keyframe.
+        """
+        with self._lock:
+            position = self.frame_count  # Index of the next frame the decoder will return
+        target = (position // frame_skip + 1) * frame_skip
+        
+        while target <= total_frames and cap.isOpened() and self.is_processing:
+            started = time.perf_counter()
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target - 1)
+            landed = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+            seek_elapsed = time.perf_counter() - started
+            
+            if landed != target - 1:
+                # Inaccurate seek: resume sequential grabbing from wherever we landed
+                with self._lock:
+                    self.frame_count = max(landed, 0)
+                    self.sampling["mode"] = "grab (seek fallback)"
+                    self.sampling["skip_seconds"] += seek_elapsed
+                yield from self._sequential_frames(cap, frame_skip, grab=True)
+                return
+            
+            started = time.perf_counter()
+            ret, frame = cap.read()
+            read_elapsed = time.perf_counter() - started
+            if not ret:
+                break
+            if preview_stream.wants_frame(self.job_id):
+                preview_stream.publish(frame, self.job_id)
+            
+            with self._lock:
+                self.frame_count = target
+                self.sampling["frames_skipped"] += target - 1 - position
+                self.sampling["skip_seconds"] += seek_elapsed
+                self.sampling["frames_decoded"] += 1
+                self.sampling["decode_seconds"] += read_elapsed
+            
+            yield target, frame
+            position = target
+            target += frame_skip
+    
+    def _follow_frames(self, video_path, cap, frame_skip, growing):
+        """Sample frames of a file that is still being uploaded
+        
+        When the decoder runs out of data while ``growing()`` is true, wait
+        UPLOAD_FOLLOW_INTERVAL seconds, reopen the file and carry on from the
+        current frame. One last pass after the upload finishes picks up
+        whatever arrived in between.
+        """
+        with self._lock:
+            self.sampling = self._new_sampling("grab (following upload)")
+        try:
+            while self.is_processing:
+                still_growing = growing()
+                yield from self._sequential_frames(cap, frame_skip, grab=True)
+                if not still_growing or not self.is_processing:
+                    break
+                time.sleep(UPLOAD_FOLLOW_INTERVAL)
+                cap.release()
+                cap = cv2.VideoCapture(video_path)
+                with self._lock:
+                    position = self.frame_count
+                cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+                with self._lock:
+                    self.frame_count = max(0, min(position, int(cap.get(cv2.CAP_PROP_POS_FRAMES))))
+        finally:
+            cap.release()
+    
+    def _sampling_summary(self):
+        """Summarize frame sampling cost (caller must hold the lock)
+        
+        Decode time saved is estimated as the average cost of a full
+        decode+retrieve times the number of frames skipped, minus the time
+        actually spent seeking/grabbing past them.
+        """
+        decoded = self.sampling["frames_decoded"]
+        skipped = self.sampling["frames_skipped"]
+        per_frame = self.sampling["decode_seconds"] / decoded if decoded else 0.0
+        saved = max(0.0, per_frame * skipped - self.sampling["skip_seconds"])
+        return {
+            "mode": self.sampling["mode"],
+            "frames_decoded": decoded,
+            "frames_skipped": skipped,
+            "decode_seconds": round(self.sampling["decode_seconds"], 3),
+            "skip_seconds": round(self.sampling["skip_seconds"], 3),
+            "decode_time_saved_seconds": round(saved, 3),
+        }
+    
+    def _run_pipeline(self, frames, clock=None):
+        """Run the decode → analyze → sink pipeline over a frame source
+        
+        A decoder thread pulls sampled frames from ``frames`` and pushes them
+        onto a bounded queue, so at most ``queue_size`` frames are waiting on
+        the model at once. The model calls run concurrently on the shared
+        ``ai_engine`` (bounded by its concurrency limit and token bucket), and
+        this thread drains the queue in order so that
+        ``_update_shared_data`` and ``_log_analysis`` still see frames in
+        sequence.
+        
+        Frames that the motion gate considers unchanged are dropped in the
+        decoder stage and never reach the model.
+        
+        Args:
+            frames: Iterable of (frame_number, frame) tuples
+            clock: Optional callable mapping a frame number to seconds, used
+                for motion-gate staleness (defaults to wall-clock time)
+        """
+        pending = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        decoder_error = []
+        
+        def put(item):
+            # Block while the queue is full, but give up if the sink has stopped
+            while not stop.is_set():
+                try:
+                    pending.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def decode():
+            batch = []    # Frames waiting to be sent as one batched request
+            staged = []   # Pipeline items held back until their batch is sent
+            batch_started = 0.0
+            
+            def flush():
+                self._submit_batch(batch)
+                while staged:
+                    frame_num, jpeg, future = staged.pop(0)
+                    if not put((frame_num, jpeg, future)):
+                        future.cancel()
+                        for _, _, rest in staged:
+                            rest.cancel()
+                        staged.clear()
+                        return False
+                return True
+            
+            try:
+                for frame_num, frame in frames:
+                    # Don't let a partial batch wait forever on a slow source
+                    if batch and time.time() - batch_started >= ANALYSIS_BATCH_MAX_WAIT:
+                        if not flush():
+                            return
+                    
+                    # Skip frames where nothing has moved
+                    if self.motion_gate is not None:
+                        timestamp = clock(frame_num) if clock else time.time()
+                        if not self.motion_gate.check(frame, timestamp):
+                            continue
+                    
+                    # Resize frame for faster processing and encode it once:
+                    # the same JPEG goes to the model and to /video/current-frame
+                    resized = cv2.resize(frame, (640, 480))
+                    jpeg = encode_jpeg(resized)
+                    if not batch:
+                        batch_started = time.time()
+                    future = self._submit_analysis(resized, jpeg, frame_num, batch)
+                    with self._lock:
+                        self.stats["frames_sampled"] += 1
+                    staged.append((frame_num, jpeg, future))
+                    
+                    # Results must reach the sink in order, so anything staged
+                    # behind an open batch waits until the batch is submitted
+                    if (not batch or len(batch) >= self.batch_size) and not flush():
+                        return
+                
+                flush()
+            except Exception as e:
+                decoder_error.append(e)
+            finally:
+                put(None)
+        
+        with self._lock:
+            self.stats = self._new_stats()
+            self.stats["started_at"] = time.time()
+        if self.dedup_cache is not None:
+            self.dedup_cache.clear()  # Only reuse analyses from this run
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+        
+        decoder = threading.Thread(target=decode, name="frame-decoder", daemon=True)
+        decoder.start()
+        
+        try:
+            while True:
+                item = pending.get()
+                if item is None:
+                    break
+                
+                frame_num, jpeg, future = item
+                if not self.is_processing:
+                    future.cancel()
+                    continue
+                
+                try:
+                    analysis = future.result()
+                except CancelledError:
+                    continue
+                
+                # Publish the frame (already encoded) for /video/current-frame
+                latest = latest_frame.publish(jpeg, frame_num, self.job_id)
+                event_bus.publish("frame", {
+                    "job_id": self.job_id,
+                    "frame": frame_num,
+                    "etag": latest["etag"],
+                    "timestamp": datetime.now().isoformat()
+                })
+                
+                # Update shared data with lock
+                with self._lock:
+                    self.latest_analysis = analysis
+                    self.stats["frames_analyzed"] += 1
+                
+                self._update_shared_data(analysis, frame_num)
+                self._log_analysis(analysis, frame_num)
+                self._store_analysis(analysis, frame_num)
+        finally:
+            stop.set()
+            decoder.join()
+            preview_stream.finish(self.job_id)
+            self._flush_analyses()
+            # Cancel analyses nobody will read (stopped or failed run)
+            while not pending.empty():
+                item = pending.get_nowait()
+                if item is not None:
+                    item[2].cancel()
+            with self._lock:
+                self.stats["finished_at"] = time.time()
+        
+        if decoder_error:
+            raise decoder_error[0]
+    
+    def _throughput(self):
+        """Summarize pipeline throughput (caller must hold the lock)"""
+        started = self.stats["started_at"]
+        elapsed = 0.0
+        if started is not None:
+            elapsed = (self.stats["finished_at"] or time.time()) - started
+        analyzed = self.stats["frames_analyzed"]
+        return {
+            "ai_engine": ai_engine.stats(),
+            "queue_size": self.queue_size,
+            "batch_size": self.batch_size,
+            "requests": self.stats["requests"],
+            "frames_sampled": self.stats["frames_sampled"],
+            "frames_analyzed": analyzed,
+            "elapsed_seconds": round(elapsed, 2),
+            "frames_per_second": round(self.frame_count / elapsed, 2) if elapsed else 0.0,
+            "analyses_per_minute": round(analyzed * 60 / elapsed, 2) if elapsed else 0.0,
+        }
+    
+    def process_video_file(self, video_path, frame_interval=None, start_frame=0, growing=None):
         """Process a video file frame by frame
         
         Args:
             video_path: Path to video file
             frame_interval: Seconds between frame analysis (default 3s from env or 3)
+            start_frame: Resume after this frame (already analyzed by an
+                interrupted run)
+            growing: Callable returning True while the file is still being
+                uploaded; analysis then follows the upload as it arrives
         """
         if frame_interval is None:
             frame_interval = int(os.getenv("FRAME_ANALYSIS_INTERVAL", 3))
@@ -121,53 +766,62 @@ class VideoProcessor:
         
         with self._lock:
             self.frame_count = 0
-            self.latest_analysis = "Starting video analysis..."
+            self.resume_frame = start_frame
+            self.latest_analysis = (
+                f"Resuming video analysis after frame {start_frame}..." if start_frame
+                else "Starting video analysis..."
+            )
+        self._publish_status()
         
         try:
             cap = cv2.VideoCapture(video_path)
+            # The container header may not have arrived yet
+            while not cap.isOpened() and growing is not None and growing() and self.is_processing:
+                time.sleep(UPLOAD_FOLLOW_INTERVAL)
+                cap = cv2.VideoCapture(video_path)
             if not cap.isOpened():
                 self.current_status = "error"
                 with self._lock:
                     self.latest_analysis = "Error: Could not open video file"
                 return
             
+            following = growing is not None and growing()
+            with self._lock:
+                # A partial file's frame count is unknown until it is complete
+                self.total_frames = None if following else int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or None
+            if start_frame:
+                # Continue from the interrupted run (or the nearest keyframe before it)
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+                with self._lock:
+                    self.frame_count = max(0, min(start_frame, int(cap.get(cv2.CAP_PROP_POS_FRAMES))))
+            
             fps = cap.get(cv2.CAP_PROP_FPS)
             # Calculate frames to skip: if 30fps and want analysis every 3 seconds, skip 90 frames
             frame_skip = max(1, int(fps * frame_interval))
             
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if following:
+                frames = self._follow_frames(video_path, cap, frame_skip, growing)
+            else:
+                frames = self._read_frames(cap, frame_skip)
+            try:
+                self._run_pipeline(
+                    frames,
+                    clock=lambda frame_num: frame_num / (fps or 30)  # Video position
+                )
+            finally:
+                cap.release()
             
-            while cap.isOpened() and self.is_processing:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                with self._lock:
-                    self.frame_count += 1
-                    current_frame = self.frame_count
-                
-                # Process every nth frame
-                if current_frame % frame_skip == 0:
-                    # Resize frame for faster processing
-                    resized = cv2.resize(frame, (640, 480))
-                    analysis = self.analyze_frame(resized)
-                    
-                    # Save frame
-                    cv2.imwrite("current_frame.jpg", frame)
-                    
-                    # Update shared data with lock
-                    with self._lock:
-                        self.latest_analysis = analysis
-                    
-                    self._update_shared_data(analysis)
-                    self._log_analysis(analysis)
-                    
-                    time.sleep(2)  # Rate limiting
-            
-            cap.release()
-            self.current_status = "completed"
+            if self.current_status != "stopped":
+                self.current_status = "completed"
             with self._lock:
-                self.latest_analysis = f"Video analysis completed. Processed {self.frame_count} frames."
+                throughput = self._throughput()
+                sampling = self._sampling_summary()
+                self.latest_analysis = (
+                    f"Video analysis completed. Processed {self.frame_count} frames "
+                    f"({throughput['frames_analyzed']} analyzed, "
+                    f"{throughput['frames_per_second']} fps, "
+                    f"{sampling['decode_time_saved_seconds']}s decode time saved)."
+                )
             
         except Exception as e:
             self.current_status = "error"
@@ -175,59 +829,50 @@ class VideoProcessor:
                 self.latest_analysis = f"Error: {str(e)[:100]}"
         finally:
             self.is_processing = False
+            self._publish_status()  # Carries the completion summary
+            self._write_shared_snapshot()
     
-    def process_webcam(self, duration_seconds=60):
-        """Process webcam stream for specified duration"""
+    def process_webcam(self, duration_seconds=60, camera=0):
+        """Process webcam stream for specified duration
+        
+        Args:
+            duration_seconds: How long to analyze the stream
+            camera: Device index or stream URL (e.g. rtsp://...) for cv2.VideoCapture
+        """
         self.is_processing = True
         self.current_status = "processing"
         
         with self._lock:
             self.frame_count = 0
             self.latest_analysis = "Starting webcam analysis..."
+        self._publish_status()
         
         try:
-            cap = cv2.VideoCapture(0)
+            cap = cv2.VideoCapture(camera)
             if not cap.isOpened():
                 self.current_status = "error"
                 with self._lock:
                     self.latest_analysis = "Error: Could not access webcam"
                 return
             
-            start_time = time.time()
+            deadline = time.time() + duration_seconds
             frame_interval = int(os.getenv("FRAME_ANALYSIS_INTERVAL", 3))
             fps = cap.get(cv2.CAP_PROP_FPS) or 30
             frame_skip = max(1, int(fps * frame_interval))
             
-            while self.is_processing and (time.time() - start_time) < duration_seconds:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                with self._lock:
-                    self.frame_count += 1
-                    current_frame = self.frame_count
-                
-                if current_frame % frame_skip == 0:
-                    # Resize frame
-                    resized = cv2.resize(frame, (640, 480))
-                    analysis = self.analyze_frame(resized)
-                    
-                    # Save frame
-                    cv2.imwrite("current_frame.jpg", frame)
-                    
-                    # Update shared data with lock
-                    with self._lock:
-                        self.latest_analysis = analysis
-                    
-                    self._update_shared_data(analysis)
-                    self._log_analysis(analysis)
-                    
-                    time.sleep(2)  # Rate limiting
+            try:
+                self._run_pipeline(self._read_frames(cap, frame_skip, deadline=deadline))
+            finally:
+                cap.release()
             
-            cap.release()
-            self.current_status = "completed"
+            if self.current_status != "stopped":
+                self.current_status = "completed"
             with self._lock:
-                self.latest_analysis = f"Webcam analysis completed. Processed {self.frame_count} frames."
+                throughput = self._throughput()
+                self.latest_analysis = (
+                    f"Webcam analysis completed. Processed {self.frame_count} frames "
+                    f"({throughput['frames_analyzed']} analyzed)."
+                )
             
         except Exception as e:
             self.current_status = "error"
@@ -235,64 +880,171 @@ class VideoProcessor:
                 self.latest_analysis = f"Error: {str(e)[:100]}"
         finally:
             self.is_processing = False
+            self._publish_status()  # Carries the completion summary
+            self._write_shared_snapshot()
     
-    def _update_shared_data(self, analysis):
-        """Update shared data file"""
+    def _update_shared_data(self, analysis, frame_num=None):
+        """Publish the latest analysis and periodically snapshot it to disk
+        
+        Subscribers (SSE clients, /analysis/status, chat) get every update
+        from the event bus. The JSON file and current frame JPEG are only
+        rewritten every SHARED_DATA_WRITE_INTERVAL seconds for readers in
+        other processes.
+        """
         data = {
+            "job_id": self.job_id,
             "timestamp": datetime.now().isoformat(),
             "analysis": analysis,
-            "frame_count": self.frame_count,
+            "frame_count": self.frame_count if frame_num is None else frame_num,
             "status": "running" if self.is_processing else self.current_status
         }
+        event_bus.publish("analysis", data)
+        self._last_shared_data = data
+        
+        now = time.time()
+        if now - self._last_shared_write >= SHARED_DATA_WRITE_INTERVAL:
+            self._write_shared_snapshot()
+    
+    def _write_shared_snapshot(self):
+        """Write the last published analysis and current frame to disk
+        
+        Called on the throttled interval and once when a job ends, so the
+        snapshot always holds the last real cow analysis (the completion
+        summary only goes out as a status event).
+        """
+        data = self._last_shared_data
+        if data is None:
+            return
+        self._last_shared_write = time.time()
+        data = dict(data, status="running" if self.is_processing else self.current_status)
+        
         try:
-            with open(SHARED_DATA_FILE, 'w') as f:
-                json.dump(data, f, indent=2)
+            tmp_path = f"{SHARED_DATA_FILE}.{self.job_id or 'tmp'}"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, SHARED_DATA_FILE)
+            
+            frame = latest_frame.get(self.job_id)
+            if frame is not None:
+                tmp_path = f"{CURRENT_FRAME_FILE}.{self.job_id or 'tmp'}"
+                with open(tmp_path, 'wb') as f:
+                    f.write(frame["jpeg"])
+                os.replace(tmp_path, CURRENT_FRAME_FILE)
         except Exception as e:
             print(f"Error updating shared data: {e}")
     
-    def _log_analysis(self, analysis):
+    def _publish_status(self):
+        """Publish a status change for SSE clients"""
+        try:
+            status = self.get_status()
+            event_bus.publish("status", {
+                "job_id": status["job_id"],
+                "is_processing": status["is_processing"],
+                "status": status["status"],
+                "frame_count": status["frame_count"],
+                "latest_analysis": status["latest_analysis"],
+                "timestamp": status["timestamp"]
+            })
+        except Exception as e:
+            print(f"Error publishing status: {e}")
+    
+    def _log_analysis(self, analysis, frame_num=None):
         """Log analysis to file using rotating handler"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         try:
-            with self._lock:
-                frame_num = self.frame_count
-            message = f"{timestamp} - FRAME {frame_num}: {analysis}"
+            if frame_num is None:
+                with self._lock:
+                    frame_num = self.frame_count
+            # Concurrent jobs share the log: label each entry with its job
+            job = f"JOB {self.job_id} - " if self.job_id else ""
+            message = f"{timestamp} - {job}FRAME {frame_num}: {analysis}"
             self.analysis_logger.info(message)
         except Exception as e:
             print(f"Error logging analysis: {e}")
     
+    def _store_analysis(self, analysis, frame_num):
+        """Buffer an analysis for the database, flushing full or stale batches"""
+        self._db_buffer.append({
+            "job_id": self.job_id,
+            "frame": frame_num,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "analysis": analysis
+        })
+        if (len(self._db_buffer) >= ANALYSIS_DB_BATCH_SIZE
+                or time.time() - self._last_db_flush >= ANALYSIS_DB_FLUSH_INTERVAL):
+            self._flush_analyses()
+    
+    def _flush_analyses(self):
+        """Write buffered analyses and their cow observations in one transaction"""
+        records, self._db_buffer = self._db_buffer, []
+        self._last_db_flush = time.time()
+        if not records:
+            return
+        last_frame = max(r["frame"] for r in records)
+        
+        def committed():
+            # Only frames whose analyses are in the database are safe to resume after
+            with self._lock:
+                self.resume_frame = max(self.resume_frame, last_frame)
+        
+        try:
+            save_analyses(records, on_commit=committed)
+        except Exception as e:
+            print(f"Error saving analyses: {e}")
+    
     def get_status(self):
         """Get current processing status (thread-safe)"""
         with self._lock:
             return {
+                "job_id": self.job_id,
+                "source": self.source,
+                "created_at": self.created_at,
                 "is_processing": self.is_processing,
                 "status": self.current_status,
                 "frame_count": self.frame_count,
+                "total_frames": self.total_frames,
+                "progress": round(min(1.0, self.frame_count / self.total_frames), 4)
+                            if self.total_frames else None,
+                "resume_frame": self.resume_frame,
                 "latest_analysis": self.latest_analysis,
+                "throughput": self._throughput(),
+                "sampling": self._sampling_summary(),
+                "motion": self._motion_summary(),
+                "dedup": self._dedup_summary(),
                 "timestamp": datetime.now().isoformat()
             }
     
-    def start_video_processing(self, video_path):
-        """Start video processing in a background thread"""
+    def start_video_processing(self, video_path, growing=None):
+        """Start video processing in a background thread
+        
+        Args:
+            video_path: Path to video file
+            growing: See process_video_file
+        """
         if self.is_processing:
             return False
         
+        self.is_processing = True
+        self.source = {"type": "file", "path": video_path}
         self.processing_thread = threading.Thread(
             target=self.process_video_file,
             args=(video_path,),  # Use default frame_interval from env
+            kwargs={"growing": growing},
             daemon=True
         )
         self.processing_thread.start()
         return True
     
-    def start_webcam_processing(self, duration=60):
+    def start_webcam_processing(self, duration=60, camera=0):
         """Start webcam processing in a background thread"""
         if self.is_processing:
             return False
         
+        self.is_processing = True
+        self.source = {"type": "webcam", "camera": camera, "duration": duration}
         self.processing_thread = threading.Thread(
             target=self.process_webcam,
-            args=(duration,),
+            args=(duration, camera),
             daemon=True
         )
         self.processing_thread.start()
@@ -302,17 +1054,8 @@ class VideoProcessor:
         """Stop ongoing video processing"""
         self.is_processing = False
         self.current_status = "stopped"
+        self._publish_status()
         return True
-    
-    def get_status(self):
-        """Get current processing status"""
-        return {
-            "is_processing": self.is_processing,
-            "status": self.current_status,
-            "frame_count": self.frame_count,
-            "latest_analysis": self.latest_analysis,
-            "timestamp": datetime.now().isoformat()
-        }
 
 
 # Global processor instance
@@ -333,6 +1076,8 @@ def run_standalone_analysis():
     print("📹 Powered by Azure OpenAI (GPT-4.1)")
     print("=" * 70)
     
+    init_db()  # Analyses are stored in SQLite even without the Flask app
+    
     # Ask user for video source
     print("\nChoose video source:")
     print("  1. Video file (cow.mp4)")
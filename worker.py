@@ -0,0 +1,28 @@
+"""
+Video worker process for HerdWatch
+Runs the analysis jobs that web workers queue in the video_jobs table when
+VIDEO_WORKER_MODE=external, keeping decoding and encoding out of the API
+processes. Each job runs in its own process (up to VIDEO_WORKER_PROCESSES
+at once); jobs whose process crashes, or whose worker dies, are retried and
+resume where their stored analyses end. Status, events and frames are
+published through the shared database.
+
+Usage:
+    python worker.py
+"""
+
+from db import init_db
+from job_manager import JobPool
+
+
+def run_worker():
+    """Claim and run queued jobs until interrupted"""
+    init_db()
+    JobPool().run()
+
+
+if __name__ == "__main__":
+    try:
+        run_worker()
+    except KeyboardInterrupt:
+        print("\n👋 Stopping video worker (unfinished jobs will resume)...")
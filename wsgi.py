@@ -0,0 +1,15 @@
+"""
+WSGI entry point for production serving
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With more than one web worker, also set VIDEO_WORKER_MODE=external and
+RATELIMIT_STORAGE_URI=sqlite:// and run the video worker alongside:
+
+    python worker.py
+"""
+
+from app import app, start_background_services
+
+# Runs in every web worker (gunicorn.conf.py doesn't preload the app)
+start_background_services()